@@ -1,15 +1,28 @@
-from flask import Flask, send_from_directory
+from flask import Flask, Response
 from flask_restx import Api, Resource
 from flask_cors import CORS
+from werkzeug.exceptions import NotFound
 import os
 import logging
 from config import Config
+from utils.uploads import UploadRequest
+from utils.downloads import send_download
+from services.storage import get_storage, hash_from_key, is_download_key
 
-def create_app():
-    """创建并配置Flask应用"""
+def create_app(start_background: bool = True):
+    """
+    创建并配置Flask应用
+    
+    Args:
+        start_background (bool): 是否在当前进程启动后台线程（异步任务worker、上传目录清理）；
+            由gunicorn预加载时为False，线程在fork出的worker进程中启动（见gunicorn.conf.py）
+    """
     app = Flask(__name__)
     app.config.from_object(Config)
     
+    # 上传文件流式接收：超过阈值落盘，超过大小上限立即中止
+    app.request_class = UploadRequest
+    
     # 初始化配置
     Config.init_app(app)
     
@@ -31,6 +44,18 @@ def create_app():
         ]
     )
     
+    # 请求耗时、进行中请求数等监控指标
+    from services import metrics
+    metrics.init_app(app)
+    
+    # 按阶段记录请求耗时（Server-Timing响应头、OpenTelemetry导出）
+    from services import tracing
+    tracing.init_app(app)
+    
+    # 初始化Azure OpenAI共享连接池（注册退出时的关闭钩子）
+    from services import openai_client_pool
+    openai_client_pool.init_app(app)
+    
     # 初始化Flask-RESTX API
     api = Api(
         app, 
@@ -50,16 +75,28 @@ def create_app():
         }
     )
     
+    # 启动异步任务worker线程池
+    from services import job_queue
+    job_queue.init_app(app, start_workers=start_background)
+    
+    # 启动上传目录后台清理线程
+    from services import janitor
+    janitor.init_app(app, start=start_background)
+    
     # 注册命名空间
     from routes.api_routes import text_analysis_ns, auth_ns
     api.add_namespace(text_analysis_ns, path='/analyze')
     api.add_namespace(auth_ns, path='/auth')
     
     # 静态文件路由
-    @app.route('/downloads/<filename>')
-    def download_file(filename):
-        """下载生成的文件"""
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+    @app.route('/downloads/<path:key>')
+    def download_file(key):
+        """下载生成的文件（强ETag、Range请求，可交由nginx通过X-Accel-Redirect或对象存储直接发送）"""
+        if not is_download_key(key):
+            raise NotFound()
+        response = send_download(get_storage(), key, etag=hash_from_key(key))
+        janitor.touch_file(key)
+        return response
     
     # 健康检查路由
     @app.route('/health')
@@ -71,6 +108,12 @@ def create_app():
             'version': '1.0'
         }
     
+    # 监控指标（Prometheus文本格式）
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """导出监控指标（多进程部署时汇总所有worker）"""
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+    
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,45 @@
+"""
+生产环境ASGI入口（可选，替代 wsgi.py）
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 2
+
+文本分析、图片OCR和连接测试接口（routes/async_routes.py）直接在事件循环中运行，
+等待Azure OpenAI时不占用线程，单个进程可以同时处理数百个进行中的分析请求；
+其余接口交给Flask应用，在 ASGI_WSGI_THREADS 个线程中执行。
+
+uvicorn的多worker模式通过spawn启动子进程，每个worker独立加载应用，
+后台线程（异步任务worker、上传目录清理）在worker进程启动时（lifespan）开启
+"""
+import contextlib
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from app import create_app
+from config import Config
+from routes.async_routes import routes as async_routes
+
+flask_app = create_app(start_background=False)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """worker进程启动时开启后台线程，退出时停止后台线程并关闭连接池"""
+    from services.lifecycle import start_background_services, stop_background_services
+    from services.openai_client_pool import close_all_async_clients
+
+    start_background_services(flask_app)
+    try:
+        yield
+    finally:
+        stop_background_services()
+        await close_all_async_clients()
+
+
+application = Starlette(
+    routes=[
+        *async_routes,
+        Mount('/', app=WSGIMiddleware(flask_app, workers=Config.ASGI_WSGI_THREADS)),
+    ],
+    lifespan=lifespan
+)
+app = application
@@ -0,0 +1,97 @@
+"""
+require_auth认证开销微基准
+
+用法:
+    python benchmarks/bench_auth.py [--iterations N] [--tokens N] [--min-speedup N]
+
+在同一请求上下文中反复调用被 require_auth 装饰的空视图函数，
+对比原实现（每次请求创建AuthService并完整验证JWT签名）与当前实现（共享验证器 + 已验证token缓存）
+每次请求的认证开销；--tokens 指定轮流使用的不同token数量（模拟多个用户）；
+指定 --min-speedup 时加速比低于该值则以非零状态退出
+"""
+import argparse
+import os
+import sys
+import time
+from functools import wraps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+from flask import Flask, request
+from services.auth_service import AuthService, require_auth, get_token_verifier
+
+
+def legacy_require_auth(f):
+    """原实现：每次请求创建AuthService并调用jwt.decode"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return {'success': False}, 401
+        token = auth_header.split(' ')[1]
+        auth_service = AuthService()
+        try:
+            payload = jwt.decode(token, auth_service.secret_key, algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            return {'success': False}, 401
+        request.current_user = payload
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def view():
+    return request.current_user['username']
+
+
+def bench(label, fn, contexts, iterations):
+    """执行基准并打印每次请求的认证开销"""
+    for ctx in contexts:
+        with ctx:
+            fn()  # 预热（填充token缓存）
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        with contexts[i % len(contexts)]:
+            fn()
+    elapsed = time.perf_counter() - start
+
+    # 扣除请求上下文进出本身的开销
+    start = time.perf_counter()
+    for i in range(iterations):
+        with contexts[i % len(contexts)]:
+            pass
+    baseline = time.perf_counter() - start
+
+    per_request = max(elapsed - baseline, 0) / iterations * 1e6
+    print(f"{label:<28} {iterations} requests in {elapsed:.3f}s  {per_request:.2f} us/request auth overhead")
+    return per_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description='require_auth认证开销微基准')
+    parser.add_argument('--iterations', type=int, default=50000, help='请求次数')
+    parser.add_argument('--tokens', type=int, default=16, help='轮流使用的token数量')
+    parser.add_argument('--min-speedup', type=float, default=0, help='当前实现的最低加速比')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    auth_service = AuthService()
+    contexts = [
+        app.test_request_context(headers={'Authorization': f'Bearer {auth_service.generate_token(f"user{i}")}'})
+        for i in range(args.tokens)
+    ]
+
+    legacy = bench('legacy (decode every time)', legacy_require_auth(view), contexts, args.iterations)
+    current = bench('current (cached verifier)', require_auth(view), contexts, args.iterations)
+    print(f"token cache: {get_token_verifier().stats()}")
+
+    speedup = legacy / current if current else float('inf')
+    print(f"speedup: {speedup:.1f}x")
+    if args.min_speedup and speedup < args.min_speedup:
+        print(f"FAILED: speedup below {args.min_speedup:.1f}x")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
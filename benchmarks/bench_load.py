@@ -0,0 +1,438 @@
+"""
+后端负载测试（使用本地模拟的Azure OpenAI服务）
+
+用法:
+    python benchmarks/bench_load.py [--server gunicorn|uvicorn] [--workers N]
+                                    [--scenarios login,text,ocr] [--concurrency 1,8,32] [--requests N]
+                                    [--latency S] [--rate-429 P] [--output FILE]
+                                    [--baseline FILE] [--max-regression R]
+
+启动 benchmarks/mock_azure.py 和后端服务（环境变量指向模拟服务，关闭分析/OCR缓存），
+对每个场景（login: POST /api/auth/login，text: POST /api/analyze/text，ocr: POST /api/analyze/ocr，
+stream: POST /api/analyze/text/stream）按每个并发数发送固定数量的请求（每个请求的文本/图片都不同），
+统计吞吐量、p50/p95/p99延迟、错误数和后端进程（含worker）的内存占用，结果保存为JSON。
+
+指定 --baseline 时与之前保存的结果比较，任一场景的吞吐量下降或p95延迟上升超过 --max-regression 则以非零状态退出；
+只有同一台机器、相同参数的结果之间才有可比性
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+
+from benchmarks.mock_azure import OCR_TEXT, add_arguments as add_mock_arguments
+from config import Config
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+SCENARIOS = ('login', 'text', 'ocr', 'stream')
+DEFAULT_OUTPUT_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# 没有Pillow时使用的1x1 PNG（末尾追加序号使每个请求的图片不同）
+_TINY_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_ready(url: str, process: subprocess.Popen, log_path: str, timeout: float = 60):
+    """等待服务可以响应请求"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+        sys.stderr.write(f.read()[-4000:])
+    raise RuntimeError(f"服务未能启动: {url}（日志: {log_path}）")
+
+
+def _stop(process: Optional[subprocess.Popen]):
+    if process is None or process.poll() is not None:
+        return
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _process_tree_rss(pid: int) -> Optional[int]:
+    """进程及其所有子进程的RSS总和（字节，只支持Linux的/proc）"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return total
+
+
+class MemorySampler:
+    """在后台线程中定期采样后端进程树的内存占用"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.last = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.pid is not None:
+            self._sample()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._sample()
+        return False
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = _process_tree_rss(self.pid)
+        if rss:
+            self.last = rss
+            self.peak = max(self.peak, rss)
+
+    def result(self) -> Optional[Dict[str, float]]:
+        if not self.peak:
+            return None
+        return {'peak_rss_mb': round(self.peak / 2 ** 20, 1), 'end_rss_mb': round(self.last / 2 ** 20, 1)}
+
+
+def make_text(index: int) -> str:
+    """第index个请求的文章（各不相同，避免请求合并）"""
+    return OCR_TEXT.replace('Albion', f'Albion {index}')
+
+
+def make_image(index: int) -> bytes:
+    """第index个请求的图片（各不相同，避免请求合并和OCR缓存命中）"""
+    if Image is None:
+        return _TINY_PNG + index.to_bytes(4, 'big')
+    image = Image.new('RGB', (800, 600), 'white')
+    draw = ImageDraw.Draw(image)
+    for line, text in enumerate(OCR_TEXT.splitlines()[:12]):
+        draw.text((20, 20 + line * 40), text[:90], fill='black')
+    draw.text((20, 560), f'page {index}', fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class LoadClient:
+    """按场景构造并发送请求"""
+
+    def __init__(self, client: httpx.AsyncClient, base_url: str, token: str):
+        self.client = client
+        self.base_url = base_url
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    async def send(self, scenario: str, index: int) -> int:
+        if scenario == 'login':
+            response = await self.client.post(f'{self.base_url}/api/auth/login', json={
+                'username': Config.LOGIN_USERNAME, 'password': Config.LOGIN_PASSWORD
+            })
+        elif scenario == 'text':
+            response = await self.client.post(f'{self.base_url}/api/analyze/text',
+                                              json={'text': make_text(index)}, headers=self.headers)
+        elif scenario == 'ocr':
+            response = await self.client.post(f'{self.base_url}/api/analyze/ocr',
+                                              files={'image': (f'page{index}.png', make_image(index), 'image/png')},
+                                              headers=self.headers)
+        elif scenario == 'stream':
+            async with self.client.stream('POST', f'{self.base_url}/api/analyze/text/stream',
+                                          json={'text': make_text(index)}, headers=self.headers) as response:
+                async for _ in response.aiter_bytes():
+                    pass
+            return response.status_code
+        else:
+            raise ValueError(f'未知场景: {scenario}')
+        return response.status_code
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+async def run_level(load: LoadClient, scenario: str, concurrency: int, requests: int,
+                    offset: int) -> Dict[str, Any]:
+    """以固定并发数发送requests个请求"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_index = iter(range(offset, offset + requests))
+
+    async def worker():
+        for index in next_index:
+            start = time.perf_counter()
+            try:
+                status = str(await load.send(scenario, index))
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ok = statuses.get('200', 0)
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': requests,
+        'ok': ok,
+        'errors': {status: count for status, count in statuses.items() if status != '200'},
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(ok / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50) * 1000, 1),
+            'p95': round(percentile(latencies, 95) * 1000, 1),
+            'p99': round(percentile(latencies, 99) * 1000, 1),
+            'max': round(max(latencies, default=0) * 1000, 1),
+        }
+    }
+
+
+async def run_benchmark(base_url: str, server_pid: Optional[int], scenarios: List[str],
+                        levels: List[int], requests: int, warmup: int) -> List[Dict[str, Any]]:
+    """依次运行每个场景的每个并发等级"""
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        response = await client.post(f'{base_url}/api/auth/login', json={
+            'username': Config.LOGIN_USERNAME, 'password': Config.LOGIN_PASSWORD
+        })
+        response.raise_for_status()
+        load = LoadClient(client, base_url, response.json()['token'])
+
+        results = []
+        offset = 0
+        for scenario in scenarios:
+            # 预热：建立连接、创建各worker的Azure客户端
+            if warmup:
+                await run_level(load, scenario, min(warmup, max(levels)), warmup, offset)
+                offset += warmup
+            for concurrency in levels:
+                with MemorySampler(server_pid) as sampler:
+                    result = await run_level(load, scenario, concurrency, requests, offset)
+                offset += requests
+                result['memory'] = sampler.result()
+                results.append(result)
+                _print_result(result)
+    return results
+
+
+def _print_result(result: Dict[str, Any]):
+    latency = result['latency_ms']
+    memory = result['memory']
+    errors = f"  errors {result['errors']}" if result['errors'] else ''
+    rss = f"  peak RSS {memory['peak_rss_mb']:.0f} MB" if memory else ''
+    print(f"{result['scenario']:<7} c={result['concurrency']:<4} {result['ok']}/{result['requests']} ok "
+          f"in {result['duration_s']:.2f}s  {result['throughput_rps']:8.1f} req/s  "
+          f"p50 {latency['p50']:.0f}ms  p95 {latency['p95']:.0f}ms  p99 {latency['p99']:.0f}ms{rss}{errors}",
+          flush=True)
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """
+    与基线结果比较
+
+    Returns:
+        List[str]: 吞吐量下降或p95延迟上升超过阈值的场景说明
+    """
+    previous = {(item['scenario'], item['concurrency']): item for item in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result['scenario'], result['concurrency']))
+        if before is None:
+            continue
+        label = f"{result['scenario']} c={result['concurrency']}"
+        if before['throughput_rps'] and \
+                result['throughput_rps'] < before['throughput_rps'] * (1 - max_regression):
+            regressions.append(f"{label}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+        if before['latency_ms']['p95'] and \
+                result['latency_ms']['p95'] > before['latency_ms']['p95'] * (1 + max_regression):
+            regressions.append(f"{label}: p95 {before['latency_ms']['p95']} -> {result['latency_ms']['p95']} ms")
+        if result['errors'] and not before['errors']:
+            regressions.append(f"{label}: errors {result['errors']}")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _server_command(server: str, port: int, workers: int) -> List[str]:
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(workers), '--log-level', 'warning']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='后端负载测试（本地模拟Azure OpenAI）')
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'), default='gunicorn', help='后端入口')
+    parser.add_argument('--workers', type=int, default=2, help='后端worker进程数')
+    parser.add_argument('--url', help='测试已启动的后端（需自行将其Azure端点指向mock_azure.py），不启动服务')
+    parser.add_argument('--scenarios', default='login,text,ocr', help=f"逗号分隔，可选 {','.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', default='1,8,32', help='逗号分隔的并发数')
+    parser.add_argument('--requests', type=int, default=100, help='每个场景、每个并发数的请求数')
+    parser.add_argument('--warmup', type=int, default=4, help='每个场景开始前的预热请求数')
+    add_mock_arguments(parser)
+    parser.add_argument('--output', help='结果JSON文件路径，默认 benchmarks/results/load-<时间>-<提交>.json')
+    parser.add_argument('--baseline', help='用于比较的结果JSON文件')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='允许的吞吐量下降/p95上升比例')
+    args = parser.parse_args()
+
+    scenarios = [item.strip() for item in args.scenarios.split(',') if item.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+    levels = [int(item) for item in args.concurrency.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='bench-load-')
+    mock = server = None
+    try:
+        if args.url:
+            base_url, server_pid = args.url.rstrip('/'), None
+        else:
+            mock_port, server_port = _free_port(), _free_port()
+            mock_log = os.path.join(workdir, 'mock.log')
+            mock_args = [sys.executable, os.path.join(ROOT, 'benchmarks', 'mock_azure.py'), '--port', str(mock_port),
+                         '--latency', str(args.latency), '--jitter', str(args.jitter), '--ttft', str(args.ttft),
+                         '--chunks', str(args.chunks), '--rate-429', str(args.rate_429),
+                         '--retry-after-ms', str(args.retry_after_ms), '--seed', str(args.seed)]
+            if args.vision_latency is not None:
+                mock_args += ['--vision-latency', str(args.vision_latency)]
+            with open(mock_log, 'w') as log:
+                mock = subprocess.Popen(mock_args, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+            _wait_until_ready(f'http://127.0.0.1:{mock_port}/stats', mock, mock_log)
+
+            env = {
+                **os.environ,
+                'AZURE_OPENAI_ENDPOINT': f'http://127.0.0.1:{mock_port}/',
+                'AZURE_OPENAI_API_KEY': 'bench',
+                'AZURE_OPENAI_DEPLOYMENTS': '',
+                'AZURE_RPM_LIMIT': '0',
+                'AZURE_TPM_LIMIT': '0',
+                'ANALYSIS_CACHE_ENABLED': 'False',
+                'OCR_CACHE_ENABLED': 'False',
+                'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+                'DATA_FOLDER': os.path.join(workdir, 'data'),
+                'METRICS_MULTIPROC_DIR': os.path.join(workdir, 'metrics'),
+                'TRACING_SAMPLE_RATE': '0',
+                'TRACING_EXPORTER': '',
+                'GUNICORN_BIND': f'127.0.0.1:{server_port}',
+                'GUNICORN_WORKERS': str(args.workers),
+            }
+            server_log = os.path.join(workdir, 'server.log')
+            with open(server_log, 'w') as log:
+                server = subprocess.Popen(_server_command(args.server, server_port, args.workers), cwd=ROOT, env=env,
+                                          stdout=log, stderr=subprocess.STDOUT)
+            base_url, server_pid = f'http://127.0.0.1:{server_port}', server.pid
+            _wait_until_ready(f'{base_url}/health', server, server_log)
+
+        print(f"target {base_url} ({'external' if args.url else f'{args.server} x{args.workers}'}), "
+              f"mock latency {args.latency}s, 429 rate {args.rate_429}", flush=True)
+        results = asyncio.run(run_benchmark(base_url, server_pid, scenarios, levels, args.requests, args.warmup))
+
+        mock_stats = None
+        if mock is not None:
+            mock_stats = httpx.get(f'http://127.0.0.1:{mock_port}/stats', timeout=5).json()
+            print(f"mock azure: {mock_stats}")
+    finally:
+        _stop(server)
+        _stop(mock)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = _git_commit()
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+        },
+        'mock_azure': mock_stats,
+        'results': results,
+    }
+    output = args.output or os.path.join(
+        DEFAULT_OUTPUT_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print(f"FAILED: regressions beyond {args.max_regression:.0%} vs {args.baseline}")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"no regressions beyond {args.max_regression:.0%} vs {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+markdown思维导图解析微基准
+
+用法:
+    python benchmarks/bench_markdown_parse.py [--iterations N] [--chunk-size N] [--min-rate N]
+
+分别测量整段解析（parse_markdown_to_structure）和按块增量解析（MarkdownStructureParser）
+每秒可处理的分析结果数量；指定 --min-rate 时吞吐量低于该值则以非零状态退出。
+
+测量前先把内容清理（_clean_content）的结果与优化前的实现逐一比较（样本中的每一行和随机生成的行），
+结果不一致时以非零状态退出
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.xmind_service import XMindService, MarkdownStructureParser, _clean_content
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Article_Analysis_Sample.md')
+
+FALLBACK_SAMPLE = """# Article Analysis
+
+## Main Theme
+- The article proposes a **pedestrian-only zone** to revive downtown Albion.
+- 文章建议设立步行区以振兴阿尔比恩市中心。
+
+## Article Structure
+- Introduction-body-conclusion structure written as a *persuasive letter*.
+- 引言-主体-结论结构，以劝说信的形式写成。
+
+## Key Arguments
+1. Downtown has declined over fifty years.
+2. A pedestrian zone would bring people back - 步行区会吸引人们回来。
+
+## Important Details
+- Population grew from `32,000` to over 80,000.
+- 人口从32000增长到80000以上。
+
+## Language Features
+- Formal and persuasive tone - 正式且有说服力的语气。
+
+## Reading Comprehension Points
+- Identify the writer's purpose - 识别作者的写作目的。
+"""
+
+
+def baseline_clean_content(content: str) -> str:
+    """优化前的 _clean_content（逐一替换粗体、斜体、代码标记），作为比较的基准"""
+    if not content:
+        return ""
+    content = re.sub(r'\*\*(.*?)\*\*', r'\1', content)
+    content = re.sub(r'\*(.*?)\*', r'\1', content)
+    content = re.sub(r'`(.*?)`', r'\1', content)
+    content = re.sub(r'\s+', ' ', content).strip()
+    if len(content) > 120:
+        sentences = content.split('.')
+        if len(sentences) > 1:
+            result = sentences[0] + '.'
+            if len(result) < 80 and len(sentences) > 1:
+                result += sentences[1] + '.'
+            return result.strip()
+        else:
+            return content[:100] + '...'
+    return content
+
+
+def check_clean_content(samples, cases: int = 20000, seed: int = 42) -> int:
+    """
+    比较 _clean_content 与优化前实现的结果
+
+    Returns:
+        int: 结果不一致的行数
+    """
+    lines = [line for sample in samples for line in sample.splitlines()]
+    # 随机拼接包含各种成对/落单标记的行
+    tokens = ['*', '**', '***', '`', ' ', '  ', '\t', 'key', '5 * 3 = 15', 'a.b', '中文', '**bold**', '*it*', '`x`']
+    rng = random.Random(seed)
+    lines += [''.join(rng.choice(tokens) for _ in range(rng.randint(1, 12))) for _ in range(cases)]
+    lines += ['x' * 130, 'Sentence one. ' * 12]
+
+    mismatches = 0
+    for line in lines:
+        expected, actual = baseline_clean_content(line), _clean_content(line)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"MISMATCH {line!r}: expected {expected!r}, got {actual!r}")
+    print(f"_clean_content vs baseline: {len(lines)} lines, {mismatches} mismatches")
+    return mismatches
+
+
+def load_samples():
+    """加载测试样本，并生成若干变体避免只测量同一字符串"""
+    if os.path.exists(SAMPLE_FILE):
+        with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+            base = f.read()
+    else:
+        base = FALLBACK_SAMPLE
+    return [base.replace('Albion', f'City{i}') + f"\n- Variant {i}\n" for i in range(16)]
+
+
+def bench(label, fn, samples, iterations):
+    """执行基准并打印每秒处理的分析结果数量"""
+    for sample in samples:
+        fn(sample)  # 预热
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(samples[i % len(samples)])
+    elapsed = time.perf_counter() - start
+
+    rate = iterations / elapsed
+    print(f"{label:<28} {iterations} analyses in {elapsed:.3f}s  "
+          f"{rate:,.0f} analyses/s  {elapsed / iterations * 1e6:.1f} us/analysis")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='markdown思维导图解析微基准')
+    parser.add_argument('--iterations', type=int, default=5000, help='解析次数')
+    parser.add_argument('--chunk-size', type=int, default=16, help='增量解析时每次推入的字符数')
+    parser.add_argument('--min-rate', type=float, default=0, help='最低吞吐量要求（analyses/s）')
+    args = parser.parse_args()
+
+    samples = load_samples()
+    if check_clean_content(samples):
+        print("FAILED: _clean_content differs from the baseline implementation")
+        sys.exit(1)
+
+    service = XMindService()
+    chunk_size = args.chunk_size
+
+    def incremental(markdown_text):
+        p = MarkdownStructureParser()
+        for i in range(0, len(markdown_text), chunk_size):
+            p.feed(markdown_text[i:i + chunk_size])
+        p.close()
+        return p.structure
+
+    print(f"sample size: {len(samples[0])} chars, chunk size: {chunk_size}")
+    rates = [
+        bench('parse_markdown_to_structure', service.parse_markdown_to_structure, samples, args.iterations),
+        bench('incremental feed/close', incremental, samples, args.iterations)
+    ]
+
+    if args.min_rate and min(rates) < args.min_rate:
+        print(f"FAILED: throughput below {args.min_rate:,.0f} analyses/s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
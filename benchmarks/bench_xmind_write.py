@@ -0,0 +1,147 @@
+"""
+.xmind文件生成微基准
+
+用法:
+    python benchmarks/bench_xmind_write.py [--iterations N] [--min-speedup N]
+
+对比 xmind 库（xmind.load / xmind.save，原实现）与原生写入器（services/xmind_writer.py）
+生成同一思维导图的速度，并校验两者content.xml中的主题树（标题、备注、层级）一致；
+指定 --min-speedup 时原生写入器相对xmind库的加速比低于该值则以非零状态退出
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_markdown_parse import load_samples
+from services.xmind_service import XMindService
+from services.xmind_writer import write_xmind, xmind_bytes, DEFAULT_SHEET_TITLE
+
+try:
+    import xmind
+except ImportError:
+    xmind = None
+
+_NS = '{urn:xmind:xmap:xmlns:content:2.0}'
+
+ORIGINAL_TEXT = "Dear Editor, I am writing to propose a pedestrian-only zone in downtown Albion. " * 5
+
+
+def legacy_write(structure, path):
+    """原实现：通过xmind库构建DOM后保存"""
+    workbook = xmind.load(path)
+    sheet = workbook.getPrimarySheet()
+    sheet.setTitle(DEFAULT_SHEET_TITLE)
+    root_topic = sheet.getRootTopic()
+    root_topic.setTitle(structure.get('title', 'Article Analysis'))
+    preview = ORIGINAL_TEXT[:200] + "..." if len(ORIGINAL_TEXT) > 200 else ORIGINAL_TEXT
+    root_topic.setPlainNotes(f"Original Text Preview:\n{preview}")
+
+    def add(parent, children):
+        for child in children:
+            topic = parent.addSubTopic()
+            topic.setTitle(child.get('title', ''))
+            if child.get('children'):
+                add(topic, child['children'])
+
+    add(root_topic, structure.get('children', []))
+    xmind.save(workbook, path)
+
+
+def topic_tree(xmind_file):
+    """读取content.xml中的画布标题和主题树，用于比较两种实现的输出"""
+    with zipfile.ZipFile(xmind_file) as archive:
+        root = ElementTree.fromstring(archive.read('content.xml'))
+
+    def topic(element):
+        notes = element.find(f'{_NS}notes/{_NS}plain')
+        topics = element.find(f'{_NS}children/{_NS}topics')
+        return (
+            element.findtext(f'{_NS}title'),
+            notes.text if notes is not None else None,
+            [topic(child) for child in topics.findall(f'{_NS}topic')] if topics is not None else []
+        )
+
+    sheet = root.find(f'{_NS}sheet')
+    return sheet.findtext(f'{_NS}title'), topic(sheet.find(f'{_NS}topic'))
+
+
+def bench(label, fn, structures, iterations):
+    """执行基准并打印每秒生成的文件数量"""
+    for structure in structures:
+        fn(structure)  # 预热
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(structures[i % len(structures)])
+    elapsed = time.perf_counter() - start
+
+    rate = iterations / elapsed
+    print(f"{label:<28} {iterations} files in {elapsed:.3f}s  "
+          f"{rate:,.0f} files/s  {elapsed / iterations * 1e6:.1f} us/file")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='.xmind文件生成微基准')
+    parser.add_argument('--iterations', type=int, default=500, help='生成次数')
+    parser.add_argument('--min-speedup', type=float, default=0, help='原生写入器的最低加速比')
+    args = parser.parse_args()
+
+    service = XMindService()
+    structures = [service.parse_markdown_to_structure(sample) for sample in load_samples()]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        native_path = os.path.join(tmp_dir, 'native.xmind')
+        legacy_path = os.path.join(tmp_dir, 'legacy.xmind')
+
+        # 输出一致性校验
+        write_xmind(structures[0], native_path, ORIGINAL_TEXT)
+        if xmind is not None:
+            legacy_write(structures[0], legacy_path)
+            if topic_tree(native_path) != topic_tree(legacy_path):
+                print("FAILED: native writer output differs from xmind library output")
+                sys.exit(1)
+            print("output check: topic tree identical to xmind library output")
+
+        def native_file(structure):
+            write_xmind(structure, native_path, ORIGINAL_TEXT)
+
+        def native_memory(structure):
+            xmind_bytes(structure, ORIGINAL_TEXT)
+
+        def native_buffer(structure):
+            write_xmind(structure, io.BytesIO(), ORIGINAL_TEXT)
+
+        print(f"topics per file: {1 + sum(1 + len(c['children']) for c in structures[0]['children'])}")
+        rates = {
+            'native (file)': bench('native writer (file)', native_file, structures, args.iterations),
+            'native (bytes)': bench('native writer (bytes)', native_memory, structures, args.iterations),
+            'native (BytesIO)': bench('native writer (BytesIO)', native_buffer, structures, args.iterations),
+        }
+        if xmind is None:
+            print("xmind library not installed, skipping legacy comparison")
+            return
+
+        def legacy(structure):
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+            legacy_write(structure, legacy_path)
+
+        legacy_rate = bench('xmind library (file)', legacy, structures, args.iterations)
+
+    speedup = rates['native (file)'] / legacy_rate
+    print(f"speedup (file): {speedup:.1f}x")
+    if args.min_speedup and speedup < args.min_speedup:
+        print(f"FAILED: speedup below {args.min_speedup:.1f}x")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
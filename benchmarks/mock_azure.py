@@ -0,0 +1,187 @@
+"""
+本地模拟的Azure OpenAI chat completions服务（负载测试用）
+
+用法:
+    python benchmarks/mock_azure.py [--port N] [--latency S] [--vision-latency S] [--jitter S]
+                                    [--ttft S] [--chunks N] [--rate-429 P] [--retry-after-ms N] [--seed N]
+
+实现 /openai/deployments/<deployment>/chat/completions：
+- 普通请求等待 --latency 秒后返回固定的思维导图分析结果；
+- 消息中带图片（vision）时等待 --vision-latency 秒后返回固定的英文文章；
+- stream=true 时先等待 --ttft 秒，再把结果分成 --chunks 段以server-sent events推送（总耗时仍为 --latency），
+  stream_options.include_usage 时最后推送usage；
+- 按 --rate-429 的比例返回429（带 retry-after-ms 头），用于测试配额退避和故障转移；
+- 延迟抖动和429注入使用 --seed 初始化的随机数序列，相同参数的两次运行完全一致。
+
+GET /stats 返回收到的请求数和注入的429次数
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from benchmarks.bench_markdown_parse import FALLBACK_SAMPLE
+
+# OCR请求返回的文章（可以通过文本分析的校验）
+OCR_TEXT = """To the members of the city council of Albion,
+
+As a lifelong person living in Albion I have seen many changes to our beautiful town. Fifty years ago, \
+the population was 32,000 and Main Street was the center of everything. People went there to shop, eat \
+in restaurants, see movies, and sometimes just walk around. Today, nobody even thinks about going downtown.
+
+I advocate a suggestion to turn things around. Let's declare the four block area to the north of Main \
+Street a pedestrian-only zone, with open-air markets, sidewalk cafes, and street musicians."""
+
+# 足够大的剩余配额，避免客户端按响应头在本地限流
+RATE_LIMIT_HEADERS = {
+    'x-ratelimit-remaining-requests': '100000',
+    'x-ratelimit-remaining-tokens': '100000000',
+}
+
+
+class MockAzure:
+    """模拟服务的参数、随机数序列和统计"""
+
+    def __init__(self, latency: float = 0.5, vision_latency: float = None, jitter: float = 0.0,
+                 ttft: float = 0.1, chunks: int = 12, rate_429: float = 0.0, retry_after_ms: int = 200,
+                 seed: int = 42):
+        self.latency = latency
+        self.vision_latency = latency if vision_latency is None else vision_latency
+        self.jitter = jitter
+        self.ttft = ttft
+        self.chunks = max(chunks, 1)
+        self.rate_429 = rate_429
+        self.retry_after_ms = retry_after_ms
+        self._random = random.Random(seed)
+        self.stats = {'requests': 0, 'vision': 0, 'stream': 0, 'throttled': 0}
+
+    def _next_draw(self):
+        """按请求到达顺序取下一组随机数：(是否注入429, 延迟抖动)"""
+        throttle = self._random.random() < self.rate_429
+        jitter = self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return throttle, jitter
+
+    async def chat_completions(self, request: Request):
+        body = await request.json()
+        self.stats['requests'] += 1
+        throttle, jitter = self._next_draw()
+
+        if throttle:
+            self.stats['throttled'] += 1
+            return JSONResponse(
+                {'error': {'code': '429', 'message': 'Requests to the ChatCompletions_Create Operation '
+                                                     'have exceeded the rate limit.'}},
+                status_code=429,
+                headers={'retry-after-ms': str(self.retry_after_ms),
+                         'retry-after': str(max(1, round(self.retry_after_ms / 1000)))}
+            )
+
+        vision = _has_image(body.get('messages', []))
+        if vision:
+            self.stats['vision'] += 1
+        content = OCR_TEXT if vision else FALLBACK_SAMPLE
+        latency = max((self.vision_latency if vision else self.latency) + jitter, 0)
+        usage = {
+            'prompt_tokens': len(json.dumps(body.get('messages', []))) // 4,
+            'completion_tokens': len(content) // 4,
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        model = request.path_params['deployment']
+
+        if body.get('stream'):
+            self.stats['stream'] += 1
+            include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+            return StreamingResponse(
+                self._stream(model, content, latency, usage if include_usage else None),
+                media_type='text/event-stream', headers=RATE_LIMIT_HEADERS
+            )
+
+        await asyncio.sleep(latency)
+        return JSONResponse({
+            'id': f"chatcmpl-mock-{self.stats['requests']}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': usage
+        }, headers=RATE_LIMIT_HEADERS)
+
+    async def _stream(self, model: str, content: str, latency: float, usage):
+        """首段等待ttft，其余分段在剩余时间内均匀推送"""
+        size = -(-len(content) // self.chunks)
+        pieces = [content[i:i + size] for i in range(0, len(content), size)]
+        interval = max(latency - self.ttft, 0) / max(len(pieces) - 1, 1)
+        created = int(time.time())
+
+        def event(choices, extra=None):
+            data = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': created,
+                    'model': model, 'choices': choices, **(extra or {})}
+            return f"data: {json.dumps(data)}\n\n"
+
+        await asyncio.sleep(min(self.ttft, latency))
+        for index, piece in enumerate(pieces):
+            if index:
+                await asyncio.sleep(interval)
+            yield event([{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}])
+        yield event([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+        if usage:
+            yield event([], {'usage': usage})
+        yield 'data: [DONE]\n\n'
+
+    async def get_stats(self, request: Request):
+        return JSONResponse(self.stats)
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route('/openai/deployments/{deployment}/chat/completions', self.chat_completions, methods=['POST']),
+            Route('/stats', self.get_stats, methods=['GET']),
+        ])
+
+
+def _has_image(messages) -> bool:
+    """消息中是否带有图片（vision请求）"""
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, list) and any(part.get('type') == 'image_url' for part in content):
+            return True
+    return False
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """模拟服务的命令行参数（bench_load.py 复用）"""
+    parser.add_argument('--latency', type=float, default=0.5, help='文本请求的响应耗时（秒）')
+    parser.add_argument('--vision-latency', type=float, default=None, help='图片识别请求的响应耗时（秒），默认同 --latency')
+    parser.add_argument('--jitter', type=float, default=0.0, help='响应耗时的随机抖动范围（±秒）')
+    parser.add_argument('--ttft', type=float, default=0.1, help='流式请求的首段耗时（秒）')
+    parser.add_argument('--chunks', type=int, default=12, help='流式请求的分段数')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='返回429的请求比例（0~1）')
+    parser.add_argument('--retry-after-ms', type=int, default=200, help='429响应的 retry-after-ms')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的Azure OpenAI服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    import uvicorn
+    mock = MockAzure(args.latency, args.vision_latency, args.jitter, args.ttft, args.chunks,
+                     args.rate_429, args.retry_after_ms, args.seed)
+    uvicorn.run(mock.app(), host=args.host, port=args.port, log_level='warning', backlog=4096)
+
+
+if __name__ == '__main__':
+    main()
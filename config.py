@@ -14,9 +14,15 @@ class Config:
     LOGIN_USERNAME = os.environ.get('LOGIN_USERNAME', 'baoni')
     LOGIN_PASSWORD = os.environ.get('LOGIN_PASSWORD', 'lulu220519')
     
+    # 已验证token缓存的最大条目数（为0时每次请求都重新验证签名）
+    AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 1024))
+    
     # 文件上传配置
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
+    DATA_FOLDER = os.environ.get('DATA_FOLDER', 'data')  # 任务数据库等内部数据（不能放在对外提供下载的UPLOAD_FOLDER中）
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
+    UPLOAD_MAX_FILE_SIZE = int(os.environ.get('UPLOAD_MAX_FILE_SIZE', 10 * 1024 * 1024))  # 单个上传文件上限，接收时即检查
+    UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', 512 * 1024))  # 超过后上传文件转存到临时文件
     
     # Azure OpenAI配置
     AZURE_OPENAI_API_KEY = os.environ.get('AZURE_OPENAI_API_KEY')
@@ -24,6 +30,131 @@ class Config:
     AZURE_DEPLOYMENT_NAME = os.environ.get('AZURE_DEPLOYMENT_NAME') or 'gpt-4'
     AZURE_API_VERSION = os.environ.get('AZURE_API_VERSION') or '2025-01-01-preview'
     
+    # 多部署负载均衡配置
+    # JSON数组，如 [{"endpoint": "https://a.openai.azure.com/", "api_key": "...", "deployment": "gpt-4", "weight": 2}]
+    # 缺省字段使用上面的单部署配置；不配置时只使用单部署
+    AZURE_OPENAI_DEPLOYMENTS = os.environ.get('AZURE_OPENAI_DEPLOYMENTS')
+    AZURE_ROUTING_STRATEGY = os.environ.get('AZURE_ROUTING_STRATEGY', 'least_outstanding')  # least_outstanding / latency
+    AZURE_ROUTING_EWMA_ALPHA = float(os.environ.get('AZURE_ROUTING_EWMA_ALPHA', 0.3))
+    AZURE_UNHEALTHY_THRESHOLD = int(os.environ.get('AZURE_UNHEALTHY_THRESHOLD', 3))  # 连续失败次数
+    AZURE_UNHEALTHY_COOLDOWN = float(os.environ.get('AZURE_UNHEALTHY_COOLDOWN', 30))  # 冷却时间（秒）
+    
+    # Azure OpenAI连接池配置
+    AZURE_HTTP_MAX_CONNECTIONS = int(os.environ.get('AZURE_HTTP_MAX_CONNECTIONS', 100))
+    AZURE_HTTP_MAX_KEEPALIVE = int(os.environ.get('AZURE_HTTP_MAX_KEEPALIVE', 20))
+    AZURE_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('AZURE_HTTP_KEEPALIVE_EXPIRY', 60))
+    AZURE_HTTP_TIMEOUT = float(os.environ.get('AZURE_HTTP_TIMEOUT', 120))
+    AZURE_HTTP_CONNECT_TIMEOUT = float(os.environ.get('AZURE_HTTP_CONNECT_TIMEOUT', 10))
+    AZURE_HTTP2 = os.environ.get('AZURE_HTTP2', 'False').lower() == 'true'
+    
+    # Azure OpenAI调用配额与重试配置（配额为0表示不在本地限流）
+    AZURE_RPM_LIMIT = int(os.environ.get('AZURE_RPM_LIMIT', 0))  # 每分钟请求数配额
+    AZURE_TPM_LIMIT = int(os.environ.get('AZURE_TPM_LIMIT', 0))  # 每分钟token配额
+    RATE_LIMIT_SAFETY_FACTOR = float(os.environ.get('RATE_LIMIT_SAFETY_FACTOR', 0.9))
+    RATE_LIMIT_MAX_RETRIES = int(os.environ.get('RATE_LIMIT_MAX_RETRIES', 3))
+    RATE_LIMIT_BACKOFF_BASE = float(os.environ.get('RATE_LIMIT_BACKOFF_BASE', 1.0))
+    RATE_LIMIT_BACKOFF_MAX = float(os.environ.get('RATE_LIMIT_BACKOFF_MAX', 30))
+    RATE_LIMIT_QUEUE_TIMEOUT = float(os.environ.get('RATE_LIMIT_QUEUE_TIMEOUT', 120))  # 排队等待配额的最长时间
+    
+    # 分析结果缓存配置
+    ANALYSIS_CACHE_ENABLED = os.environ.get('ANALYSIS_CACHE_ENABLED', 'True').lower() == 'true'
+    ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 512))
+    ANALYSIS_CACHE_TTL = int(os.environ.get('ANALYSIS_CACHE_TTL', 7 * 24 * 3600))  # 7天
+    ANALYSIS_CACHE_MAX_DISK_BYTES = int(os.environ.get('ANALYSIS_CACHE_MAX_DISK_BYTES', 200 * 1024 * 1024))  # 200MB
+    
+    # 并发相同请求合并：等待者的最长等待时间（秒）
+    SINGLE_FLIGHT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', 180))
+    
+    # 异步任务队列配置
+    JOB_DB_PATH = os.environ.get('JOB_DB_PATH')  # 默认为 DATA_FOLDER/jobs.db
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))  # 为0时本进程不消费任务
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+    JOB_TIMEOUT = float(os.environ.get('JOB_TIMEOUT', 600))  # 运行超时后重新排队
+    JOB_RETENTION = float(os.environ.get('JOB_RETENTION', 24 * 3600))  # 已结束任务保留时间
+    JOB_CALLBACK_TIMEOUT = float(os.environ.get('JOB_CALLBACK_TIMEOUT', 10))
+    # 允许回调的内网主机（逗号分隔）；其余主机解析到回环、私有、链路本地等非公网地址时拒绝回调
+    JOB_CALLBACK_ALLOWED_HOSTS = {
+        host.strip().lower() for host in os.environ.get('JOB_CALLBACK_ALLOWED_HOSTS', '').split(',') if host.strip()
+    }
+    
+    # 批量分析配置
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 50))  # 单次批量请求的最大文本数
+    BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 8))  # 批量分析的最大并发数（进程级）
+    
+    # OCR图片预处理配置（需要安装Pillow，未安装时发送原图）
+    OCR_PREPROCESS_ENABLED = os.environ.get('OCR_PREPROCESS_ENABLED', 'True').lower() == 'true'
+    OCR_GRAYSCALE = os.environ.get('OCR_GRAYSCALE', 'True').lower() == 'true'
+    OCR_DESKEW = os.environ.get('OCR_DESKEW', 'True').lower() == 'true'  # 纠正±5°以内的倾斜
+    OCR_OUTPUT_FORMAT = os.environ.get('OCR_OUTPUT_FORMAT', 'jpeg')  # jpeg 或 webp
+    OCR_JPEG_QUALITY = int(os.environ.get('OCR_JPEG_QUALITY', 85))
+    OCR_DETAIL = os.environ.get('OCR_DETAIL', 'auto')  # auto、high 或 low
+    
+    # 多页OCR配置
+    OCR_MAX_PAGES = int(os.environ.get('OCR_MAX_PAGES', 10))  # 单次请求的最大图片数
+    OCR_MAX_WORKERS = int(os.environ.get('OCR_MAX_WORKERS', 8))  # 多页识别的最大并发数（进程级）
+    
+    # OCR结果缓存配置（近似图片匹配需要安装Pillow）
+    OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', 'True').lower() == 'true'
+    OCR_CACHE_MAX_ENTRIES = int(os.environ.get('OCR_CACHE_MAX_ENTRIES', 2048))
+    OCR_CACHE_TTL = int(os.environ.get('OCR_CACHE_TTL', 7 * 24 * 3600))  # 秒
+    OCR_CACHE_PERCEPTUAL = os.environ.get('OCR_CACHE_PERCEPTUAL', 'True').lower() == 'true'
+    OCR_CACHE_HASH_SIZE = int(os.environ.get('OCR_CACHE_HASH_SIZE', 16))  # dHash网格边长，指纹为2x16x16=512位
+    OCR_CACHE_MAX_DISTANCE = int(os.environ.get('OCR_CACHE_MAX_DISTANCE', 24))  # 视为同一页面的最大汉明距离
+    
+    # 生成文件存储配置：local（UPLOAD_FOLDER下按内容哈希分片的目录）或 s3（S3兼容对象存储，需要安装boto3）
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    STORAGE_S3_BUCKET = os.environ.get('STORAGE_S3_BUCKET', '')
+    STORAGE_S3_PREFIX = os.environ.get('STORAGE_S3_PREFIX', '')
+    STORAGE_S3_ENDPOINT_URL = os.environ.get('STORAGE_S3_ENDPOINT_URL', '')  # MinIO等S3兼容服务地址
+    STORAGE_S3_REGION = os.environ.get('STORAGE_S3_REGION', '')
+    STORAGE_S3_ACCESS_KEY = os.environ.get('STORAGE_S3_ACCESS_KEY', '')
+    STORAGE_S3_SECRET_KEY = os.environ.get('STORAGE_S3_SECRET_KEY', '')
+    STORAGE_S3_URL_EXPIRES = int(os.environ.get('STORAGE_S3_URL_EXPIRES', 3600))  # 预签名下载地址有效期（秒）
+    
+    # 生成文件下载配置
+    DOWNLOAD_CACHE_MAX_AGE = int(os.environ.get('DOWNLOAD_CACHE_MAX_AGE', 365 * 24 * 3600))  # 秒
+    # nginx内部location前缀（如 /_protected_downloads/），为空时由Flask直接发送文件；
+    # 只对带 X-Sendfile-Type: X-Accel-Redirect 请求头（由nginx设置）的请求生效
+    DOWNLOAD_ACCEL_REDIRECT = os.environ.get('DOWNLOAD_ACCEL_REDIRECT', '')
+    
+    # 上传目录清理配置（生成的.xmind文件和exports/下的导出缓存）
+    JANITOR_ENABLED = os.environ.get('JANITOR_ENABLED', 'True').lower() == 'true'
+    JANITOR_INTERVAL = float(os.environ.get('JANITOR_INTERVAL', 300))  # 清理间隔（秒）
+    JANITOR_MAX_AGE = float(os.environ.get('JANITOR_MAX_AGE', 7 * 24 * 3600))  # 自最近访问起的保留时间（秒），0表示不限
+    JANITOR_MAX_BYTES = int(os.environ.get('JANITOR_MAX_BYTES', 1024 * 1024 * 1024))  # 总字节数上限，0表示不限
+    JANITOR_RESCAN_INTERVAL = float(os.environ.get('JANITOR_RESCAN_INTERVAL', 3600))  # 重新扫描目录的间隔（秒）
+    JANITOR_BATCH_SIZE = int(os.environ.get('JANITOR_BATCH_SIZE', 100))  # 每批删除的文件数
+    JANITOR_BATCH_PAUSE = float(os.environ.get('JANITOR_BATCH_PAUSE', 0.05))  # 批之间的暂停（秒）
+    
+    # 生产服务器（gunicorn）配置，见 gunicorn.conf.py
+    GUNICORN_BIND = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+    GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', os.cpu_count() or 2))  # worker进程数
+    GUNICORN_WORKER_CLASS = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')  # gthread 或 gevent（需安装gevent）
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 16))  # 每个worker的请求线程数（gthread）
+    GUNICORN_WORKER_CONNECTIONS = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))  # 每个worker的最大连接数（gevent）
+    GUNICORN_KEEPALIVE = int(os.environ.get('GUNICORN_KEEPALIVE', 5))  # 秒
+    GUNICORN_TIMEOUT = int(os.environ.get('GUNICORN_TIMEOUT', 180))  # worker无响应超时（秒），需大于AZURE_HTTP_TIMEOUT
+    GUNICORN_GRACEFUL_TIMEOUT = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 60))  # 重启时等待进行中请求完成的时间（秒）
+    GUNICORN_MAX_REQUESTS = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))  # worker处理多少请求后重启，0表示不重启
+    GUNICORN_PRELOAD = os.environ.get('GUNICORN_PRELOAD', 'True').lower() == 'true'  # gevent worker需关闭
+    
+    # 异步（ASGI）入口配置，见 asgi.py
+    ASYNC_AZURE_CONCURRENCY = int(os.environ.get('ASYNC_AZURE_CONCURRENCY', 100))  # 每个部署同时进行的Azure OpenAI请求上限（每个进程）
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 16))  # 运行其余同步接口（Flask）的线程数
+    
+    # 监控指标配置（/metrics）
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR', '')  # 多worker部署时各进程写入指标快照的目录，为空表示只导出当前进程
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # 写入快照的间隔（秒）
+    
+    # 请求追踪配置（Server-Timing响应头、OpenTelemetry导出）
+    TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', 0.05))  # 采样比例（0~1），已认证且带 X-Trace-Debug: 1 或带已采样traceparent的请求总是追踪
+    TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', '')  # 空（不导出）、file（OTLP/JSON写入本地文件）或 otlp（OTLP/HTTP发送到collector）
+    TRACING_EXPORT_FILE = os.environ.get('TRACING_EXPORT_FILE')  # 默认为 DATA_FOLDER/traces.jsonl
+    TRACING_OTLP_ENDPOINT = os.environ.get('TRACING_OTLP_ENDPOINT', 'http://localhost:4318')
+    TRACING_SERVICE_NAME = os.environ.get('TRACING_SERVICE_NAME', 'baoni-backend')
+    TRACING_EXPORT_INTERVAL = float(os.environ.get('TRACING_EXPORT_INTERVAL', 5))  # 批量导出间隔（秒）
+    TRACING_MAX_QUEUE = int(os.environ.get('TRACING_MAX_QUEUE', 2048))  # 等待导出的请求数上限，超出时丢弃
+    
     # API配置
     RESTX_VALIDATE = True
     RESTX_MASK_SWAGGER = False
@@ -70,11 +70,55 @@ export const api = {
     analyzeText(text) {
       return axiosInstance.post('/api/analyze/text', { text })
     },
-    
-    // 图片文字识别
-    extractTextFromImage(imageFile) {
+
+    // 流式分析文本（server-sent events），onEvent(event, data) 依次收到 delta / section / done / error
+    async analyzeTextStream(text, onEvent) {
+      const token = localStorage.getItem('token')
+      const response = await fetch(`${axiosInstance.defaults.baseURL}/api/analyze/text/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          ...(token ? { Authorization: `Bearer ${token}` } : {})
+        },
+        body: JSON.stringify({ text })
+      })
+
+      if (!response.ok) {
+        const error = new Error(`HTTP ${response.status}`)
+        error.response = { status: response.status, data: await response.json().catch(() => null) }
+        throw error
+      }
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      for (;;) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        let boundary
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const message = buffer.slice(0, boundary)
+          buffer = buffer.slice(boundary + 2)
+
+          let event = 'message'
+          let data = ''
+          for (const line of message.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7)
+            else if (line.startsWith('data: ')) data += line.slice(6)
+          }
+          onEvent(event, data ? JSON.parse(data) : null)
+        }
+      }
+    },
+
+    // 图片文字识别（传入数组时按顺序作为多页上传，analyze为true时直接分析识别结果）
+    extractTextFromImage(imageFile, analyze = false) {
       const formData = new FormData()
-      formData.append('image', imageFile)
+      const files = Array.isArray(imageFile) ? imageFile : [imageFile]
+      files.forEach(file => formData.append('image', file))
+      if (analyze) formData.append('analyze', 'true')
       
       return axiosInstance.post('/api/analyze/ocr', formData, {
         headers: {
@@ -0,0 +1,52 @@
+"""
+gunicorn生产环境配置
+
+用法:
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+所有参数都从 Config（环境变量）读取：
+- gthread worker：每个worker进程用 GUNICORN_THREADS 个线程处理请求，
+  单个Azure OpenAI调用耗时较长时只占用一个线程，不影响其他请求
+- preload_app：应用在主进程中加载一次，worker通过fork共享只读内存；
+  post_fork钩子在每个worker中重建连接池、线程池和缓存，并启动后台线程
+- 平滑重启：kill -HUP <master pid> 逐个替换worker，进行中的请求在 GUNICORN_GRACEFUL_TIMEOUT 内完成；
+  启用preload_app时HUP不会重新加载代码，更新代码需要 USR2 + WINCH 或重启容器
+"""
+from config import Config
+
+bind = Config.GUNICORN_BIND
+workers = Config.GUNICORN_WORKERS
+worker_class = Config.GUNICORN_WORKER_CLASS
+threads = Config.GUNICORN_THREADS
+worker_connections = Config.GUNICORN_WORKER_CONNECTIONS
+keepalive = Config.GUNICORN_KEEPALIVE
+timeout = Config.GUNICORN_TIMEOUT
+graceful_timeout = Config.GUNICORN_GRACEFUL_TIMEOUT
+max_requests = Config.GUNICORN_MAX_REQUESTS
+max_requests_jitter = Config.GUNICORN_MAX_REQUESTS // 10
+preload_app = Config.GUNICORN_PRELOAD
+
+accesslog = '-'
+errorlog = '-'
+forwarded_allow_ips = '*'
+
+
+def on_starting(server):
+    """主进程启动时：清除上一次运行留下的指标快照"""
+    from services.metrics import clear_multiproc_dir
+    clear_multiproc_dir()
+
+
+def post_fork(server, worker):
+    """worker进程fork后：重建进程级共享对象并启动后台线程"""
+    from services.lifecycle import reinit_after_fork, start_background_services
+    from wsgi import application
+
+    reinit_after_fork()
+    start_background_services(application)
+
+
+def worker_exit(server, worker):
+    """worker进程退出前：停止后台线程并关闭连接池"""
+    from services.lifecycle import stop_background_services
+    stop_background_services()
@@ -1,21 +1,75 @@
-from flask import request, current_app
-from flask_restx import Namespace, Resource, fields
+from flask import request, current_app, g, Response
+from flask_restx import Namespace, Resource, fields, marshal
+import json
 import logging
+import re
 from datetime import datetime
+from functools import wraps
+from typing import Any, Optional
 from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
 from services.openai_service import OpenAIService
+from services.analysis_cache import get_analysis_cache
+from services.ocr_cache import get_ocr_cache
+from services.analysis_service import AnalysisService
+from services.ocr_service import OCRService
+from services.image_service import image_source_size
+from services.job_queue import get_job_queue, is_allowed_callback_url
+from services.rate_limiter import all_rate_limiter_stats, PRIORITY_BATCH
+from services.deployment_router import get_deployment_router
+from services.janitor import get_janitor
+from services.export_service import (
+    ExportService, EXPORT_FORMATS, DEFAULT_EXPORT_FORMAT, format_for_mimetype, validate_structure
+)
+from config import Config
 from services.xmind_service import XMindService
 from services.auth_service import AuthService, require_auth
+from services import tracing
+from utils.helpers import validate_text_content, normalize_text
+from utils.downloads import send_download
+from utils.uploads import FileTooLarge
 
 logger = logging.getLogger(__name__)
 
+# 分析结果缓存键格式（MD5十六进制）
+_CACHE_KEY_RE = re.compile(r'^[0-9a-f]{32}$')
+
 # 创建命名空间
 text_analysis_ns = Namespace('text_analysis', description='英文文本分析与XMind生成相关接口')
 auth_ns = Namespace('auth', description='用户认证相关接口')
 
+
+def _marshal_with(model):
+    """
+    与 text_analysis_ns.marshal_with 相同，并把按模型序列化响应的耗时记为追踪阶段 marshal
+    
+    Args:
+        model: 响应模型
+    """
+    def decorator(func):
+        @wraps(func)
+        def handler(*args, **kwargs):
+            result = func(*args, **kwargs)
+            g._marshal_span = tracing.span('marshal')
+            return result
+        
+        marshalled = text_analysis_ns.marshal_with(model)(handler)
+        
+        @wraps(marshalled)
+        def decorated(*args, **kwargs):
+            result = marshalled(*args, **kwargs)
+            g.pop('_marshal_span', tracing.NOOP_SPAN).end()
+            return result
+        
+        return decorated
+    return decorator
+
+
 # API模型定义
 text_input_model = text_analysis_ns.model('TextInput', {
-    'text': fields.String(required=True, description='需要分析的英文文本', example='This is a sample English text for reading comprehension analysis.')
+    'text': fields.String(required=True, description='需要分析的英文文本', example='This is a sample English text for reading comprehension analysis.'),
+    'async': fields.Boolean(description='是否以异步任务方式提交，立即返回任务ID', default=False),
+    'callback_url': fields.String(description='异步任务完成后回调的URL（可选）')
 })
 
 analysis_result_model = text_analysis_ns.model('AnalysisResult', {
@@ -23,17 +77,76 @@ analysis_result_model = text_analysis_ns.model('AnalysisResult', {
     'analysis': fields.String(description='分析结果（markdown格式）'),
     'mindmap_data': fields.Raw(description='思维导图结构化数据'),
     'tokens_used': fields.Integer(description='使用的token数量'),
+    'cached': fields.Boolean(description='是否命中分析结果缓存'),
+    'cache_key': fields.String(description='分析结果缓存键，可用于导出接口'),
+    'job_id': fields.String(description='异步任务ID（仅异步提交时返回）'),
+    'status': fields.String(description='异步任务状态（仅异步提交时返回）'),
+    'error': fields.String(description='错误信息')
+})
+
+# 批量分析模型
+batch_input_model = text_analysis_ns.model('BatchInput', {
+    'texts': fields.List(fields.String, required=True, description='需要分析的英文文本列表'),
+    'stream': fields.Boolean(description='是否以NDJSON流式返回（每完成一篇返回一行）', default=False)
+})
+
+batch_item_model = text_analysis_ns.inherit('BatchItemResult', analysis_result_model, {
+    'index': fields.Integer(description='文本在请求列表中的序号')
+})
+
+batch_result_model = text_analysis_ns.model('BatchResult', {
+    'success': fields.Boolean(description='批量请求是否被处理'),
+    'total': fields.Integer(description='文本总数'),
+    'unique': fields.Integer(description='去重后实际分析的文本数'),
+    'succeeded': fields.Integer(description='分析成功的文本数'),
+    'results': fields.List(fields.Nested(batch_item_model), description='按请求顺序排列的分析结果'),
     'error': fields.String(description='错误信息')
 })
 
 # OCR结果模型
+ocr_page_model = text_analysis_ns.model('OCRPage', {
+    'page': fields.Integer(description='页码（按上传顺序，从1开始）'),
+    'success': fields.Boolean(description='该页识别是否成功'),
+    'extracted_text': fields.String(description='该页识别出的文本'),
+    'tokens_used': fields.Integer(description='该页使用的token数量'),
+    'cached': fields.Boolean(description='该页是否命中OCR结果缓存'),
+    'error': fields.String(description='该页的错误信息')
+})
+
 ocr_result_model = text_analysis_ns.model('OCRResult', {
     'success': fields.Boolean(description='OCR识别是否成功'),
-    'extracted_text': fields.String(description='从图片中提取的英文文本'),
+    'extracted_text': fields.String(description='从图片中提取的英文文本（多页时为按页码顺序合并的文本）'),
+    'pages': fields.List(fields.Nested(ocr_page_model), description='各页识别结果'),
+    'analysis': fields.String(description='合并文本的分析结果（仅 analyze=true 时返回）'),
+    'mindmap_data': fields.Raw(description='思维导图结构化数据（仅 analyze=true 时返回）'),
     'tokens_used': fields.Integer(description='使用的token数量'),
+    'cached': fields.Boolean(description='是否命中OCR结果缓存'),
+    'job_id': fields.String(description='异步任务ID（仅异步提交时返回）'),
+    'status': fields.String(description='异步任务状态（仅异步提交时返回）'),
     'error': fields.String(description='错误信息')
 })
 
+# 异步任务状态模型
+job_status_model = text_analysis_ns.model('JobStatus', {
+    'success': fields.Boolean(description='查询是否成功'),
+    'job_id': fields.String(description='任务ID'),
+    'kind': fields.String(description='任务类型: analyze_text / ocr'),
+    'status': fields.String(description='任务状态: queued / running / succeeded / failed'),
+    'result': fields.Raw(description='任务结果（与同步接口的返回结构一致）'),
+    'error': fields.String(description='错误信息'),
+    'created_at': fields.Float(description='提交时间（Unix时间戳）'),
+    'started_at': fields.Float(description='开始执行时间（Unix时间戳）'),
+    'finished_at': fields.Float(description='结束时间（Unix时间戳）')
+})
+
+# 导出模型
+export_input_model = text_analysis_ns.model('ExportInput', {
+    'mindmap_data': fields.Raw(description='思维导图结构化数据（与cache_key二选一）'),
+    'cache_key': fields.String(description='分析结果缓存键（与mindmap_data二选一）'),
+    'format': fields.String(description='导出格式: xmind / opml / mm / md / json，未指定时按Accept头协商', default='xmind'),
+    'original_text': fields.String(description='原文（xmind格式写入根节点备注，可选）')
+})
+
 # 认证相关模型
 login_model = auth_ns.model('LoginCredentials', {
     'username': fields.String(required=True, description='用户名', example='baoni'),
@@ -54,7 +167,7 @@ class TextAnalysis(Resource):
     
     @require_auth
     @text_analysis_ns.expect(text_input_model)
-    @text_analysis_ns.marshal_with(analysis_result_model)
+    @_marshal_with(analysis_result_model)
     @text_analysis_ns.doc(
         'analyze_text',
         description='分析英文文本，提取主要思想并生成思维导图数据',
@@ -75,68 +188,38 @@ class TextAnalysis(Resource):
         """
         try:
             # 获取请求数据
-            data = request.get_json()
-            if not data or 'text' not in data:
+            with tracing.span('parse_body'):
+                data = request.get_json()
+            with tracing.span('validate'):
+                text, error_msg = _validate_text_request(data)
+            if error_msg:
                 return {
                     'success': False,
-                    'error': 'Please provide text content to analyze'
+                    'error': error_msg
                 }, 400
             
-            text = data['text'].strip()
-            if not text:
+            # 异步提交：立即返回任务ID，由后台worker执行分析
+            if data.get('async'):
+                callback_url = data.get('callback_url')
+                if callback_url and not _is_valid_callback_url(callback_url):
+                    return {
+                        'success': False,
+                        'error': 'callback_url must be a public http(s) URL'
+                    }, 400
+                with tracing.span('enqueue'):
+                    job_id = get_job_queue().enqueue('analyze_text', {'text': text}, callback_url=callback_url)
                 return {
-                    'success': False,
-                    'error': 'Text content cannot be empty'
-                }, 400
-            
-            if len(text) < 50:
-                return {
-                    'success': False,
-                    'error': 'Text content is too short, please provide at least 50 characters of English text'
-                }, 400
-            
-            # 初始化服务
-            openai_service = OpenAIService()
-            xmind_service = XMindService()
-            
-            # 调用OpenAI分析文本
-            logger.info(f"Starting text analysis, length: {len(text)}")
-            analysis_result = openai_service.analyze_text(text)
-            
-            if not analysis_result['success']:
-                return {
-                    'success': False,
-                    'error': f'Text analysis failed: {analysis_result["error"]}'
-                }, 500
-            
-            # 生成思维导图结构数据
-            logger.info("Generating mindmap structure data")
-            logger.info(f"Analysis result length: {len(analysis_result.get('analysis', ''))}")
+                    'success': True,
+                    'job_id': job_id,
+                    'status': 'queued'
+                }, 202
             
-            try:
-                # 只解析结构，不生成文件
-                mindmap_data = xmind_service.parse_markdown_to_structure(
-                    analysis_result['analysis']
-                )
-                logger.info(f"Mindmap structure generated successfully")
-                
-            except Exception as e:
-                logger.error(f"Exception during mindmap structure generation: {str(e)}")
-                import traceback
-                logger.error(f"Full traceback: {traceback.format_exc()}")
-                return {
-                    'success': False,
-                    'analysis': analysis_result['analysis'],
-                    'error': f'Mindmap structure generation exception: {str(e)}'
-                }, 500
+            result = AnalysisService().analyze(text)
+            if not result['success']:
+                return result, 500
             
             # 返回成功结果
-            return {
-                'success': True,
-                'analysis': analysis_result['analysis'],
-                'mindmap_data': mindmap_data,
-                'tokens_used': analysis_result.get('tokens_used', 0)
-            }, 200
+            return result, 200
             
         except Exception as e:
             logger.error(f"API processing failed: {str(e)}")
@@ -145,6 +228,179 @@ class TextAnalysis(Resource):
                 'error': f'Internal server error: {str(e)}'
             }, 500
 
+def _validate_text_request(data: Any):
+    """
+    校验文本分析请求体
+
+    Args:
+        data: 解析后的JSON请求体
+
+    Returns:
+        tuple: (去除首尾空白的文本, 错误信息)
+    """
+    if not isinstance(data, dict) or 'text' not in data:
+        return None, 'Please provide text content to analyze'
+    
+    if not isinstance(data['text'], str):
+        return None, 'Text content must be a string'
+    
+    text = data['text'].strip()
+    if not text:
+        return None, 'Text content cannot be empty'
+    
+    if len(text) < 50:
+        return None, 'Text content is too short, please provide at least 50 characters of English text'
+    
+    return text, None
+
+def _is_valid_callback_url(url: str) -> bool:
+    """校验异步任务回调地址（仅允许公网的http/https地址，见 is_allowed_callback_url）"""
+    return is_allowed_callback_url(url)
+
+def _format_sse(event: str, data: dict) -> str:
+    """格式化一条server-sent event消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _generate_analysis_events(text: str):
+    """
+    流式分析文本并生成SSE事件（见 AnalysisService.analyze_stream）
+    
+    事件类型:
+        delta   - 模型输出的增量文本
+        section - 每完成一个 ## 章节时推送该章节的思维导图节点
+        done    - 完整的分析结果、思维导图数据和token数量
+        error   - 错误信息
+    """
+    for event in AnalysisService().analyze_stream(text):
+        if event['type'] == 'delta':
+            yield _format_sse('delta', {'content': event['content']})
+        elif event['type'] == 'section':
+            yield _format_sse('section', {'index': event['index'], 'section': event['section']})
+        elif event['type'] == 'done':
+            yield _format_sse('done', event['result'])
+        else:
+            yield _format_sse('error', {'error': event['error']})
+
+@text_analysis_ns.route('/text/stream')
+class TextAnalysisStream(Resource):
+    """流式文本分析接口"""
+    
+    @require_auth
+    @text_analysis_ns.expect(text_input_model)
+    @text_analysis_ns.doc(
+        'analyze_text_stream',
+        description='以server-sent events流式返回分析结果，每完成一个章节推送一次该章节的思维导图节点',
+        responses={
+            200: '开始推送事件流 (text/event-stream)',
+            400: '请求参数错误',
+            401: '未授权访问'
+        },
+        security='Bearer Auth'
+    )
+    def post(self):
+        """
+        流式分析英文文本
+        
+        依次推送 delta（增量文本）、section（已完成章节的思维导图节点）和 done（完整结果）事件
+        """
+        text, error_msg = _validate_text_request(request.get_json(silent=True))
+        if error_msg:
+            return {
+                'success': False,
+                'error': error_msg
+            }, 400
+        
+        logger.info(f"Starting streaming text analysis, length: {len(text)}")
+        return Response(
+            _generate_analysis_events(text),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'  # 禁止nginx缓冲事件流
+            }
+        )
+
+@text_analysis_ns.route('/batch')
+class BatchAnalysis(Resource):
+    """批量文本分析接口"""
+    
+    @require_auth
+    @text_analysis_ns.expect(batch_input_model)
+    @text_analysis_ns.response(200, '分析完成（stream=true 时返回 application/x-ndjson，每行一个结果）', batch_result_model)
+    @text_analysis_ns.doc(
+        'analyze_batch',
+        description='批量分析多篇英文文本，相同文本只分析一次，多篇文本并发处理',
+        responses={
+            400: '请求参数错误',
+            401: '未授权访问'
+        },
+        security='Bearer Auth'
+    )
+    def post(self):
+        """
+        批量分析英文文本
+        
+        逐篇校验文本，去重后并发调用Azure OpenAI；
+        stream=true 或 Accept: application/x-ndjson 时每完成一篇即返回一行结果
+        """
+        data = request.get_json(silent=True)
+        texts = data.get('texts') if isinstance(data, dict) else None
+        if not isinstance(texts, list) or not texts:
+            return {'success': False, 'error': 'Please provide a non-empty list of texts'}, 400
+        
+        if len(texts) > Config.BATCH_MAX_ITEMS:
+            return {
+                'success': False,
+                'error': f'Too many texts, at most {Config.BATCH_MAX_ITEMS} per batch'
+            }, 400
+        
+        # 逐篇校验，未通过的文本直接返回错误，不参与分析
+        results = [None] * len(texts)
+        valid_indices = []
+        for index, text in enumerate(texts):
+            is_valid, error = validate_text_content(text) if isinstance(text, str) else (False, '文本内容必须是字符串')
+            if is_valid:
+                valid_indices.append(index)
+            else:
+                results[index] = {'index': index, 'success': False, 'error': error}
+        
+        valid_texts = [texts[i].strip() for i in valid_indices]
+        stream = bool(data.get('stream')) or \
+            request.accept_mimetypes.best == 'application/x-ndjson'
+        
+        def iter_results():
+            """按完成顺序生成 (序号, 结果)"""
+            for index in range(len(texts)):
+                if results[index] is not None:
+                    yield index, results[index]
+            if valid_texts:
+                for positions, result in AnalysisService(PRIORITY_BATCH).analyze_batch(valid_texts):
+                    for position in positions:
+                        index = valid_indices[position]
+                        yield index, {'index': index, **result}
+        
+        if stream:
+            def generate():
+                for _, item in iter_results():
+                    yield json.dumps(item, ensure_ascii=False) + '\n'
+            
+            return Response(
+                generate(),
+                mimetype='application/x-ndjson',
+                headers={'X-Accel-Buffering': 'no'}
+            )
+        
+        for index, item in iter_results():
+            results[index] = item
+        
+        return marshal({
+            'success': True,
+            'total': len(texts),
+            'unique': len({normalize_text(text) for text in valid_texts}),
+            'succeeded': sum(1 for item in results if item['success']),
+            'results': results
+        }, batch_result_model), 200
+
 @text_analysis_ns.route('/test')
 class ConnectionTest(Resource):
     """连接测试接口"""
@@ -175,6 +431,262 @@ class ConnectionTest(Resource):
                 'error': str(e)
             }, 500
 
+@text_analysis_ns.route('/jobs/<string:job_id>')
+class AnalysisJob(Resource):
+    """异步任务查询接口"""
+    
+    @require_auth
+    @text_analysis_ns.marshal_with(job_status_model)
+    @text_analysis_ns.doc(
+        'get_analysis_job',
+        description='查询异步分析/识别任务的状态和结果',
+        responses={
+            200: '查询成功',
+            401: '未授权访问',
+            404: '任务不存在'
+        },
+        security='Bearer Auth'
+    )
+    def get(self, job_id):
+        """查询异步任务状态"""
+        job = get_job_queue().get(job_id)
+        if not job:
+            return {'success': False, 'job_id': job_id, 'error': '任务不存在'}, 404
+        return {'success': True, **job}, 200
+
+@text_analysis_ns.route('/export')
+class MindmapExport(Resource):
+    """思维导图导出接口"""
+    
+    @require_auth
+    @text_analysis_ns.doc(
+        'export_mindmap_by_key',
+        description='按分析结果缓存键导出思维导图',
+        params={
+            'cache_key': '分析结果缓存键（/text 返回的 cache_key）',
+            'format': '导出格式: xmind / opml / mm / md / json，未指定时按Accept头协商，默认xmind'
+        },
+        responses={
+            200: '导出成功',
+            304: '文件未变化（If-None-Match命中）',
+            400: '请求参数错误',
+            401: '未授权访问',
+            404: '分析结果不存在或已过期'
+        },
+        security='Bearer Auth'
+    )
+    def get(self):
+        """按分析结果缓存键导出思维导图文件"""
+        return _export_mindmap(request.args.get('cache_key'), None, '')
+    
+    @require_auth
+    @text_analysis_ns.expect(export_input_model)
+    @text_analysis_ns.doc(
+        'export_mindmap',
+        description='将思维导图导出为 .xmind / OPML / FreeMind .mm / Markdown / JSON 文件',
+        responses={
+            200: '导出成功',
+            304: '文件未变化（If-None-Match命中）',
+            400: '请求参数错误',
+            401: '未授权访问',
+            404: '分析结果不存在或已过期'
+        },
+        security='Bearer Auth'
+    )
+    def post(self):
+        """
+        导出思维导图文件
+        
+        格式由 format 参数（请求体或查询参数）或 Accept 头决定；
+        相同内容的导出结果按内容哈希缓存，响应带ETag，支持If-None-Match
+        """
+        data = request.get_json(silent=True)
+        if data is None:
+            data = {}
+        elif not isinstance(data, dict):
+            return {'success': False, 'error': 'Request body must be a JSON object'}, 400
+        original_text = data.get('original_text') or ''
+        if not isinstance(original_text, str):
+            return {'success': False, 'error': 'original_text must be a string'}, 400
+        return _export_mindmap(data.get('cache_key'), data.get('mindmap_data'), original_text,
+                               data.get('format'))
+
+def _negotiate_export_format(requested: Optional[str]) -> Optional[str]:
+    """根据format参数或Accept头确定导出格式，无法满足时返回None"""
+    requested = requested or request.args.get('format')
+    if requested:
+        requested = requested.lower().lstrip('.')
+        return requested if requested in EXPORT_FORMATS else None
+    
+    if not request.accept_mimetypes or request.accept_mimetypes.best == '*/*':
+        return DEFAULT_EXPORT_FORMAT
+    mimetypes = [EXPORT_FORMATS[DEFAULT_EXPORT_FORMAT][0]] + [
+        mimetype for name, (mimetype, _, _) in EXPORT_FORMATS.items() if name != DEFAULT_EXPORT_FORMAT
+    ]
+    best = request.accept_mimetypes.best_match(mimetypes)
+    return format_for_mimetype(best) if best else None
+
+def _export_mindmap(cache_key: Optional[str], mindmap_data: Any, original_text: str,
+                    requested_format: Optional[str] = None):
+    """导出思维导图：解析数据来源、协商格式、处理条件请求并返回文件"""
+    export_format = _negotiate_export_format(requested_format)
+    if export_format is None:
+        return {
+            'success': False,
+            'error': f'Unsupported export format, supported: {", ".join(EXPORT_FORMATS)}'
+        }, 406 if not requested_format and not request.args.get('format') else 400
+    
+    if mindmap_data is None:
+        if not cache_key:
+            return {'success': False, 'error': 'Please provide mindmap_data or cache_key'}, 400
+        if not _CACHE_KEY_RE.match(cache_key):
+            return {'success': False, 'error': 'Invalid cache_key'}, 400
+        cache = get_analysis_cache()
+        cached_result = cache.get(cache_key) if cache else None
+        if not cached_result:
+            return {'success': False, 'error': 'Analysis result not found or expired'}, 404
+        mindmap_data = cached_result['mindmap_data']
+    
+    error_msg = validate_structure(mindmap_data)
+    if error_msg:
+        return {'success': False, 'error': error_msg}, 400
+    
+    export_service = ExportService()
+    content_hash = export_service.content_hash(mindmap_data, export_format, original_text)
+    mimetype, extension, _ = EXPORT_FORMATS[export_format]
+    
+    # 条件请求：内容哈希即ETag，命中时无需渲染
+    if content_hash in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(content_hash)
+        return response
+    
+    try:
+        key, cached = export_service.export(mindmap_data, export_format, original_text, content_hash)
+    except Exception as e:
+        logger.error(f"思维导图导出失败: {str(e)}")
+        return {'success': False, 'error': f'Export failed: {str(e)}'}, 500
+    
+    response = send_download(
+        export_service.storage,
+        key,
+        download_name=f'mindmap.{extension}',
+        mimetype=mimetype,
+        etag=content_hash
+    )
+    # 同一cache_key在分析结果过期重算后可能对应不同的内容，每次使用前按ETag重新验证
+    response.cache_control.immutable = False
+    response.cache_control.public = False
+    response.cache_control.max_age = None
+    response.cache_control.no_cache = True
+    response.headers['Vary'] = 'Accept'
+    response.headers['X-Export-Cache'] = 'hit' if cached else 'miss'
+    return response
+
+@text_analysis_ns.route('/cache')
+class AnalysisCacheStats(Resource):
+    """分析结果缓存统计接口"""
+    
+    @require_auth
+    @text_analysis_ns.doc(
+        'analysis_cache_stats',
+        description='查看分析结果缓存的命中统计',
+        responses={
+            200: '获取成功',
+            401: '未授权访问'
+        },
+        security='Bearer Auth'
+    )
+    def get(self):
+        """获取分析结果缓存命中统计"""
+        cache = get_analysis_cache()
+        if not cache:
+            return {'success': True, 'enabled': False}, 200
+        return {'success': True, 'enabled': True, 'stats': cache.stats()}, 200
+
+@text_analysis_ns.route('/ocr/cache')
+class OCRCacheStats(Resource):
+    """OCR结果缓存统计接口"""
+    
+    @require_auth
+    @text_analysis_ns.doc(
+        'ocr_cache_stats',
+        description='查看OCR结果缓存（精确匹配与近似图片匹配）的命中统计',
+        responses={
+            200: '获取成功',
+            401: '未授权访问'
+        },
+        security='Bearer Auth'
+    )
+    def get(self):
+        """获取OCR结果缓存命中统计"""
+        cache = get_ocr_cache()
+        if not cache:
+            return {'success': True, 'enabled': False}, 200
+        return {'success': True, 'enabled': True, 'stats': cache.stats()}, 200
+
+@text_analysis_ns.route('/storage')
+class StorageStats(Resource):
+    """上传目录清理统计接口"""
+    
+    @require_auth
+    @text_analysis_ns.doc(
+        'storage_stats',
+        description='查看上传目录中生成文件的数量、总大小，以及后台清理释放的文件数和字节数',
+        responses={
+            200: '获取成功',
+            401: '未授权访问'
+        },
+        security='Bearer Auth'
+    )
+    def get(self):
+        """获取上传目录清理统计"""
+        janitor = get_janitor()
+        if not janitor:
+            return {'success': True, 'enabled': False}, 200
+        return {'success': True, 'enabled': True, 'stats': janitor.stats()}, 200
+
+@text_analysis_ns.route('/rate-limit')
+class RateLimitStats(Resource):
+    """Azure OpenAI调用调度统计接口"""
+    
+    @require_auth
+    @text_analysis_ns.doc(
+        'rate_limit_stats',
+        description='查看Azure OpenAI调用配额、排队和重试统计',
+        responses={
+            200: '获取成功',
+            401: '未授权访问'
+        },
+        security='Bearer Auth'
+    )
+    def get(self):
+        """获取Azure OpenAI调用调度统计"""
+        return {'success': True, 'stats': all_rate_limiter_stats()}, 200
+
+@text_analysis_ns.route('/deployments')
+class DeploymentStats(Resource):
+    """Azure OpenAI部署状态接口"""
+    
+    @require_auth
+    @text_analysis_ns.doc(
+        'deployment_stats',
+        description='查看各Azure OpenAI部署的健康状态、进行中请求数、延迟(EWMA)和错误统计',
+        responses={
+            200: '获取成功',
+            401: '未授权访问'
+        },
+        security='Bearer Auth'
+    )
+    def get(self):
+        """获取各Azure OpenAI部署的运行统计"""
+        router = get_deployment_router()
+        return {
+            'success': True,
+            'strategy': router.strategy,
+            'deployments': router.stats()
+        }, 200
+
 # 登录接口
 @auth_ns.route('/login')
 class Login(Resource):
@@ -269,7 +781,7 @@ class ImageOCR(Resource):
     """图片文字识别接口"""
     
     @require_auth
-    @text_analysis_ns.marshal_with(ocr_result_model)
+    @_marshal_with(ocr_result_model)
     @text_analysis_ns.doc(
         'extract_text_from_image',
         description='从上传的图片中提取英文文章内容',
@@ -277,6 +789,7 @@ class ImageOCR(Resource):
             200: '识别成功',
             400: '请求参数错误',
             401: '未授权访问',
+            413: '上传文件过大',
             500: '服务器内部错误'
         },
         security='Bearer Auth'
@@ -284,11 +797,14 @@ class ImageOCR(Resource):
     def post(self):
         """
         从图片中提取英文文本
-        上传图片文件，使用AI识别其中的英文文章内容
+        上传一张或多张图片（多个 image 字段，按页码顺序），使用AI识别其中的英文文章内容；
+        多页并发识别后按顺序合并，analyze=true 时直接分析合并后的文本
         """
         try:
-            # 检查是否有文件上传
-            if 'image' not in request.files:
+            # 检查是否有文件上传（首次访问时解析multipart请求体）
+            with tracing.span('parse_body'):
+                files = request.files.getlist('image')
+            if not files:
                 logger.warning("未找到上传的图片文件")
                 return {
                     'success': False,
@@ -297,66 +813,85 @@ class ImageOCR(Resource):
                     'tokens_used': 0
                 }, 400
             
-            file = request.files['image']
-            
-            # 检查文件是否为空
-            if file.filename == '':
-                logger.warning("上传的文件名为空")
+            if len(files) > Config.OCR_MAX_PAGES:
                 return {
                     'success': False,
-                    'error': '请选择要上传的图片文件',
+                    'error': f'单次最多上传{Config.OCR_MAX_PAGES}张图片',
                     'extracted_text': None,
                     'tokens_used': 0
                 }, 400
             
-            # 检查文件类型
-            allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
-            file_extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+            images = []
+            with tracing.span('validate', pages=len(files)):
+                for file in files:
+                    image, error_msg = _open_image_file(file)
+                    if error_msg:
+                        return {
+                            'success': False,
+                            'error': error_msg if len(files) == 1 else f'第{len(images) + 1}张图片: {error_msg}',
+                            'extracted_text': None,
+                            'tokens_used': 0
+                        }, 400
+                    images.append(image)
             
-            if file_extension not in allowed_extensions:
-                logger.warning(f"不支持的文件类型: {file_extension}")
-                return {
-                    'success': False,
-                    'error': f'不支持的图片格式。支持的格式: {", ".join(allowed_extensions)}',
-                    'extracted_text': None,
-                    'tokens_used': 0
-                }, 400
+            analyze = request.form.get('analyze', '').lower() in ('true', '1')
+            logger.info(f"开始处理图片OCR，共{len(images)}张，总大小: {sum(image_source_size(i) for i in images)} bytes")
             
-            # 检查文件大小（限制为10MB）
-            file_data = file.read()
-            if len(file_data) > 10 * 1024 * 1024:  # 10MB
-                logger.warning(f"文件过大: {len(file_data)} bytes")
+            # 异步提交：立即返回任务ID，由后台worker执行识别
+            if request.form.get('async', '').lower() in ('true', '1'):
+                callback_url = request.form.get('callback_url')
+                if callback_url and not _is_valid_callback_url(callback_url):
+                    return {
+                        'success': False,
+                        'error': 'callback_url必须是公网http(s)地址',
+                        'extracted_text': None,
+                        'tokens_used': 0
+                    }, 400
+                with tracing.span('enqueue'):
+                    job_id = get_job_queue().enqueue(
+                        'ocr',
+                        payload={'analyze': analyze},
+                        files=images,
+                        callback_url=callback_url
+                    )
                 return {
-                    'success': False,
-                    'error': '图片文件大小不能超过10MB',
+                    'success': True,
+                    'job_id': job_id,
+                    'status': 'queued',
                     'extracted_text': None,
                     'tokens_used': 0
-                }, 400
-            
-            logger.info(f"开始处理图片OCR，文件大小: {len(file_data)} bytes，类型: {file_extension}")
+                }, 202
             
-            # 调用OpenAI服务进行图片文字识别
-            openai_service = OpenAIService()
-            result = openai_service.extract_text_from_image(file_data)
+            # 调用OCR服务进行图片文字识别（多页并发）
+            ocr_service = OCRService()
+            if analyze:
+                result = ocr_service.extract_and_analyze(images)
+            else:
+                result = ocr_service.extract_pages(images)
             
-            if result and result.get('success'):
+            if result.get('success'):
                 logger.info("图片文字识别成功")
-                return {
-                    'success': True,
-                    'extracted_text': result.get('extracted_text'),
-                    'tokens_used': result.get('tokens_used', 0),
-                    'error': None
-                }, 200
+                return {**result, 'error': None}, 200
             else:
-                error_msg = result.get('error', '图片识别失败') if result else '图片识别失败'
+                error_msg = result.get('error') or '图片识别失败'
                 logger.error(f"图片文字识别失败: {error_msg}")
                 return {
+                    **result,
                     'success': False,
                     'error': error_msg,
-                    'extracted_text': None,
-                    'tokens_used': 0
+                    'extracted_text': result.get('extracted_text'),
+                    'tokens_used': result.get('tokens_used', 0)
                 }, 400
                 
+        except RequestEntityTooLarge as e:
+            # 上传过程中超过单文件或整个请求的大小上限
+            logger.warning(f"上传内容过大: {str(e)}")
+            return {
+                'success': False,
+                'error': _file_too_large_message() if isinstance(e, FileTooLarge) else '上传内容过大',
+                'extracted_text': None,
+                'tokens_used': 0
+            }, 413
         except Exception as e:
             logger.error(f"图片OCR处理异常: {str(e)}")
             return {
@@ -364,4 +899,58 @@ class ImageOCR(Resource):
                 'error': f'图片处理失败: {str(e)}',
                 'extracted_text': None,
                 'tokens_used': 0
-            }, 500 
\ No newline at end of file
+            }, 500
+
+
+def _open_image_file(file: FileStorage):
+    """
+    校验上传的图片文件，返回其数据流（不把文件读入内存）
+    
+    Args:
+        file (FileStorage): 上传的文件
+        
+    Returns:
+        tuple: (图片数据流, 错误信息)
+    """
+    error_msg = _check_image_file(file.filename, file.stream)
+    if error_msg:
+        return None, error_msg
+    return file.stream, None
+
+
+def _check_image_file(filename: str, stream) -> Optional[str]:
+    """
+    校验上传图片的文件名和大小
+    
+    Args:
+        filename (str): 上传的文件名
+        stream: 可seek的文件数据流
+        
+    Returns:
+        str: 错误信息，校验通过时为None
+    """
+    # 检查文件是否为空
+    if not filename:
+        logger.warning("上传的文件名为空")
+        return '请选择要上传的图片文件'
+    
+    # 检查文件类型
+    allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
+    file_extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    
+    if file_extension not in allowed_extensions:
+        logger.warning(f"不支持的文件类型: {file_extension}")
+        return f'不支持的图片格式。支持的格式: {", ".join(allowed_extensions)}'
+    
+    # 检查文件大小（接收时已按UPLOAD_MAX_FILE_SIZE截断，这里通过seek获取大小）
+    file_size = image_source_size(stream)
+    if file_size > Config.UPLOAD_MAX_FILE_SIZE:
+        logger.warning(f"文件过大: {file_size} bytes")
+        return _file_too_large_message()
+    
+    return None
+
+
+def _file_too_large_message() -> str:
+    """上传文件超过大小上限时的错误信息"""
+    return f'图片文件大小不能超过{Config.UPLOAD_MAX_FILE_SIZE // (1024 * 1024)}MB'
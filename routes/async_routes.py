@@ -0,0 +1,281 @@
+"""
+文本分析、图片OCR和连接测试接口的异步版本（Starlette，供 asgi.py 使用）
+
+请求参数、响应格式和状态码与 routes/api_routes.py 中的同名接口一致；
+等待Azure OpenAI期间只挂起协程、不占用线程，一个进程可以同时处理数百个进行中的分析请求
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from functools import wraps
+from time import perf_counter
+from typing import Any, Dict
+from flask_restx import marshal
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from config import Config
+from services.analysis_service import AnalysisService
+from services.async_openai_service import AsyncOpenAIService
+from services.auth_service import get_token_verifier
+from services.image_service import image_source_size
+from services.job_queue import get_job_queue
+from services.metrics import ERRORS, HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT
+from services import tracing
+from services.ocr_service import OCRService
+from routes.api_routes import (
+    analysis_result_model, ocr_result_model,
+    _validate_text_request, _is_valid_callback_url, _check_image_file, _file_too_large_message
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _json(data: Dict[str, Any], status: int = 200, model=None) -> JSONResponse:
+    """生成JSON响应（指定model时与Flask-RESTX的marshal_with输出一致）"""
+    with tracing.span('marshal'):
+        response = JSONResponse(marshal(data, model) if model is not None else data, status_code=status)
+    # 与Flask-CORS配置（/api/* 允许所有来源）一致；预检请求仍由Flask应用处理
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+def _add_trace(root: tracing.Span, response: JSONResponse):
+    """添加Server-Timing响应头，调试请求在JSON响应中附加 trace 字段（与Flask接口相同）"""
+    response.headers['Server-Timing'] = tracing.server_timing(root)
+    if root.trace.debug:
+        data = json.loads(response.body)
+        if isinstance(data, dict):
+            data['trace'] = tracing.debug_info(root)
+            response.body = response.render(data)
+            response.headers['content-length'] = str(len(response.body))
+
+
+def _instrumented(route: str, handler):
+    """记录请求耗时、进行中请求数和各阶段耗时（与Flask接口的指标和追踪相同，路由标签为接口路径）"""
+    @wraps(handler)
+    async def timed_handler(request: Request):
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        start = perf_counter()
+        status = 500
+        error = None
+        root = tracing.start_request(
+            f"{request.method} {route}",
+            request.headers.get('traceparent'),
+            tracing.is_debug_request(request.headers),
+            **{'http.method': request.method, 'http.route': route}
+        )
+        try:
+            response = await handler(request)
+            status = response.status_code
+            if root is not None:
+                _add_trace(root, response)
+            return response
+        except Exception as e:
+            error = e
+            ERRORS.labels('http', type(e).__name__).inc()
+            raise
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_DURATION.labels(request.method, route, status).observe(perf_counter() - start)
+            tracing.finish_request(root, status, error)
+
+    return timed_handler
+
+
+def require_auth_async(handler):
+    """
+    需要认证的装饰器（require_auth 的异步版本，共享已验证token缓存）
+    """
+    @wraps(handler)
+    async def decorated_handler(request: Request):
+        auth_header = request.headers.get('Authorization')
+
+        if not auth_header:
+            return _json({'success': False, 'error': '缺少认证头'}, 401)
+
+        try:
+            if not auth_header.startswith('Bearer '):
+                return _json({'success': False, 'error': '认证头格式错误'}, 401)
+
+            with tracing.span('auth'):
+                payload = get_token_verifier().verify(auth_header[7:])
+
+            if not payload:
+                return _json({'success': False, 'error': 'Token无效或已过期'}, 401)
+
+            request.state.current_user = payload
+
+        except Exception as e:
+            logger.error(f"认证验证失败: {str(e)}")
+            return _json({'success': False, 'error': '认证验证失败'}, 401)
+
+        return await handler(request)
+
+    return decorated_handler
+
+
+@require_auth_async
+async def analyze_text(request: Request) -> JSONResponse:
+    """分析英文文本并生成思维导图结构数据（POST /api/analyze/text）"""
+    try:
+        with tracing.span('parse_body'):
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+        with tracing.span('validate'):
+            text, error_msg = _validate_text_request(data)
+        if error_msg:
+            return _json({'success': False, 'error': error_msg}, 400, analysis_result_model)
+
+        # 异步提交：立即返回任务ID，由后台worker执行分析
+        if data.get('async'):
+            callback_url = data.get('callback_url')
+            if callback_url and not await asyncio.to_thread(_is_valid_callback_url, callback_url):
+                return _json({
+                    'success': False,
+                    'error': 'callback_url must be a public http(s) URL'
+                }, 400, analysis_result_model)
+            with tracing.span('enqueue'):
+                job_id = await asyncio.to_thread(
+                    get_job_queue().enqueue, 'analyze_text', {'text': text}, callback_url=callback_url
+                )
+            return _json({'success': True, 'job_id': job_id, 'status': 'queued'}, 202, analysis_result_model)
+
+        result = await AnalysisService().analyze_async(text)
+        return _json(result, 200 if result['success'] else 500, analysis_result_model)
+
+    except Exception as e:
+        logger.error(f"API processing failed: {str(e)}")
+        return _json({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }, 500, analysis_result_model)
+
+
+def _ocr_error(error: str, status: int) -> JSONResponse:
+    """OCR接口的错误响应"""
+    return _json({'success': False, 'error': error, 'extracted_text': None, 'tokens_used': 0},
+                 status, ocr_result_model)
+
+
+@require_auth_async
+async def extract_text_from_image(request: Request) -> JSONResponse:
+    """
+    从上传的一张或多张图片中提取英文文本（POST /api/analyze/ocr）
+
+    上传的文件由multipart解析器按块写入临时文件，大文件不会整体读入内存
+    """
+    # 请求体大小在接收前按Content-Length检查（nginx转发时总会带上）
+    content_length = request.headers.get('content-length')
+    if content_length is None:
+        return _ocr_error('缺少Content-Length请求头', 411)
+    if not content_length.isdigit() or int(content_length) > Config.MAX_CONTENT_LENGTH:
+        return _ocr_error('上传内容过大', 413)
+
+    try:
+        with tracing.span('parse_body'):
+            form = await request.form(max_files=Config.OCR_MAX_PAGES + 1)
+    except HTTPException as e:
+        return _ocr_error(e.detail, 400)
+
+    try:
+        files = [file for file in form.getlist('image') if isinstance(file, UploadFile)]
+        if not files:
+            logger.warning("未找到上传的图片文件")
+            return _ocr_error('请上传图片文件', 400)
+
+        if len(files) > Config.OCR_MAX_PAGES:
+            return _ocr_error(f'单次最多上传{Config.OCR_MAX_PAGES}张图片', 400)
+
+        images = []
+        with tracing.span('validate', pages=len(files)):
+            for file in files:
+                # 与Flask接口接收时中止超限文件一致，返回413
+                if file.size is not None and file.size > Config.UPLOAD_MAX_FILE_SIZE:
+                    return _ocr_error(_file_too_large_message(), 413)
+                error_msg = _check_image_file(file.filename, file.file)
+                if error_msg:
+                    return _ocr_error(error_msg if len(files) == 1 else f'第{len(images) + 1}张图片: {error_msg}', 400)
+                images.append(file.file)
+
+        analyze = str(form.get('analyze', '')).lower() in ('true', '1')
+        logger.info(f"开始处理图片OCR，共{len(images)}张，总大小: {sum(image_source_size(i) for i in images)} bytes")
+
+        # 异步提交：立即返回任务ID，由后台worker执行识别
+        if str(form.get('async', '')).lower() in ('true', '1'):
+            callback_url = form.get('callback_url')
+            if callback_url and not await asyncio.to_thread(_is_valid_callback_url, str(callback_url)):
+                return _ocr_error('callback_url必须是公网http(s)地址', 400)
+            with tracing.span('enqueue'):
+                job_id = await asyncio.to_thread(
+                    get_job_queue().enqueue, 'ocr', payload={'analyze': analyze}, files=images,
+                    callback_url=callback_url
+                )
+            return _json({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'extracted_text': None,
+                'tokens_used': 0
+            }, 202, ocr_result_model)
+
+        ocr_service = OCRService()
+        if analyze:
+            result = await ocr_service.extract_and_analyze_async(images)
+        else:
+            result = await ocr_service.extract_pages_async(images)
+
+        if result.get('success'):
+            logger.info("图片文字识别成功")
+            return _json({**result, 'error': None}, 200, ocr_result_model)
+
+        error_msg = result.get('error') or '图片识别失败'
+        logger.error(f"图片文字识别失败: {error_msg}")
+        return _json({
+            **result,
+            'success': False,
+            'error': error_msg,
+            'extracted_text': result.get('extracted_text'),
+            'tokens_used': result.get('tokens_used', 0)
+        }, 400, ocr_result_model)
+
+    except Exception as e:
+        logger.error(f"图片OCR处理异常: {str(e)}")
+        return _ocr_error(f'图片处理失败: {str(e)}', 500)
+    finally:
+        await form.close()
+
+
+async def test_connection(request: Request) -> JSONResponse:
+    """测试Azure OpenAI服务连接（GET /api/analyze/test）"""
+    try:
+        result = await AsyncOpenAIService().test_connection()
+
+        if result['success']:
+            return _json({
+                'success': True,
+                'message': result['message'],
+                'model': result['model'],
+                'timestamp': str(datetime.now())
+            })
+        return _json({'success': False, 'error': result['error']}, 500)
+
+    except Exception as e:
+        return _json({'success': False, 'error': str(e)}, 500)
+
+
+# 路径与Flask-RESTX接口相同；在 asgi.py 中排在Flask应用之前，其余方法（如CORS预检）仍交给Flask处理
+routes = [
+    Route(path, _instrumented(path, handler), methods=methods)
+    for path, handler, methods in (
+        ('/api/analyze/text', analyze_text, ['POST']),
+        ('/api/analyze/ocr', extract_text_from_image, ['POST']),
+        ('/api/analyze/test', test_connection, ['GET']),
+    )
+]
@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from config import Config
+from utils.helpers import generate_file_hash, normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """
+    文本分析结果缓存
+
+    两级缓存: 内存LRU层 + 磁盘层（UPLOAD_FOLDER下的JSON文件），
+    均支持TTL过期；内存层按条目数淘汰，磁盘层按总字节数淘汰最久未使用的条目。
+    磁盘文件的读写不持有锁（写入临时文件后原子替换），锁只保护内存中的索引
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 512, ttl_seconds: int = 7 * 24 * 3600,
+                 max_disk_bytes: int = 200 * 1024 * 1024):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir (str): 磁盘缓存目录
+            max_entries (int): 内存层最大条目数
+            ttl_seconds (int): 条目有效期（秒）
+            max_disk_bytes (int): 磁盘层最大总字节数
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._disk_index = None  # key -> size，按最近使用顺序排列（最旧的在前），首次访问磁盘时懒加载
+        self._disk_bytes = 0
+
+        self._hits_memory = 0
+        self._hits_disk = 0
+        self._misses = 0
+        self._sets = 0
+        self._evictions = 0
+
+    @staticmethod
+    def make_key(text: str, deployment_name: str, prompt_version: str) -> str:
+        """
+        生成缓存键: 规范化文本哈希 + 部署名 + 提示词版本
+
+        Args:
+            text (str): 原始文本
+            deployment_name (str): 模型部署名
+            prompt_version (str): 提示词版本
+
+        Returns:
+            str: 缓存键
+        """
+        text_hash = generate_file_hash(normalize_text(text))
+        return generate_file_hash(f"{deployment_name}|{prompt_version}|{text_hash}")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_disk_index(self):
+        """扫描磁盘目录，建立条目索引（调用方需持有锁）"""
+        if self._disk_index is not None:
+            return
+        self._disk_index = OrderedDict()
+        self._disk_bytes = 0
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            return
+        # 启动时按修改时间排出初始顺序，之后按读写顺序维护
+        found = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        for _, key, size in sorted(found):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+
+    def _remove_disk_entry(self, key: str):
+        """删除磁盘条目（调用方需持有锁）"""
+        size = self._disk_index.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        """淘汰最久未使用的磁盘条目，直到总大小不超过上限（调用方需持有锁）"""
+        while self._disk_bytes > self.max_disk_bytes and self._disk_index:
+            key = next(iter(self._disk_index))
+            self._remove_disk_entry(key)
+            self._evictions += 1
+
+    def _touch_disk(self, key: str):
+        """把磁盘条目标记为最近使用（调用方需持有锁）"""
+        if self._disk_index is not None and key in self._disk_index:
+            self._disk_index.move_to_end(key)
+
+    def _remember(self, key: str, expires_at: float, value: Dict[str, Any]):
+        """写入内存LRU层（调用方需持有锁）"""
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            Dict: 缓存的结果，未命中或已过期返回None
+        """
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._memory.move_to_end(key)
+                    self._touch_disk(key)
+                    self._hits_memory += 1
+                    return item[1]
+                del self._memory[key]
+
+            self._load_disk_index()
+            if key not in self._disk_index:
+                self._misses += 1
+                return None
+
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取分析缓存失败: {str(e)}")
+            record = None
+
+        with self._lock:
+            if record is None or record.get('expires_at', 0) <= now:
+                self._remove_disk_entry(key)
+                self._misses += 1
+                return None
+
+            self._remember(key, record['expires_at'], record['value'])
+            self._touch_disk(key)
+            self._hits_disk += 1
+            return record['value']
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """
+        写入缓存（同时写入内存层和磁盘层）
+
+        Args:
+            key (str): 缓存键
+            value (Dict): 要缓存的结果
+        """
+        expires_at = time.time() + self.ttl_seconds
+        data = json.dumps({'expires_at': expires_at, 'value': value}, ensure_ascii=False).encode('utf-8')
+
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self._sets += 1
+            self._load_disk_index()
+
+        # 写入临时文件后原子替换，读取方不会看到写了一半的文件
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入分析缓存失败: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            old = self._disk_index.pop(key, None)
+            if old is not None:
+                self._disk_bytes -= old
+            self._disk_index[key] = len(data)
+            self._disk_bytes += len(data)
+            self._evict_disk()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        with self._lock:
+            hits = self._hits_memory + self._hits_disk
+            total = hits + self._misses
+            return {
+                'hits': hits,
+                'hits_memory': self._hits_memory,
+                'hits_disk': self._hits_disk,
+                'misses': self._misses,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+                'sets': self._sets,
+                'evictions': self._evictions,
+                'memory_entries': len(self._memory),
+                'disk_entries': len(self._disk_index) if self._disk_index is not None else None,
+                'disk_bytes': self._disk_bytes if self._disk_index is not None else None
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：丢弃从父进程继承的缓存实例，下次使用时重新创建"""
+    global _cache, _cache_lock
+    _cache = None
+    _cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """
+    获取进程级共享的分析结果缓存
+
+    Returns:
+        AnalysisCache: 缓存实例，未启用缓存时返回None
+    """
+    global _cache
+    if not Config.ANALYSIS_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnalysisCache(
+                    cache_dir=os.path.join(Config.UPLOAD_FOLDER, 'analysis_cache'),
+                    max_entries=Config.ANALYSIS_CACHE_MAX_ENTRIES,
+                    ttl_seconds=Config.ANALYSIS_CACHE_TTL,
+                    max_disk_bytes=Config.ANALYSIS_CACHE_MAX_DISK_BYTES
+                )
+    return _cache
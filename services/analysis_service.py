@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from config import Config
+from utils.helpers import generate_file_hash, normalize_text
+from services.openai_service import OpenAIService, ANALYSIS_PROMPT_VERSION
+from services.async_openai_service import AsyncOpenAIService
+from services.xmind_service import XMindService, MarkdownStructureParser
+from services.analysis_cache import AnalysisCache, get_analysis_cache
+from services.rate_limiter import PRIORITY_INTERACTIVE
+from services.single_flight import AsyncSingleFlight, SingleFlight
+from services import tracing
+
+logger = logging.getLogger(__name__)
+
+# 进程级批量分析线程池，所有批量请求共享，限制对Azure的总并发
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+# 进程级请求合并器：相同文本的并发分析只执行一次（含调用模型、解析结构和写入缓存）
+_analysis_flight = SingleFlight('analysis')
+_async_analysis_flight = AsyncSingleFlight('analysis_async')
+
+
+def _get_batch_executor() -> ThreadPoolExecutor:
+    """获取共享的批量分析线程池"""
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(
+                    max_workers=Config.BATCH_MAX_WORKERS,
+                    thread_name_prefix='batch-analysis'
+                )
+    return _batch_executor
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：父进程线程池的线程不会被复制到子进程，丢弃后下次使用时重新创建"""
+    global _batch_executor, _batch_executor_lock, _analysis_flight, _async_analysis_flight
+    _batch_executor = None
+    _batch_executor_lock = threading.Lock()
+    _analysis_flight = SingleFlight('analysis')
+    _async_analysis_flight = AsyncSingleFlight('analysis_async')
+
+
+class AnalysisService:
+    """文本分析流程服务：缓存查询 -> Azure OpenAI分析 -> 思维导图结构解析 -> 写入缓存"""
+
+    def __init__(self, priority: int = PRIORITY_INTERACTIVE):
+        """
+        初始化依赖的服务
+
+        Args:
+            priority (int): Azure OpenAI调用优先级
+        """
+        self.priority = priority
+        self.openai_service = OpenAIService(priority)
+        self._async_openai_service = None
+        self.xmind_service = XMindService()
+        self.cache = get_analysis_cache()
+
+    @property
+    def async_openai_service(self) -> AsyncOpenAIService:
+        """异步Azure OpenAI服务，首次走异步路径时才创建（同步请求用不到）"""
+        if self._async_openai_service is None:
+            self._async_openai_service = AsyncOpenAIService(self.priority)
+        return self._async_openai_service
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        """
+        分析英文文本并生成思维导图结构数据
+
+        相同文本的并发请求合并为一次分析，由执行分析的请求写入一次缓存
+
+        Args:
+            text (str): 已校验的英文文本
+
+        Returns:
+            Dict: 成功时包含 analysis、mindmap_data、tokens_used、cached、cache_key（未启用缓存时为None）；
+                  失败时包含 error（思维导图解析失败时同时包含 analysis）
+        """
+        cache_key, cached_result = self._lookup(text)
+        if cached_result:
+            return cached_result
+
+        try:
+            result = _analysis_flight.do(
+                self._flight_key(text, cache_key),
+                lambda: self._analyze_uncached(text, cache_key),
+                timeout=Config.SINGLE_FLIGHT_TIMEOUT
+            )
+        except Exception as e:
+            logger.error(f"文本分析失败: {str(e)}")
+            return {'success': False, 'error': f'Text analysis failed: {str(e)}'}
+        return dict(result)
+
+    def _analyze_uncached(self, text: str, cache_key: Optional[str]) -> Dict[str, Any]:
+        """合并请求中实际执行的分析：先再查一次缓存（上一次合并的分析可能刚写入），未命中时调用模型"""
+        cached_result = self._get_cached(cache_key)
+        if cached_result:
+            return cached_result
+
+        # 调用OpenAI分析文本
+        logger.info(f"Starting text analysis, length: {len(text)}")
+        analysis_result = self.openai_service.analyze_text(text)
+        return self._complete(analysis_result, cache_key)
+
+    async def analyze_async(self, text: str) -> Dict[str, Any]:
+        """
+        analyze 的协程版本：等待Azure OpenAI期间不占用线程，
+        读写缓存和解析思维导图结构在线程池中执行
+
+        Args:
+            text (str): 已校验的英文文本
+
+        Returns:
+            Dict: 与 analyze 相同
+        """
+        cache_key, cached_result = await asyncio.to_thread(self._lookup, text)
+        if cached_result:
+            return cached_result
+
+        try:
+            result = await _async_analysis_flight.do(
+                self._flight_key(text, cache_key),
+                lambda: self._analyze_uncached_async(text, cache_key),
+                timeout=Config.SINGLE_FLIGHT_TIMEOUT
+            )
+        except Exception as e:
+            logger.error(f"文本分析失败: {str(e)}")
+            return {'success': False, 'error': f'Text analysis failed: {str(e)}'}
+        return dict(result)
+
+    async def _analyze_uncached_async(self, text: str, cache_key: Optional[str]) -> Dict[str, Any]:
+        """_analyze_uncached 的协程版本"""
+        cached_result = await asyncio.to_thread(self._get_cached, cache_key)
+        if cached_result:
+            return cached_result
+
+        logger.info(f"Starting async text analysis, length: {len(text)}")
+        analysis_result = await self.async_openai_service.analyze_text(text)
+        return await asyncio.to_thread(self._complete, analysis_result, cache_key)
+
+    @staticmethod
+    def _flight_key(text: str, cache_key: Optional[str]) -> str:
+        """请求合并的键（与缓存键相同，未启用缓存时单独计算）"""
+        return cache_key or AnalysisCache.make_key(text, Config.AZURE_DEPLOYMENT_NAME, ANALYSIS_PROMPT_VERSION)
+
+    def _lookup(self, text: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        查询分析结果缓存
+
+        Returns:
+            Tuple: (缓存键（未启用缓存时为None）, 命中时的分析结果)
+        """
+        if not self.cache:
+            return None, None
+        with tracing.span('cache_lookup') as stage:
+            cache_key = AnalysisCache.make_key(text, Config.AZURE_DEPLOYMENT_NAME, ANALYSIS_PROMPT_VERSION)
+            cached_result = self._get_cached(cache_key)
+            stage.set_attribute('hit', bool(cached_result))
+        return cache_key, cached_result
+
+    def _get_cached(self, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """读取缓存的分析结果，未启用缓存或未命中时返回None"""
+        if not cache_key:
+            return None
+        cached_result = self.cache.get(cache_key)
+        if not cached_result:
+            return None
+        logger.info(f"Analysis cache hit: {cache_key}")
+        return {
+            'success': True,
+            'analysis': cached_result['analysis'],
+            'mindmap_data': cached_result['mindmap_data'],
+            'tokens_used': cached_result.get('tokens_used', 0),
+            'cached': True,
+            'cache_key': cache_key
+        }
+
+    def _complete(self, analysis_result: Dict[str, Any], cache_key: Optional[str]) -> Dict[str, Any]:
+        """
+        根据模型的分析结果生成思维导图结构数据并写入缓存
+
+        Args:
+            analysis_result (Dict): OpenAIService.analyze_text 的结果
+            cache_key (str): 缓存键，未启用缓存时为None
+
+        Returns:
+            Dict: 与 analyze 相同
+        """
+        if not analysis_result['success']:
+            return {
+                'success': False,
+                'error': f'Text analysis failed: {analysis_result["error"]}'
+            }
+
+        # 生成思维导图结构数据
+        logger.info("Generating mindmap structure data")
+        logger.info(f"Analysis result length: {len(analysis_result.get('analysis', ''))}")
+
+        try:
+            # 只解析结构，不生成文件
+            with tracing.span('mindmap_parse'):
+                mindmap_data = self.xmind_service.parse_markdown_to_structure(
+                    analysis_result['analysis']
+                )
+            logger.info(f"Mindmap structure generated successfully")
+
+        except Exception as e:
+            logger.error(f"Exception during mindmap structure generation: {str(e)}")
+            logger.error(f"Full traceback: {traceback.format_exc()}")
+            return {
+                'success': False,
+                'analysis': analysis_result['analysis'],
+                'error': f'Mindmap structure generation exception: {str(e)}'
+            }
+
+        return self._store(cache_key, analysis_result['analysis'], mindmap_data,
+                           analysis_result.get('tokens_used', 0))
+
+    def _store(self, cache_key: Optional[str], analysis: str, mindmap_data: Dict[str, Any],
+               tokens_used: int) -> Dict[str, Any]:
+        """写入缓存并返回与 analyze 相同格式的成功结果"""
+        result = {
+            'analysis': analysis,
+            'mindmap_data': mindmap_data,
+            'tokens_used': tokens_used
+        }
+        if self.cache:
+            with tracing.span('cache_store'):
+                self.cache.set(cache_key, result)
+
+        return {
+            'success': True,
+            **result,
+            'cached': False,
+            'cache_key': cache_key
+        }
+
+    def analyze_stream(self, text: str) -> Iterator[Dict[str, Any]]:
+        """
+        流式分析英文文本：边接收模型输出边增量解析思维导图结构（缓存与 analyze 共用）
+
+        Args:
+            text (str): 已校验的英文文本
+
+        Yields:
+            Dict: {'type': 'delta', 'content': 增量文本}，
+                  每完成一个章节 {'type': 'section', 'index': 序号, 'section': 章节节点}，
+                  结束时 {'type': 'done', 'result': 与 analyze 相同的成功结果}，
+                  失败时 {'type': 'error', 'error': 错误信息}
+        """
+        cache_key, cached_result = self._lookup(text)
+        if cached_result:
+            yield {'type': 'done', 'result': cached_result}
+            return
+
+        parser = MarkdownStructureParser()
+        for event in self.openai_service.stream_analyze_text(text):
+            if event['type'] == 'delta':
+                yield event
+                parse_events = parser.feed(event['content'])
+            elif event['type'] == 'done':
+                parse_events = parser.close()
+            else:
+                yield {'type': 'error', 'error': f'Text analysis failed: {event["error"]}'}
+                return
+
+            for parse_event in parse_events:
+                if parse_event['type'] == 'section_end':
+                    yield {'type': 'section', 'index': parse_event['index'], 'section': parse_event['section']}
+
+            if event['type'] == 'done':
+                yield {'type': 'done', 'result': self._store(
+                    cache_key, event['analysis'], parser.structure, event['tokens_used'])}
+
+    def analyze_batch(self, texts: List[str]) -> Iterator[Tuple[List[int], Dict[str, Any]]]:
+        """
+        并发分析多篇文本，按完成顺序返回结果
+
+        规范化后相同的文本只分析一次，结果共享给所有相同文本的位置
+
+        Args:
+            texts (List[str]): 已校验的英文文本列表
+
+        Yields:
+            Tuple: (该结果对应的文本序号列表, 分析结果)
+        """
+        groups: Dict[str, List[int]] = {}
+        unique_texts: Dict[str, str] = {}
+        for index, text in enumerate(texts):
+            key = generate_file_hash(normalize_text(text))
+            groups.setdefault(key, []).append(index)
+            unique_texts.setdefault(key, text)
+
+        logger.info(f"Starting batch analysis: {len(texts)} texts, {len(unique_texts)} unique")
+
+        executor = _get_batch_executor()
+        futures = {executor.submit(tracing.bind(self.analyze), text): key for key, text in unique_texts.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"批量分析单篇文本失败: {str(e)}")
+                result = {'success': False, 'error': str(e)}
+            yield groups[key], result
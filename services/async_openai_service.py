@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from config import Config
+from services.openai_client_pool import get_async_openai_client
+from services.deployment_router import get_deployment_router
+from services.single_flight import AsyncSingleFlight
+from services.rate_limiter import get_rate_limiter, estimate_tokens, RateLimitTimeout, PRIORITY_INTERACTIVE
+from services.image_service import ImageService, ImageSource, hash_image_source
+from services.ocr_cache import get_ocr_cache
+from services.metrics import AzureCall
+from services import tracing
+from services.openai_service import (
+    OpenAIService, OCR_PROMPT_VERSION, OCR_SYSTEM_PROMPT, OCR_USER_PROMPT,
+    _FAILOVER_ERRORS
+)
+
+logger = logging.getLogger(__name__)
+
+# 进程级请求合并器（事件循环内）：相同输入的并发请求只调用一次Azure
+_ocr_flight = AsyncSingleFlight('extract_text_from_image_async')
+
+# 每个部署的上游并发信号量：部署名 -> BoundedSemaphore
+_upstream_semaphores: Dict[str, asyncio.BoundedSemaphore] = {}
+
+
+def _get_upstream_semaphore(name: str) -> asyncio.BoundedSemaphore:
+    """获取部署的上游并发信号量（在事件循环中创建，限制同时进行的Azure OpenAI请求数）"""
+    semaphore = _upstream_semaphores.get(name)
+    if semaphore is None:
+        semaphore = asyncio.BoundedSemaphore(Config.ASYNC_AZURE_CONCURRENCY)
+        _upstream_semaphores[name] = semaphore
+    return semaphore
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：信号量和进行中的调用属于父进程的事件循环，丢弃后重新创建"""
+    global _ocr_flight, _upstream_semaphores
+    _ocr_flight = AsyncSingleFlight('extract_text_from_image_async')
+    _upstream_semaphores = {}
+
+
+class AsyncOpenAIService:
+    """
+    Azure OpenAI服务类的异步版本（基于AsyncAzureOpenAI，供ASGI入口使用）
+
+    与 OpenAIService 共用部署路由、调用调度器、OCR缓存和提示词；
+    等待配额、退避重试和上游请求期间只挂起协程，不占用线程，
+    图片预处理等CPU密集的步骤放到线程池中执行
+    """
+
+    def __init__(self, priority: int = PRIORITY_INTERACTIVE):
+        """
+        初始化异步Azure OpenAI服务
+
+        Args:
+            priority (int): 调用优先级，交互式请求优先于批量/后台任务获得配额
+        """
+        self.router = get_deployment_router()
+        self.deployment_name = Config.AZURE_DEPLOYMENT_NAME
+        self.priority = priority
+
+    async def _create_completion(self, estimated_tokens: int, operation: str, **kwargs):
+        """
+        选择部署并通过调用调度器发起chat completions请求（不支持流式）
+
+        部署选择、故障转移和配额控制与 OpenAIService._create_completion 相同；
+        实际发出的请求数受每个部署的 ASYNC_AZURE_CONCURRENCY 信号量限制
+
+        Args:
+            estimated_tokens (int): 预估的token数
+            operation (str): 调用类型（analyze、ocr等），用于监控指标
+            **kwargs: chat.completions.create的参数（不含model）
+
+        Returns:
+            ChatCompletion: 解析后的响应
+        """
+        with tracing.span('azure', operation=operation):
+            tried = set()
+            last_error = None
+
+            while True:
+                deployment = self.router.acquire(exclude=tried)
+                if deployment is None:
+                    raise last_error
+                tried.add(deployment.name)
+
+                client = get_async_openai_client(deployment.endpoint, deployment.api_key, deployment.api_version)
+                limiter = get_rate_limiter(deployment.name, deployment.rpm_limit, deployment.tpm_limit)
+                semaphore = _get_upstream_semaphore(deployment.name)
+                max_retries = 0 if self.router.has_alternative(tried) else None
+
+                call = AzureCall(deployment.name, operation)
+
+                async def send():
+                    async with semaphore:
+                        call.begin()
+                        try:
+                            with tracing.span('azure.request', tracing.SPAN_KIND_CLIENT, deployment=deployment.name):
+                                return await client.chat.completions.with_raw_response.create(
+                                    model=deployment.deployment, **kwargs
+                                )
+                        except BaseException as e:
+                            call.fail(e)
+                            raise
+
+                start = time.monotonic()
+                try:
+                    raw = await limiter.call_async(send, estimated_tokens, self.priority, max_retries=max_retries)
+                except _FAILOVER_ERRORS as e:
+                    if isinstance(e, RateLimitTimeout):
+                        call.error(e)
+                    self.router.release(deployment, None, success=False)
+                    logger.warning(f"部署 {deployment.name} 调用失败({type(e).__name__})，尝试其他部署")
+                    last_error = e
+                    continue
+                except BaseException:
+                    # 请求本身的错误（如参数错误）或请求被取消不代表部署故障
+                    self.router.release(deployment, None, success=True)
+                    raise
+
+                self.router.release(deployment, time.monotonic() - start, success=True)
+                response = raw.parse()
+                limiter.update_from_headers(raw.headers)
+                call.finish(response.usage)
+                if response.usage:
+                    limiter.record_usage(estimated_tokens, response.usage.total_tokens)
+                return response
+
+    async def _run_single_flight(self, flight: AsyncSingleFlight, key: str,
+                                 fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        通过请求合并器执行上游调用，超时或异常统一转换为失败结果
+
+        Args:
+            flight (AsyncSingleFlight): 请求合并器
+            key (str): 输入的唯一标识
+            fn: 返回协程的上游调用
+
+        Returns:
+            Dict: 调用结果（每个调用方获得独立副本）
+        """
+        try:
+            result = await flight.do(key, fn, timeout=Config.SINGLE_FLIGHT_TIMEOUT)
+        except TimeoutError as e:
+            logger.error(f"等待合并请求结果超时: {str(e)}")
+            return {'success': False, 'error': str(e)}
+        except Exception as e:
+            logger.error(f"合并请求执行失败: {str(e)}")
+            return {'success': False, 'error': str(e)}
+        return dict(result)
+
+    async def extract_text_from_image(self, image_data: ImageSource) -> Optional[Dict[str, Any]]:
+        """
+        从图片中提取英文文章内容（OCR缓存与 OpenAIService 共享）
+
+        Args:
+            image_data (ImageSource): 图片的二进制数据或可seek的文件对象
+
+        Returns:
+            Dict: 包含提取结果的字典
+        """
+        cache = get_ocr_cache()
+        namespace = f"{self.deployment_name}|{OCR_PROMPT_VERSION}"
+        if cache:
+            def lookup():
+                sha256, phash = cache.fingerprint(image_data)
+                return sha256, phash, cache.get(namespace, sha256, phash)
+
+            # 感知哈希的近似匹配要遍历缓存条目，和计算指纹一样在线程池中执行
+            with tracing.span('ocr_cache_lookup') as stage:
+                sha256, phash, cached_result = await asyncio.to_thread(lookup)
+                stage.set_attribute('hit', bool(cached_result))
+            if cached_result:
+                logger.info(f"OCR cache hit: {sha256}")
+                return {**cached_result, 'cached': True}
+        else:
+            sha256, phash = await asyncio.to_thread(hash_image_source, image_data), None
+
+        result = await self._run_single_flight(
+            _ocr_flight, f"{namespace}|{sha256}", lambda: self._extract_text_from_image(image_data)
+        )
+        if cache and result.get('success'):
+            await asyncio.to_thread(cache.set, namespace, sha256, phash, {
+                'success': True,
+                'extracted_text': result['extracted_text'],
+                'tokens_used': result.get('tokens_used', 0)
+            })
+        result['cached'] = False
+        return result
+
+    async def _extract_text_from_image(self, image_data: ImageSource) -> Optional[Dict[str, Any]]:
+        """
+        从图片中提取英文文章内容
+
+        Args:
+            image_data (ImageSource): 图片的二进制数据或可seek的文件对象
+
+        Returns:
+            Dict: 包含提取结果的字典
+        """
+        try:
+            # 缩放、灰度化、重新压缩和base64编码都是CPU密集操作，在线程池中执行
+            with tracing.span('image_preprocess'):
+                image, messages = await asyncio.to_thread(self._prepare_ocr, image_data)
+            response = await self._create_completion(
+                estimate_tokens(OCR_SYSTEM_PROMPT + OCR_USER_PROMPT, 2000) + image['estimated_tokens'],
+                'ocr',
+                messages=messages,
+                temperature=0.1,
+                max_tokens=2000
+            )
+            return OpenAIService._parse_ocr_response(response)
+
+        except Exception as e:
+            logger.error(f"图片文字识别失败: {str(e)}")
+            return {
+                'success': False,
+                'error': f'图片识别失败: {str(e)}',
+                'extracted_text': None
+            }
+
+    @staticmethod
+    def _prepare_ocr(image_data: ImageSource):
+        """预处理图片并构建OCR对话消息"""
+        image = ImageService().preprocess(image_data)
+        return image, OpenAIService._build_ocr_messages(image)
+
+    async def analyze_text(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        分析英文文本，提取主要思想和结构
+
+        Args:
+            text (str): 需要分析的英文文本
+
+        Returns:
+            Dict: 包含分析结果的字典
+        """
+        try:
+            messages = OpenAIService._build_analysis_messages(text)
+            response = await self._create_completion(
+                estimate_tokens(messages[0]['content'] + messages[1]['content'], 2000),
+                'analyze',
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2000
+            )
+
+            return {
+                'success': True,
+                'analysis': response.choices[0].message.content,
+                'original_text': text,
+                'tokens_used': response.usage.total_tokens if response.usage else 0
+            }
+
+        except Exception as e:
+            logger.error(f"OpenAI API调用失败: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'analysis': None
+            }
+
+    async def test_connection(self) -> Dict[str, Any]:
+        """测试Azure OpenAI连接"""
+        try:
+            test_prompt = "Hello, this is a connection test."
+            await self._create_completion(
+                estimate_tokens(test_prompt, 50),
+                'test',
+                messages=[{"role": "user", "content": test_prompt}],
+                max_tokens=50
+            )
+
+            return {
+                'success': True,
+                'message': '连接测试成功',
+                'model': self.deployment_name
+            }
+        except Exception as e:
+            logger.error(f"连接测试失败: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
@@ -1,13 +1,109 @@
 import jwt
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 from functools import wraps
+from jwt.algorithms import HMACAlgorithm
 from flask import request, current_app
 from config import Config
+from services import tracing
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+class TokenVerifier:
+    """
+    JWT验证器
+
+    HMAC密钥只在创建时准备一次；验证通过的token按LRU缓存其payload，
+    缓存条目在token的exp到期时失效，同一token的后续请求不再重复计算签名
+    """
+
+    def __init__(self, secret_key: str, max_entries: int = 1024, ttl_seconds: float = 300,
+                 algorithm: str = 'HS256'):
+        """
+        初始化验证器
+
+        Args:
+            secret_key (str): 签名密钥
+            max_entries (int): 缓存的最大token数，为0时不缓存
+            ttl_seconds (float): token没有exp时的缓存时间（秒）
+            algorithm (str): 签名算法
+        """
+        self._key = HMACAlgorithm(HMACAlgorithm.SHA256).prepare_key(secret_key)
+        self._algorithms = [algorithm]
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._cache = OrderedDict()  # token -> (expires_at, payload)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        验证JWT token
+
+        Args:
+            token (str): JWT token
+
+        Returns:
+            Dict: 解码后的payload（副本，调用方可修改），验证失败返回None
+        """
+        now = time.time()
+        if self.max_entries > 0:
+            with self._lock:
+                item = self._cache.get(token)
+                if item is not None:
+                    if item[0] > now:
+                        self._cache.move_to_end(token)
+                        self._hits += 1
+                        return dict(item[1])
+                    del self._cache[token]
+                self._misses += 1
+
+        try:
+            payload = jwt.decode(token, self._key, algorithms=self._algorithms)
+        except jwt.ExpiredSignatureError:
+            logger.warning("Token已过期")
+            return None
+        except jwt.InvalidTokenError:
+            logger.warning("无效的token")
+            return None
+
+        if self.max_entries > 0:
+            exp = payload.get('exp')
+            expires_at = float(exp) if isinstance(exp, (int, float)) else now + self.ttl_seconds
+            with self._lock:
+                self._cache[token] = (expires_at, payload)
+                self._cache.move_to_end(token)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return dict(payload)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'entries': len(self._cache)}
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_token_verifier() -> TokenVerifier:
+    """获取进程级共享的JWT验证器"""
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = TokenVerifier(Config.SECRET_KEY, max_entries=Config.AUTH_TOKEN_CACHE_SIZE)
+    return _verifier
+
+
 class AuthService:
     """认证服务类"""
     
@@ -58,15 +154,7 @@ class AuthService:
         Returns:
             Dict: 解码后的payload，如果验证失败返回None
         """
-        try:
-            payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
-            return payload
-        except jwt.ExpiredSignatureError:
-            logger.warning("Token已过期")
-            return None
-        except jwt.InvalidTokenError:
-            logger.warning("无效的token")
-            return None
+        return get_token_verifier().verify(token)
     
     def login(self, username: str, password: str) -> Dict[str, Any]:
         """
@@ -109,9 +197,9 @@ def require_auth(f):
             if not auth_header.startswith('Bearer '):
                 return {'success': False, 'error': '认证头格式错误'}, 401
             
-            token = auth_header.split(' ')[1]
-            auth_service = AuthService()
-            payload = auth_service.verify_token(token)
+            token = auth_header[7:]
+            with tracing.span('auth'):
+                payload = get_token_verifier().verify(token)
             
             if not payload:
                 return {'success': False, 'error': 'Token无效或已过期'}, 401
@@ -0,0 +1,280 @@
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 路由策略
+STRATEGY_LEAST_OUTSTANDING = 'least_outstanding'
+STRATEGY_LATENCY = 'latency'
+
+
+class Deployment:
+    """一个Azure OpenAI部署（端点 + 部署名）及其运行统计"""
+
+    def __init__(self, name: str, endpoint: str, api_key: str, api_version: str, deployment: str,
+                 weight: float = 1.0, rpm_limit: int = None, tpm_limit: int = None):
+        self.name = name
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.api_version = api_version
+        self.deployment = deployment
+        self.weight = max(float(weight), 0.01)
+        self.rpm_limit = Config.AZURE_RPM_LIMIT if rpm_limit is None else int(rpm_limit)
+        self.tpm_limit = Config.AZURE_TPM_LIMIT if tpm_limit is None else int(tpm_limit)
+
+        # 运行统计（由DeploymentRouter在锁内更新）
+        self.outstanding = 0
+        self.ewma_latency = None
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.unhealthy_until = 0.0
+
+    def is_healthy(self, now: float) -> bool:
+        return self.unhealthy_until <= now
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'endpoint': self.endpoint,
+            'deployment': self.deployment,
+            'weight': self.weight,
+            'healthy': self.is_healthy(now),
+            'unhealthy_for': round(max(self.unhealthy_until - now, 0.0), 2),
+            'outstanding': self.outstanding,
+            'ewma_latency_ms': round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': round(self.errors / self.requests, 4) if self.requests else 0.0,
+            'consecutive_errors': self.consecutive_errors
+        }
+
+
+def _parse_deployment_entries(raw: str) -> List[Dict[str, Any]]:
+    """
+    解析并校验AZURE_OPENAI_DEPLOYMENTS
+
+    Args:
+        raw (str): JSON字符串
+
+    Returns:
+        List[Dict[str, Any]]: 校验后的部署配置（数值字段已转换类型）
+
+    Raises:
+        ValueError: JSON非法、不是对象数组、数值字段非法或name重复
+    """
+    entries = json.loads(raw)
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        raise ValueError('必须是JSON对象数组')
+
+    parsed = []
+    names = set()
+    for i, entry in enumerate(entries):
+        entry = dict(entry)
+        try:
+            weight = float(entry.get('weight', 1.0))
+        except (TypeError, ValueError):
+            raise ValueError(f"第{i + 1}项的weight不是数字: {entry.get('weight')!r}")
+        if not weight > 0:
+            raise ValueError(f"第{i + 1}项的weight必须大于0: {entry.get('weight')!r}")
+        entry['weight'] = weight
+        for field in ('rpm_limit', 'tpm_limit'):
+            if entry.get(field) is None:
+                continue
+            try:
+                value = int(entry[field])
+            except (TypeError, ValueError):
+                raise ValueError(f"第{i + 1}项的{field}不是整数: {entry[field]!r}")
+            if value < 0:
+                raise ValueError(f"第{i + 1}项的{field}不能为负数（0表示不限制）: {entry[field]!r}")
+            entry[field] = value
+        name = entry.get('name')
+        if name:
+            if name in names:
+                raise ValueError(f"部署名重复: {name}")
+            names.add(name)
+        parsed.append(entry)
+    return parsed
+
+
+def load_deployments() -> List[Deployment]:
+    """
+    从配置加载部署列表
+
+    AZURE_OPENAI_DEPLOYMENTS为JSON对象数组，每项可包含
+    name、endpoint、api_key、api_version、deployment、weight、rpm_limit、tpm_limit，
+    缺省字段使用单部署配置（AZURE_OPENAI_ENDPOINT等）；未配置或配置非法时只有一个默认部署
+
+    Returns:
+        List[Deployment]: 部署列表（至少包含一个部署）
+    """
+    entries = []
+    if Config.AZURE_OPENAI_DEPLOYMENTS:
+        try:
+            entries = _parse_deployment_entries(Config.AZURE_OPENAI_DEPLOYMENTS)
+        except ValueError as e:
+            logger.error(f"AZURE_OPENAI_DEPLOYMENTS配置非法，使用默认部署: {str(e)}")
+            entries = []
+    if not entries:
+        entries = [{}]
+
+    deployments = []
+    for entry in entries:
+        endpoint = entry.get('endpoint') or Config.AZURE_OPENAI_ENDPOINT
+        deployment = entry.get('deployment') or Config.AZURE_DEPLOYMENT_NAME
+        deployments.append(Deployment(
+            name=entry.get('name') or (f'{endpoint}#{deployment}' if len(entries) > 1 else 'default'),
+            endpoint=endpoint,
+            api_key=entry.get('api_key') or Config.AZURE_OPENAI_API_KEY,
+            api_version=entry.get('api_version') or Config.AZURE_API_VERSION,
+            deployment=deployment,
+            weight=entry.get('weight', 1.0),
+            rpm_limit=entry.get('rpm_limit'),
+            tpm_limit=entry.get('tpm_limit')
+        ))
+    return deployments
+
+
+class DeploymentRouter:
+    """
+    多部署负载均衡与故障转移
+
+    - least_outstanding: 选择 进行中请求数/权重 最小的部署
+    - latency: 选择 EWMA延迟 x (进行中请求数+1) / 权重 最小的部署
+    - 连续失败达到阈值的部署在冷却期内不再分配请求，冷却结束后重新尝试
+    """
+
+    def __init__(self, deployments: List[Deployment], strategy: str = STRATEGY_LEAST_OUTSTANDING,
+                 ewma_alpha: float = 0.3, unhealthy_threshold: int = 3, unhealthy_cooldown: float = 30):
+        """
+        初始化路由器
+
+        Args:
+            deployments (List[Deployment]): 部署列表
+            strategy (str): 路由策略
+            ewma_alpha (float): 延迟EWMA平滑系数
+            unhealthy_threshold (int): 标记为不健康的连续失败次数
+            unhealthy_cooldown (float): 不健康部署的冷却时间（秒）
+        """
+        self.deployments = deployments
+        self.strategy = strategy
+        self.ewma_alpha = ewma_alpha
+        self.unhealthy_threshold = unhealthy_threshold
+        self.unhealthy_cooldown = unhealthy_cooldown
+        self._lock = threading.Lock()
+
+    def _score(self, deployment: Deployment) -> float:
+        if self.strategy == STRATEGY_LATENCY and deployment.ewma_latency is not None:
+            return deployment.ewma_latency * (deployment.outstanding + 1) / deployment.weight
+        return deployment.outstanding / deployment.weight
+
+    def acquire(self, exclude: Set[str] = None) -> Optional[Deployment]:
+        """
+        选择一个部署并计入进行中请求
+
+        Args:
+            exclude (Set[str]): 本次请求已尝试失败的部署名
+
+        Returns:
+            Deployment: 选中的部署，没有可用部署时返回None
+        """
+        exclude = exclude or set()
+        now = time.time()
+        with self._lock:
+            candidates = [d for d in self.deployments if d.name not in exclude]
+            if not candidates:
+                return None
+
+            healthy = [d for d in candidates if d.is_healthy(now)]
+            if healthy:
+                # 尚无延迟数据的部署优先获得一次探测机会
+                if self.strategy == STRATEGY_LATENCY:
+                    unmeasured = [d for d in healthy if d.ewma_latency is None]
+                    if unmeasured:
+                        healthy = unmeasured
+                best = min(self._score(d) for d in healthy)
+                chosen = random.choice([d for d in healthy if self._score(d) == best])
+            else:
+                # 全部不健康时尝试最早结束冷却的部署
+                chosen = min(candidates, key=lambda d: d.unhealthy_until)
+
+            chosen.outstanding += 1
+            return chosen
+
+    def has_alternative(self, exclude: Set[str]) -> bool:
+        """除已尝试的部署外是否还有健康部署可以故障转移"""
+        now = time.time()
+        with self._lock:
+            return any(d.name not in exclude and d.is_healthy(now) for d in self.deployments)
+
+    def release(self, deployment: Deployment, latency: Optional[float], success: bool):
+        """
+        记录一次请求的结果
+
+        Args:
+            deployment (Deployment): 部署
+            latency (float): 请求耗时（秒），None表示不计入延迟统计
+            success (bool): 部署是否正常响应
+        """
+        with self._lock:
+            deployment.outstanding = max(deployment.outstanding - 1, 0)
+            deployment.requests += 1
+            if latency is not None and success:
+                if deployment.ewma_latency is None:
+                    deployment.ewma_latency = latency
+                else:
+                    deployment.ewma_latency += self.ewma_alpha * (latency - deployment.ewma_latency)
+
+            if success:
+                deployment.consecutive_errors = 0
+                deployment.unhealthy_until = 0.0
+                return
+
+            deployment.errors += 1
+            deployment.consecutive_errors += 1
+            if deployment.consecutive_errors >= self.unhealthy_threshold:
+                deployment.unhealthy_until = time.time() + self.unhealthy_cooldown
+                logger.warning(f"Deployment marked unhealthy for {self.unhealthy_cooldown}s: {deployment.name} "
+                               f"({deployment.consecutive_errors} consecutive errors)")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """获取各部署的延迟和错误统计"""
+        now = time.time()
+        with self._lock:
+            return [d.to_dict(now) for d in self.deployments]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：每个进程独立统计部署的健康状态和延迟"""
+    global _router, _router_lock
+    _router = None
+    _router_lock = threading.Lock()
+
+
+def get_deployment_router() -> DeploymentRouter:
+    """获取进程级共享的部署路由器"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                deployments = load_deployments()
+                _router = DeploymentRouter(
+                    deployments,
+                    strategy=Config.AZURE_ROUTING_STRATEGY,
+                    ewma_alpha=Config.AZURE_ROUTING_EWMA_ALPHA,
+                    unhealthy_threshold=Config.AZURE_UNHEALTHY_THRESHOLD,
+                    unhealthy_cooldown=Config.AZURE_UNHEALTHY_COOLDOWN
+                )
+                logger.info(f"Deployment router initialized with {len(deployments)} deployment(s), "
+                            f"strategy: {Config.AZURE_ROUTING_STRATEGY}")
+    return _router
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+from services.janitor import touch_file, track_file
+from services.storage import StorageBackend, get_storage, shard_key
+from services.xmind_writer import xmind_bytes
+
+logger = logging.getLogger(__name__)
+
+# 渲染结果格式版本，修改任一渲染器的输出时需要递增，使旧的导出缓存失效
+EXPORT_RENDER_VERSION = '1'
+
+
+def _render_opml(structure: Dict[str, Any], original_text: str) -> bytes:
+    """渲染为OPML 2.0大纲"""
+    def outline(node: Dict[str, Any], depth: int) -> str:
+        indent = '  ' * depth
+        children = node.get('children') or []
+        if not children:
+            return f'{indent}<outline text={quoteattr(node.get("title", ""))}/>\n'
+        inner = ''.join(outline(child, depth + 1) for child in children)
+        return f'{indent}<outline text={quoteattr(node.get("title", ""))}>\n{inner}{indent}</outline>\n'
+
+    title = structure.get('title', 'Article Analysis')
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<opml version="2.0">\n'
+        f'  <head>\n    <title>{escape(title)}</title>\n  </head>\n'
+        '  <body>\n'
+        f'{outline({"title": title, "children": structure.get("children", [])}, 2)}'
+        '  </body>\n'
+        '</opml>\n'
+    ).encode('utf-8')
+
+
+def _render_freemind(structure: Dict[str, Any], original_text: str) -> bytes:
+    """渲染为FreeMind .mm思维导图"""
+    def node_xml(node: Dict[str, Any], depth: int, position: str = '') -> str:
+        indent = '  ' * depth
+        attrs = f'TEXT={quoteattr(node.get("title", ""))}'
+        if position:
+            attrs += f' POSITION="{position}"'
+        children = node.get('children') or []
+        if not children:
+            return f'{indent}<node {attrs}/>\n'
+        inner = ''.join(node_xml(child, depth + 1) for child in children)
+        return f'{indent}<node {attrs}>\n{inner}{indent}</node>\n'
+
+    sections = structure.get('children', [])
+    # 一级节点左右交替排列，与XMind的平衡布局一致
+    inner = ''.join(
+        node_xml(section, 2, 'right' if i % 2 == 0 else 'left') for i, section in enumerate(sections)
+    )
+    title = quoteattr(structure.get('title', 'Article Analysis'))
+    return f'<map version="1.0.1">\n  <node TEXT={title}>\n{inner}  </node>\n</map>\n'.encode('utf-8')
+
+
+def _render_markdown(structure: Dict[str, Any], original_text: str) -> bytes:
+    """渲染为与分析结果相同层级的markdown"""
+    lines = [f"# {structure.get('title', 'Article Analysis')}", '']
+    for section in structure.get('children', []):
+        lines.append(f"## {section.get('title', '')}")
+        for item in section.get('children') or []:
+            lines.append(f"- {item.get('title', '')}")
+        lines.append('')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _render_json(structure: Dict[str, Any], original_text: str) -> bytes:
+    """渲染为格式化的JSON结构数据"""
+    return json.dumps(structure, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def _render_xmind(structure: Dict[str, Any], original_text: str) -> bytes:
+    """渲染为.xmind文件"""
+    return xmind_bytes(structure, original_text)
+
+
+# 导出格式 -> (MIME类型, 扩展名, 渲染函数)
+EXPORT_FORMATS: Dict[str, Tuple[str, str, Callable[[Dict[str, Any], str], bytes]]] = {
+    'xmind': ('application/vnd.xmind.workbook', 'xmind', _render_xmind),
+    'opml': ('text/x-opml', 'opml', _render_opml),
+    'mm': ('application/x-freemind', 'mm', _render_freemind),
+    'md': ('text/markdown', 'md', _render_markdown),
+    'json': ('application/json', 'json', _render_json),
+}
+
+DEFAULT_EXPORT_FORMAT = 'xmind'
+
+
+def format_for_mimetype(mimetype: str) -> Optional[str]:
+    """根据MIME类型查找导出格式"""
+    for name, (format_mimetype, _, _) in EXPORT_FORMATS.items():
+        if format_mimetype == mimetype:
+            return name
+    return None
+
+
+def validate_structure(structure: Any) -> Optional[str]:
+    """
+    校验思维导图结构数据
+
+    Args:
+        structure: 待校验的数据
+
+    Returns:
+        str: 错误信息，合法时返回None
+    """
+    if not isinstance(structure, dict) or not isinstance(structure.get('children', []), list):
+        return 'mindmap_data must be an object with a children list'
+
+    stack = [(structure, 0)]
+    count = 0
+    while stack:
+        node, depth = stack.pop()
+        count += 1
+        if depth > 3 or count > 2000:
+            return 'mindmap_data is too deep or too large'
+        if not isinstance(node, dict) or not isinstance(node.get('title', ''), str):
+            return 'mindmap_data nodes must be objects with a string title'
+        children = node.get('children') or []
+        if not isinstance(children, list):
+            return 'mindmap_data children must be lists'
+        stack.extend((child, depth + 1) for child in children)
+    return None
+
+
+class ExportService:
+    """
+    思维导图导出服务
+
+    渲染结果按 (结构数据, 原文, 格式, 渲染版本) 的内容哈希缓存在文件存储中（exports/ab/cd/<hash>.<ext>），
+    相同思维导图的重复导出直接返回已渲染的文件，哈希同时作为HTTP ETag
+    """
+
+    def __init__(self, storage: StorageBackend = None):
+        """
+        初始化导出服务
+
+        Args:
+            storage (StorageBackend): 文件存储，默认为进程共享的存储
+        """
+        self.storage = storage or get_storage()
+
+    @staticmethod
+    def content_hash(structure: Dict[str, Any], export_format: str, original_text: str = "") -> str:
+        """
+        计算导出文件的内容哈希
+
+        Args:
+            structure (Dict): 思维导图结构数据
+            export_format (str): 导出格式
+            original_text (str): 原文（仅xmind格式写入备注）
+
+        Returns:
+            str: 十六进制哈希，作为存储键和ETag
+        """
+        canonical = json.dumps(structure, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        if export_format != 'xmind':
+            original_text = ''
+        payload = f"{EXPORT_RENDER_VERSION}|{export_format}|{original_text}|{canonical}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def key_for(content_hash: str, export_format: str) -> str:
+        """导出文件的存储键"""
+        return shard_key(content_hash, EXPORT_FORMATS[export_format][1], prefix='exports')
+
+    def export(self, structure: Dict[str, Any], export_format: str, original_text: str = "",
+               content_hash: str = None) -> Tuple[str, bool]:
+        """
+        渲染导出文件（已缓存时直接返回缓存文件）
+
+        Args:
+            structure (Dict): 思维导图结构数据
+            export_format (str): 导出格式，EXPORT_FORMATS中的键
+            original_text (str): 原文
+            content_hash (str): 预先计算的内容哈希
+
+        Returns:
+            Tuple: (存储键, 是否命中缓存)
+        """
+        content_hash = content_hash or self.content_hash(structure, export_format, original_text)
+        key = self.key_for(content_hash, export_format)
+        if self.storage.exists(key):
+            touch_file(key)
+            return key, True
+
+        mimetype, _, render = EXPORT_FORMATS[export_format]
+        data = render(structure, original_text)
+        self.storage.put(key, data, mimetype)
+        track_file(key, len(data))
+        logger.info(f"Mindmap exported: {export_format}, {len(data)} bytes, {content_hash}")
+        return key, False
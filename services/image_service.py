@@ -0,0 +1,350 @@
+import hashlib
+import io
+import logging
+import math
+from typing import Dict, Any, BinaryIO, Optional, Union
+
+from config import Config
+from services.rate_limiter import IMAGE_TOKEN_ESTIMATE
+from services.metrics import OCR_IMAGE_BYTES
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow未安装时跳过预处理，原图直接发送
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# 图片格式魔数 -> MIME类型
+_MAGIC_NUMBERS = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+# vision模型high detail的处理方式：先缩放到2048x2048以内，再将短边缩放到768
+_HIGH_DETAIL_MAX_SIDE = 2048
+_HIGH_DETAIL_SHORT_SIDE = 768
+# low detail固定按512x512处理
+_LOW_DETAIL_SIDE = 512
+_TILE_SIZE = 512
+# 计算图片指纹前的归一化尺寸
+_HASH_NORMALIZE_SIDE = 512
+# 分块读取图片流的块大小
+_READ_CHUNK_SIZE = 64 * 1024
+
+# 图片数据：内存中的bytes，或可seek的文件对象（如上传时落盘的临时文件），
+# 文件对象在处理过程中按块读取，不会整体载入内存
+ImageSource = Union[bytes, BinaryIO]
+
+
+def open_image_stream(image: ImageSource) -> BinaryIO:
+    """
+    以可读流的形式打开图片数据（文件对象会被定位到开头）
+
+    Args:
+        image (ImageSource): 图片数据
+
+    Returns:
+        BinaryIO: 可读流
+    """
+    if isinstance(image, (bytes, bytearray)):
+        return io.BytesIO(image)
+    image.seek(0)
+    return image
+
+
+def image_source_size(image: ImageSource) -> int:
+    """
+    获取图片数据的字节数（文件对象通过seek获取，不读取内容）
+
+    Args:
+        image (ImageSource): 图片数据
+
+    Returns:
+        int: 字节数
+    """
+    if isinstance(image, (bytes, bytearray)):
+        return len(image)
+    image.seek(0, io.SEEK_END)
+    size = image.tell()
+    image.seek(0)
+    return size
+
+
+def hash_image_source(image: ImageSource) -> str:
+    """
+    分块计算图片数据的SHA-256
+
+    Args:
+        image (ImageSource): 图片数据
+
+    Returns:
+        str: 十六进制摘要
+    """
+    if isinstance(image, (bytes, bytearray)):
+        return hashlib.sha256(image).hexdigest()
+    digest = hashlib.sha256()
+    stream = open_image_stream(image)
+    for chunk in iter(lambda: stream.read(_READ_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def detect_image_format(image_data: ImageSource) -> Optional[str]:
+    """
+    根据文件头识别图片格式
+
+    Args:
+        image_data (ImageSource): 图片数据（只读取前16个字节）
+
+    Returns:
+        str: MIME类型，无法识别时返回None
+    """
+    if isinstance(image_data, (bytes, bytearray)):
+        head = image_data[:16]
+    else:
+        stream = open_image_stream(image_data)
+        head = stream.read(16)
+        stream.seek(0)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for magic, mime_type in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    return None
+
+
+def estimate_image_tokens(width: int, height: int, detail: str) -> int:
+    """
+    估算图片在vision模型中消耗的token数
+
+    Args:
+        width (int): 发送的图片宽度
+        height (int): 发送的图片高度
+        detail (str): low 或 high
+
+    Returns:
+        int: token数
+    """
+    if detail == 'low':
+        return 85
+    scale = min(1.0, _HIGH_DETAIL_MAX_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, _HIGH_DETAIL_SHORT_SIDE / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / _TILE_SIZE) * math.ceil(height / _TILE_SIZE)
+    return 85 + 170 * tiles
+
+
+def perceptual_hash(image_data: ImageSource, hash_size: int = 16) -> Optional[int]:
+    """
+    计算图片的差值哈希（dHash）
+
+    先将图片归一化：按EXIF方向旋转、转灰度、拉伸对比度、纠正轻微倾斜并裁剪到文字区域，
+    再比较 hash_size x hash_size 网格中水平和垂直相邻块的明暗，得到 2*hash_size^2 位的指纹；
+    对重新压缩、缩放、亮度变化和页边距差异不敏感
+
+    Args:
+        image_data (ImageSource): 图片数据
+        hash_size (int): 网格边长
+
+    Returns:
+        int: 指纹，Pillow未安装或图片无法解码时返回None
+    """
+    if Image is None:
+        return None
+    try:
+        image = Image.open(open_image_stream(image_data))
+        if image.format == 'JPEG':
+            image.draft('L', (_HASH_NORMALIZE_SIDE, _HASH_NORMALIZE_SIDE))
+        image = ImageOps.exif_transpose(image).convert('L')
+        image.thumbnail((_HASH_NORMALIZE_SIDE, _HASH_NORMALIZE_SIDE))
+        image = ImageOps.autocontrast(image)
+
+        angle = _detect_skew(image)
+        if angle:
+            image = image.rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+        # 裁剪到文字区域，消除拍摄范围和页边距的差异
+        bbox = image.point(lambda p: 255 if p < 128 else 0).getbbox()
+        if bbox:
+            image = image.crop(bbox)
+
+        horizontal = image.resize((hash_size + 1, hash_size), Image.Resampling.BOX).tobytes()
+        vertical = image.resize((hash_size, hash_size + 1), Image.Resampling.BOX).tobytes()
+    except Exception as e:
+        logger.warning(f"计算图片指纹失败: {str(e)}")
+        return None
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (horizontal[offset + col] > horizontal[offset + col + 1])
+    for row in range(hash_size):
+        for col in range(hash_size):
+            value = (value << 1) | (vertical[row * hash_size + col] > vertical[(row + 1) * hash_size + col])
+    return value
+
+
+def _detect_skew(image, max_angle: float = 5.0, step: float = 0.5) -> float:
+    """
+    用投影法估计文字行的轻微倾斜角度
+
+    文字行水平时，各行像素平均值的方差最大；在小缩略图上尝试一组角度取方差最大者
+
+    Args:
+        image: Pillow图片
+        max_angle (float): 搜索的最大角度
+        step (float): 搜索步长
+
+    Returns:
+        float: 需要旋转的角度（度），无明显倾斜时返回0
+    """
+    thumbnail = image.convert('L')
+    thumbnail.thumbnail((400, 400))
+    # 二值化并反色：文字为亮像素
+    thumbnail = thumbnail.point(lambda p: 255 if p < 128 else 0)
+
+    def score(angle: float) -> float:
+        rotated = thumbnail.rotate(angle, resample=Image.Resampling.NEAREST, expand=False)
+        # 缩放为1像素宽即得到每行的平均值
+        rows = rotated.resize((1, rotated.size[1]), Image.Resampling.BOX).tobytes()
+        mean = sum(rows) / len(rows)
+        return sum((r - mean) ** 2 for r in rows)
+
+    steps = int(max_angle / step)
+    baseline = score(0.0)
+    best_angle, best_score = 0.0, baseline
+    for i in range(-steps, steps + 1):
+        if i == 0:
+            continue
+        angle = i * step
+        value = score(angle)
+        if value > best_score:
+            best_angle, best_score = angle, value
+
+    # 改善不明显时不旋转，避免对无文字图片引入误差
+    if best_score < baseline * 1.05:
+        return 0.0
+    return best_angle
+
+
+class ImageService:
+    """OCR前的图片预处理服务"""
+
+    def __init__(self):
+        """初始化预处理配置"""
+        self.enabled = Config.OCR_PREPROCESS_ENABLED and Image is not None
+        self.grayscale = Config.OCR_GRAYSCALE
+        self.deskew = Config.OCR_DESKEW
+        self.output_format = Config.OCR_OUTPUT_FORMAT.upper()
+        self.quality = Config.OCR_JPEG_QUALITY
+        self.detail = Config.OCR_DETAIL
+
+    def preprocess(self, image_data: ImageSource) -> Dict[str, Any]:
+        """
+        预处理图片：识别真实格式、按EXIF自动旋转、纠正轻微倾斜、
+        缩放到vision模型实际使用的分辨率、转灰度并重新压缩，同时选择detail级别
+
+        传入文件对象时按需解码，只有预处理后的小图会整体保存在内存中；
+        无法预处理时才读取原图
+
+        Args:
+            image_data (ImageSource): 原始图片数据
+
+        Returns:
+            Dict: data（发送的图片数据）、mime_type、detail、width、height、
+                  original_size、size、estimated_tokens
+        """
+        original_size = image_source_size(image_data)
+        OCR_IMAGE_BYTES.labels('upload').observe(original_size)
+        if self.enabled:
+            try:
+                result = self._process(image_data)
+            except Exception as e:
+                logger.warning(f"图片预处理失败，使用原图: {str(e)}")
+            else:
+                result['original_size'] = original_size
+                OCR_IMAGE_BYTES.labels('sent').observe(result['size'])
+                logger.info(f"Image preprocessed: {original_size} -> {result['size']} bytes, "
+                            f"{result['width']}x{result['height']}, detail={result['detail']}, "
+                            f"~{result['estimated_tokens']} tokens")
+                return result
+
+        mime_type = detect_image_format(image_data) or 'image/jpeg'
+        data = image_data if isinstance(image_data, (bytes, bytearray)) else open_image_stream(image_data).read()
+        OCR_IMAGE_BYTES.labels('sent').observe(len(data))
+        return {
+            'data': data,
+            'mime_type': mime_type,
+            'detail': 'high' if self.detail == 'auto' else self.detail,
+            'width': None,
+            'height': None,
+            'original_size': original_size,
+            'size': len(data),
+            'estimated_tokens': IMAGE_TOKEN_ESTIMATE
+        }
+
+    def _process(self, image_data: ImageSource) -> Dict[str, Any]:
+        """执行Pillow预处理流程"""
+        image = Image.open(open_image_stream(image_data))
+        original_format = image.format
+
+        # JPEG可在解码时直接按比例缩小，减少解码时间和内存
+        if original_format == 'JPEG':
+            image.draft('L' if self.grayscale else 'RGB', self._target_size(image.size))
+
+        # 按EXIF方向自动旋转手机照片（动图只取第一帧）
+        image = ImageOps.exif_transpose(image)
+
+        if self.grayscale:
+            image = image.convert('L')
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        target_size = self._target_size(image.size)
+        if target_size != image.size:
+            image = image.resize(target_size, Image.Resampling.LANCZOS)
+
+        if self.deskew:
+            angle = _detect_skew(image)
+            if angle:
+                fill = 255 if image.mode == 'L' else (255, 255, 255)
+                image = image.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=fill)
+
+        detail = self.detail
+        if detail == 'auto':
+            # 整张图能放进一个512x512块时low detail已足够，否则使用high
+            detail = 'low' if max(image.size) <= _LOW_DETAIL_SIDE else 'high'
+
+        buffer = io.BytesIO()
+        if self.output_format == 'WEBP':
+            image.save(buffer, format='WEBP', quality=self.quality, method=4)
+            mime_type = 'image/webp'
+        else:
+            image.save(buffer, format='JPEG', quality=self.quality, optimize=True)
+            mime_type = 'image/jpeg'
+        data = buffer.getvalue()
+
+        return {
+            'data': data,
+            'mime_type': mime_type,
+            'detail': detail,
+            'width': image.size[0],
+            'height': image.size[1],
+            'size': len(data),
+            'estimated_tokens': estimate_image_tokens(image.size[0], image.size[1], detail)
+        }
+
+    @staticmethod
+    def _target_size(size) -> tuple:
+        """计算vision模型high detail实际使用的分辨率（不放大）"""
+        width, height = size
+        scale = min(1.0, _HIGH_DETAIL_MAX_SIDE / max(width, height),
+                    _HIGH_DETAIL_SHORT_SIDE / min(width, height))
+        return max(1, round(width * scale)), max(1, round(height * scale))
@@ -0,0 +1,383 @@
+import atexit
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config import Config
+from services.storage import StorageBackend, get_storage
+from utils.downloads import clear_etag_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows：不做选举，每个进程都执行清理
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# 清理器管理的存储键：分片存储的生成文件、导出缓存、旧版平铺在根目录的.xmind文件及写入中断残留的临时文件
+_MANAGED_KEY_RE = re.compile(r'^([0-9a-f]{2}/[0-9a-f]{2}/[^/]+|exports/.+|[^/]+\.(xmind|tmp))$')
+
+
+class UploadJanitor:
+    """
+    生成文件清理器
+
+    通过文件存储（services.storage）管理生成的 .xmind 文件和 exports/ 下的导出缓存：
+    - 超过 max_age 秒未被访问的文件删除
+    - 总字节数超过 max_bytes 时按最近访问时间（LRU）删除最旧的文件
+
+    文件索引保存在内存中，按最近访问时间建立最小堆，每次清理只弹出需要删除的条目，
+    不需要逐个stat整个目录；存储只按 rescan_interval 重新遍历一次，
+    以发现其他进程写入或删除的文件。删除按批进行，批之间暂停，避免长时间占用I/O
+
+    gunicorn的每个worker进程都有自己的清理器，只有拿到 lock_path 独占文件锁的一个进程执行清理，
+    该进程退出（如达到max_requests被替换）后锁自动释放，由其他worker在下一个清理周期接替。
+    其他进程处理的下载只更新文件的访问时间，删除前会重新读取，最近被访问过的文件不删除
+    """
+
+    def __init__(self, storage: StorageBackend, max_age: float, max_bytes: int, interval: float = 300,
+                 rescan_interval: float = 3600, batch_size: int = 100, batch_pause: float = 0.05,
+                 lock_path: Optional[str] = None):
+        """
+        初始化清理器
+
+        Args:
+            storage (StorageBackend): 文件存储
+            max_age (float): 文件最长保留时间（秒，自最近一次访问起算），为0表示不按时间清理
+            max_bytes (int): 管理文件的总字节数上限，为0表示不限制
+            interval (float): 清理间隔（秒）
+            rescan_interval (float): 重新遍历存储的间隔（秒）
+            batch_size (int): 每批删除的最大文件数
+            batch_pause (float): 批之间的暂停时间（秒）
+            lock_path (str): 选举执行清理的进程用的锁文件，为None时本进程总是执行清理
+        """
+        self.storage = storage
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.rescan_interval = rescan_interval
+        self.batch_size = max(1, batch_size)
+        self.batch_pause = batch_pause
+        self.lock_path = lock_path
+
+        self._index: Dict[str, Tuple[int, float]] = {}  # key -> (size, last_access)
+        self._heap: List[Tuple[float, str]] = []  # (last_access, key)，过时条目在弹出时跳过
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._last_scan = 0.0
+
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        self._leader = False
+
+        self._freed_files = 0
+        self._freed_bytes = 0
+        self._sweeps = 0
+        self._last_sweep = None
+
+    @staticmethod
+    def is_managed(key: str) -> bool:
+        """是否为清理器管理的文件（其余文件如任务数据库、分析缓存不处理）"""
+        return bool(_MANAGED_KEY_RE.match(key))
+
+    def _push(self, key: str, size: int, last_access: float):
+        """写入索引（调用方需持有锁）"""
+        previous = self._index.get(key)
+        if previous:
+            self._bytes -= previous[0]
+        self._index[key] = (size, last_access)
+        self._bytes += size
+        heapq.heappush(self._heap, (last_access, key))
+
+    def rescan(self):
+        """重新遍历存储，重建文件索引"""
+        objects = [obj for obj in self.storage.iter_objects() if self.is_managed(obj.key)]
+
+        with self._lock:
+            # 进程内记录的访问时间比存储的修改时间/atime更准确（noatime挂载、对象存储），保留较新的一个
+            index = {}
+            for obj in objects:
+                known = self._index.get(obj.key)
+                index[obj.key] = (obj.size, max(obj.modified, known[1]) if known else obj.modified)
+            self._index = index
+            self._bytes = sum(size for size, _ in index.values())
+            self._heap = [(last_access, key) for key, (_, last_access) in index.items()]
+            heapq.heapify(self._heap)
+            self._last_scan = time.time()
+
+    def track(self, key: str, size: int):
+        """
+        登记新写入的文件（不必等到下一次遍历）
+
+        Args:
+            key (str): 存储键
+            size (int): 文件大小
+        """
+        if not self.is_managed(key):
+            return
+        with self._lock:
+            self._push(key, size, time.time())
+
+    def touch(self, key: str):
+        """
+        记录文件被访问（下载或导出缓存命中），延后其过期时间
+
+        Args:
+            key (str): 存储键
+        """
+        if not self.is_managed(key):
+            return
+        with self._lock:
+            known = self._index.get(key)
+            if known is not None:
+                self._push(key, known[0], time.time())
+                # 过时条目过多时重建堆
+                if len(self._heap) > 2 * len(self._index) + 64:
+                    self._heap = [(last_access, k) for k, (_, last_access) in self._index.items()]
+                    heapq.heapify(self._heap)
+        # 访问时间同时写入存储，执行清理的可能是另一个worker进程
+        self.storage.touch(key)
+
+    def _pop_victims(self, now: float) -> List[Tuple[str, int, float]]:
+        """从堆中取出一批需要删除的文件，并从索引中移除（调用方需持有锁）"""
+        victims = []
+        while self._heap and len(victims) < self.batch_size:
+            last_access, key = self._heap[0]
+            known = self._index.get(key)
+            if known is None or known[1] != last_access:
+                heapq.heappop(self._heap)  # 过时条目
+                continue
+
+            expired = self.max_age and now - last_access > self.max_age
+            over_quota = self.max_bytes and self._bytes > self.max_bytes
+            if not expired and not over_quota:
+                break
+
+            heapq.heappop(self._heap)
+            del self._index[key]
+            self._bytes -= known[0]
+            victims.append((key, known[0], last_access))
+        return victims
+
+    def _confirm_victims(self, victims: List[Tuple[str, int, float]]) -> Dict[str, int]:
+        """
+        删除前重新读取本地文件的访问时间：比索引中新的文件在其他进程中被访问过，重新登记而不删除
+
+        Returns:
+            Dict[str, int]: 确认删除的存储键 -> 文件大小
+        """
+        sizes = {}
+        for key, size, last_access in victims:
+            if self.storage.local_path(key) is not None:
+                stored = self.storage.stat(key)
+                if stored is None:
+                    continue
+                if stored.modified > last_access:
+                    with self._lock:
+                        if key not in self._index:
+                            self._push(key, stored.size, stored.modified)
+                    continue
+            sizes[key] = size
+        return sizes
+
+    def sweep(self) -> Dict[str, Any]:
+        """
+        执行一次清理
+
+        Returns:
+            Dict: 本次删除的文件数 files、释放的字节数 bytes、耗时 duration
+        """
+        start = time.time()
+        if start - self._last_scan >= self.rescan_interval:
+            self.rescan()
+
+        freed_files = 0
+        freed_bytes = 0
+        while not self._stopping.is_set():
+            with self._lock:
+                victims = self._pop_victims(time.time())
+            if not victims:
+                break
+            sizes = self._confirm_victims(victims)
+            try:
+                deleted = self.storage.delete_many(list(sizes)) if sizes else []
+            except Exception as e:
+                logger.error(f"批量删除文件失败: {str(e)}")
+                deleted = []
+            for key in deleted:
+                local_path = self.storage.local_path(key)
+                if local_path:
+                    clear_etag_cache(local_path)
+                freed_files += 1
+                freed_bytes += sizes[key]
+            if len(victims) < self.batch_size:
+                break
+            self._stopping.wait(self.batch_pause)
+
+        duration = time.time() - start
+        with self._lock:
+            self._freed_files += freed_files
+            self._freed_bytes += freed_bytes
+            self._sweeps += 1
+            self._last_sweep = start
+        if freed_files:
+            logger.info(f"Upload janitor freed {freed_files} files, {freed_bytes} bytes in {duration:.3f}s")
+        return {'files': freed_files, 'bytes': freed_bytes, 'duration': round(duration, 3)}
+
+    def stats(self) -> Dict[str, Any]:
+        """获取清理统计"""
+        with self._lock:
+            return {
+                'files': len(self._index),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+                'freed_files': self._freed_files,
+                'freed_bytes': self._freed_bytes,
+                'sweeps': self._sweeps,
+                'last_sweep': self._last_sweep,
+                'leader': self._leader
+            }
+
+    def _acquire_leadership(self) -> bool:
+        """
+        尝试成为执行清理的进程（非阻塞地获取锁文件的独占锁，获取后一直持有到进程退出）
+
+        Returns:
+            bool: 本进程是否执行清理
+        """
+        if self._leader:
+            return True
+        if fcntl is None or not self.lock_path:
+            self._leader = True
+            return True
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+            lock_file = open(self.lock_path, 'a')
+        except OSError as e:
+            logger.error(f"打开清理锁文件失败: {str(e)}")
+            return False
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self._leader = True
+        # 索引里只有本进程写入的文件，接手后先重新遍历存储
+        self._last_scan = 0.0
+        logger.info(f"Upload janitor elected in process {os.getpid()}")
+        return True
+
+    def _release_leadership(self):
+        """释放锁文件，由其他进程接替清理"""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self._leader = False
+
+    def start(self):
+        """启动后台清理线程"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='upload-janitor', daemon=True)
+        self._thread.start()
+        logger.info("Started upload janitor")
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台清理线程"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._release_leadership()
+
+    def _run(self):
+        """清理线程主循环：未当选的进程每个周期重试一次选举"""
+        while not self._stopping.is_set():
+            if self._acquire_leadership():
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"清理上传目录失败: {str(e)}")
+            self._stopping.wait(self.interval)
+
+
+_janitor = None
+_lock = threading.Lock()
+
+
+def get_janitor() -> Optional[UploadJanitor]:
+    """
+    获取进程级共享的上传目录清理器
+
+    Returns:
+        UploadJanitor: 清理器实例，未启用时返回None
+    """
+    global _janitor
+    if not Config.JANITOR_ENABLED:
+        return None
+    if _janitor is None:
+        with _lock:
+            if _janitor is None:
+                _janitor = UploadJanitor(
+                    get_storage(),
+                    max_age=Config.JANITOR_MAX_AGE,
+                    max_bytes=Config.JANITOR_MAX_BYTES,
+                    interval=Config.JANITOR_INTERVAL,
+                    rescan_interval=Config.JANITOR_RESCAN_INTERVAL,
+                    batch_size=Config.JANITOR_BATCH_SIZE,
+                    batch_pause=Config.JANITOR_BATCH_PAUSE,
+                    lock_path=os.path.join(Config.DATA_FOLDER, 'janitor.lock')
+                )
+    return _janitor
+
+
+def track_file(key: str, size: int):
+    """登记新写入的文件（未启用清理器时忽略）"""
+    janitor = get_janitor()
+    if janitor is not None:
+        janitor.track(key, size)
+
+
+def touch_file(key: str):
+    """记录文件被访问（未启用清理器时忽略）"""
+    janitor = get_janitor()
+    if janitor is not None:
+        janitor.touch(key)
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：清理线程不会被复制到子进程，丢弃继承的实例，由 init_app 重新创建"""
+    global _janitor, _lock
+    _janitor = None
+    _lock = threading.Lock()
+
+
+def stop():
+    """停止本进程的后台清理线程"""
+    if _janitor is not None:
+        _janitor.stop()
+
+
+def init_app(app, start: bool = True):
+    """
+    启动后台清理线程
+
+    Args:
+        app: Flask应用实例
+        start (bool): 是否启动清理线程；预加载应用的主进程中为False，由fork出的worker进程启动
+    """
+    janitor = get_janitor()
+    if janitor is None:
+        return
+    app.extensions['upload_janitor'] = janitor
+    if start:
+        janitor.start()
+        atexit.register(stop)
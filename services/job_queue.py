@@ -0,0 +1,504 @@
+import atexit
+import ipaddress
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from config import Config
+from services.analysis_service import AnalysisService
+from services.image_service import open_image_stream
+from services.ocr_service import OCRService
+from services.rate_limiter import PRIORITY_BATCH
+from services.metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT,
+    data BLOB,
+    result TEXT,
+    error TEXT,
+    callback_url TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+# 任务状态
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+
+def is_allowed_callback_url(url: str) -> bool:
+    """
+    校验异步任务回调地址
+
+    只允许http(s)；主机（JOB_CALLBACK_ALLOWED_HOSTS 中列出的除外）解析出的所有地址都必须是公网地址，
+    避免worker向回环、私有网段、链路本地（含云服务器元数据地址）等内部地址发送请求
+
+    Args:
+        url (str): 回调地址
+
+    Returns:
+        bool: 是否允许回调
+    """
+    try:
+        parsed = urlparse(url)
+        host, port = parsed.hostname, parsed.port
+    except ValueError:
+        return False
+    if parsed.scheme not in ('http', 'https') or not host:
+        return False
+    if host.lower() in Config.JOB_CALLBACK_ALLOWED_HOSTS:
+        return True
+
+    try:
+        addresses = socket.getaddrinfo(host, port or (443 if parsed.scheme == 'https' else 80),
+                                       proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return False
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0].split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            return False
+    return bool(addresses)
+
+
+class JobQueue:
+    """
+    基于SQLite的本地任务队列
+
+    无需外部消息中间件；多个进程共享同一个数据库文件时，
+    任务领取在事务中完成，保证同一任务只被一个worker执行
+    """
+
+    def __init__(self, db_path: str):
+        """
+        初始化任务队列
+
+        Args:
+            db_path (str): SQLite数据库文件路径
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        # 任务的上传文件按任务ID存放在数据库旁的目录中，逐块复制，不整体读入内存
+        self.files_dir = os.path.join(db_dir, 'job_files')
+        os.makedirs(self.files_dir, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload: Dict[str, Any] = None, data: bytes = None,
+                callback_url: str = None, files: List[BinaryIO] = None) -> str:
+        """
+        提交任务
+
+        Args:
+            kind (str): 任务类型（需已注册处理函数）
+            payload (Dict): JSON可序列化的任务参数
+            data (bytes): 二进制参数，任务完成后删除
+            callback_url (str): 任务完成后回调的URL
+            files (List[BinaryIO]): 按顺序保存的文件（如上传的多页图片），逐块复制到任务文件目录，任务完成后删除
+
+        Returns:
+            str: 任务ID
+        """
+        job_id = uuid.uuid4().hex
+        if files:
+            # 文件写完后再插入任务，worker领取时文件一定已完整
+            job_dir = self._job_files_dir(job_id)
+            try:
+                os.makedirs(job_dir)
+                for index, stream in enumerate(files):
+                    with open(os.path.join(job_dir, str(index)), 'wb') as f:
+                        shutil.copyfileobj(open_image_stream(stream), f, 64 * 1024)
+            except Exception:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                raise
+        try:
+            self._connect().execute(
+                'INSERT INTO jobs (id, kind, status, payload, data, callback_url, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, STATUS_QUEUED, json.dumps(payload or {}, ensure_ascii=False),
+                 data, callback_url, time.time())
+            )
+        except Exception:
+            if files:
+                shutil.rmtree(self._job_files_dir(job_id), ignore_errors=True)
+            raise
+        with self._wakeup:
+            self._wakeup.notify()
+        logger.info(f"Job enqueued: {job_id} ({kind})")
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        领取最早提交的排队任务，并标记为运行中
+
+        Returns:
+            Dict: 任务信息，没有排队任务时返回None
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT id, kind, payload, data, callback_url FROM jobs '
+                'WHERE status = ? ORDER BY created_at LIMIT 1',
+                (STATUS_QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, started_at = ? WHERE id = ?',
+                (STATUS_RUNNING, time.time(), row['id'])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'payload': json.loads(row['payload'] or '{}'),
+            'data': row['data'],
+            'files': self.job_files(row['id']),
+            'callback_url': row['callback_url']
+        }
+
+    def _job_files_dir(self, job_id: str) -> str:
+        return os.path.join(self.files_dir, job_id)
+
+    def job_files(self, job_id: str) -> List[str]:
+        """
+        任务提交时保存的文件路径
+
+        Args:
+            job_id (str): 任务ID
+
+        Returns:
+            List[str]: 按提交顺序排列的文件路径，没有文件时为空列表
+        """
+        try:
+            names = os.listdir(self._job_files_dir(job_id))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self._job_files_dir(job_id), name) for name in sorted(names, key=int)]
+
+    def complete(self, job_id: str, result: Dict[str, Any] = None, error: str = None):
+        """
+        记录任务结果，并释放二进制参数和文件
+
+        Args:
+            job_id (str): 任务ID
+            result (Dict): 任务结果
+            error (str): 错误信息，不为空时任务标记为失败
+        """
+        status = STATUS_FAILED if error else STATUS_SUCCEEDED
+        self._connect().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, data = NULL, finished_at = ? WHERE id = ?',
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             error, time.time(), job_id)
+        )
+        shutil.rmtree(self._job_files_dir(job_id), ignore_errors=True)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询任务状态
+
+        Args:
+            job_id (str): 任务ID
+
+        Returns:
+            Dict: 任务状态和结果，任务不存在时返回None
+        """
+        row = self._connect().execute(
+            'SELECT id, kind, status, result, error, created_at, started_at, finished_at '
+            'FROM jobs WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at']
+        }
+
+    def requeue_stale(self, timeout: float) -> int:
+        """
+        将运行超时的任务（如进程崩溃遗留）重新排队
+
+        Args:
+            timeout (float): 运行超时时间（秒）
+
+        Returns:
+            int: 重新排队的任务数量
+        """
+        cursor = self._connect().execute(
+            'UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ?',
+            (STATUS_QUEUED, STATUS_RUNNING, time.time() - timeout)
+        )
+        return cursor.rowcount
+
+    def purge_finished(self, max_age: float) -> int:
+        """
+        删除已结束且超过保留时间的任务
+
+        Args:
+            max_age (float): 保留时间（秒）
+
+        Returns:
+            int: 删除的任务数量
+        """
+        cursor = self._connect().execute(
+            'DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?',
+            (STATUS_SUCCEEDED, STATUS_FAILED, time.time() - max_age)
+        )
+        return cursor.rowcount
+
+    def wait(self, timeout: float):
+        """等待新任务提交的通知（跨进程提交的任务依靠超时轮询发现）"""
+        with self._wakeup:
+            self._wakeup.wait(timeout)
+
+    def notify_all(self):
+        """唤醒所有等待中的worker"""
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+
+class JobWorkerPool:
+    """任务worker线程池，以有限并发消费任务队列"""
+
+    def __init__(self, queue: JobQueue, workers: int, poll_interval: float = 1.0):
+        """
+        初始化worker线程池
+
+        Args:
+            queue (JobQueue): 任务队列
+            workers (int): worker线程数（即对Azure的最大并发任务数）
+            poll_interval (float): 空闲时的轮询间隔（秒）
+        """
+        self.queue = queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, Callable[[Dict[str, Any], Any], Dict[str, Any]]] = {}
+        self._threads = []
+        self._stopping = threading.Event()
+        self._last_maintenance = 0.0
+
+    def register_handler(self, kind: str, handler: Callable[[Dict[str, Any], Any], Dict[str, Any]]):
+        """
+        注册任务处理函数
+
+        Args:
+            kind (str): 任务类型
+            handler: handler(payload, data) -> 结果字典，结果中 success 为False时任务标记为失败；
+                data为二进制参数，提交时带文件的任务则为按顺序打开的文件对象列表
+        """
+        self._handlers[kind] = handler
+
+    def start(self):
+        """启动worker线程"""
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} job worker(s)")
+
+    def stop(self, timeout: float = 5.0):
+        """停止worker线程（正在执行的任务会在完成后退出）"""
+        self._stopping.set()
+        self.queue.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _maintenance(self):
+        """定期回收超时任务和过期任务"""
+        now = time.time()
+        if now - self._last_maintenance < 60:
+            return
+        self._last_maintenance = now
+        requeued = self.queue.requeue_stale(Config.JOB_TIMEOUT)
+        purged = self.queue.purge_finished(Config.JOB_RETENTION)
+        if requeued or purged:
+            logger.info(f"Job maintenance: requeued {requeued}, purged {purged}")
+
+    def _run(self):
+        """worker主循环"""
+        while not self._stopping.is_set():
+            try:
+                self._maintenance()
+                job = self.queue.claim()
+            except Exception as e:
+                logger.error(f"领取任务失败: {str(e)}")
+                self._stopping.wait(self.poll_interval)
+                continue
+
+            if job is None:
+                self.queue.wait(self.poll_interval)
+                continue
+
+            self._execute(job)
+
+    def _execute(self, job: Dict[str, Any]):
+        """执行任务并记录结果"""
+        job_id = job['id']
+        handler = self._handlers.get(job['kind'])
+        result = None
+        error = None
+
+        if handler is None:
+            error = f"未知的任务类型: {job['kind']}"
+        else:
+            try:
+                with ExitStack() as stack:
+                    data = job['data']
+                    if job['files']:
+                        data = [stack.enter_context(open(path, 'rb')) for path in job['files']]
+                    result = handler(job['payload'], data)
+                if not result.get('success'):
+                    error = result.get('error') or '任务执行失败'
+            except Exception as e:
+                logger.error(f"任务执行异常 {job_id}: {str(e)}")
+                ERRORS.labels('job', type(e).__name__).inc()
+                error = str(e)
+
+        try:
+            self.queue.complete(job_id, result, error)
+        except Exception as e:
+            logger.error(f"记录任务结果失败 {job_id}: {str(e)}")
+            return
+        logger.info(f"Job finished: {job_id} ({'failed' if error else 'succeeded'})")
+
+        if job['callback_url']:
+            self._send_callback(job['callback_url'], job_id, result, error)
+
+    def _send_callback(self, url: str, job_id: str, result: Optional[Dict[str, Any]], error: Optional[str]):
+        """任务完成后回调通知（发送前重新校验地址，不跟随重定向）"""
+        if not is_allowed_callback_url(url):
+            logger.warning(f"回调地址不允许访问，跳过回调 {job_id} -> {url}")
+            return
+        try:
+            requests.post(url, json={
+                'job_id': job_id,
+                'status': STATUS_FAILED if error else STATUS_SUCCEEDED,
+                'result': result,
+                'error': error
+            }, timeout=Config.JOB_CALLBACK_TIMEOUT, allow_redirects=False)
+        except Exception as e:
+            logger.warning(f"任务回调失败 {job_id} -> {url}: {str(e)}")
+
+
+_queue = None
+_pool = None
+_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """获取进程级共享的任务队列"""
+    global _queue
+    if _queue is None:
+        with _lock:
+            if _queue is None:
+                db_path = Config.JOB_DB_PATH or os.path.join(Config.DATA_FOLDER, 'jobs.db')
+                _queue = JobQueue(db_path)
+    return _queue
+
+
+def _analyze_text_job(payload: Dict[str, Any], data: Optional[bytes]) -> Dict[str, Any]:
+    """文本分析任务"""
+    return AnalysisService(PRIORITY_BATCH).analyze(payload['text'])
+
+
+def _ocr_job(payload: Dict[str, Any], images: List[BinaryIO]) -> Dict[str, Any]:
+    """图片文字识别任务（images为按页码顺序的各页图片文件）"""
+    ocr_service = OCRService(PRIORITY_BATCH)
+    if payload.get('analyze'):
+        return ocr_service.extract_and_analyze(images)
+    return ocr_service.extract_pages(images)
+
+
+def reset_after_fork():
+    """
+    fork后在子进程中调用：SQLite连接不能跨进程使用，worker线程也不会被复制到子进程，
+    丢弃从父进程继承的任务队列和线程池，由 init_app 重新创建
+    """
+    global _queue, _pool, _lock
+    _queue = None
+    _pool = None
+    _lock = threading.Lock()
+
+
+def stop_workers():
+    """停止本进程的任务worker线程（正在执行的任务会在完成后退出）"""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.stop()
+
+
+def init_app(app, start_workers: bool = True):
+    """
+    启动任务worker线程池（JOB_WORKERS为0时不启动，仅作为提交端）
+
+    Args:
+        app: Flask应用实例
+        start_workers (bool): 是否启动worker线程；预加载应用的主进程中为False，由fork出的worker进程启动
+    """
+    global _pool
+    queue = get_job_queue()
+    app.extensions['job_queue'] = queue
+
+    if Config.JOB_WORKERS <= 0 or not start_workers:
+        return
+    with _lock:
+        if _pool is None:
+            _pool = JobWorkerPool(queue, Config.JOB_WORKERS, Config.JOB_POLL_INTERVAL)
+            _pool.register_handler('analyze_text', _analyze_text_job)
+            _pool.register_handler('ocr', _ocr_job)
+            _pool.start()
+            atexit.register(stop_workers)
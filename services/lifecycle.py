@@ -0,0 +1,44 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def reinit_after_fork():
+    """
+    在fork出的worker进程中重新初始化进程级共享对象
+
+    预加载应用（gunicorn preload_app）时，主进程创建的连接池、线程池、SQLite连接等
+    会被复制到每个worker进程中，其中socket和线程都不能在进程间共享，需要在worker中丢弃后重新创建
+    """
+    from services import (
+        analysis_cache, analysis_service, async_openai_service, deployment_router, janitor, job_queue,
+        metrics, ocr_cache, ocr_service, openai_client_pool, rate_limiter, storage, tracing
+    )
+    for module in (metrics, tracing, openai_client_pool, storage, deployment_router, rate_limiter, analysis_cache,
+                   ocr_cache, async_openai_service, analysis_service, ocr_service, job_queue, janitor):
+        module.reset_after_fork()
+    logger.info(f"Re-initialized shared clients and caches in worker process {os.getpid()}")
+
+
+def start_background_services(app):
+    """
+    启动本进程的后台线程（异步任务worker、上传目录清理、指标快照）
+
+    Args:
+        app: Flask应用实例
+    """
+    from services import janitor, job_queue, metrics
+    job_queue.init_app(app)
+    janitor.init_app(app)
+    metrics.start_flusher()
+
+
+def stop_background_services():
+    """停止本进程的后台线程并关闭Azure OpenAI连接池（worker进程退出时调用）"""
+    from services import janitor, job_queue, metrics, openai_client_pool, tracing
+    job_queue.stop_workers()
+    janitor.stop()
+    metrics.stop_flusher()
+    tracing.shutdown()
+    openai_client_pool.close_all_clients()
@@ -0,0 +1,596 @@
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import uuid
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Dict, Iterator, Optional, Tuple
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows：多进程快照不加锁，也不合并已退出进程的快照
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 请求耗时的直方图分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Azure OpenAI调用耗时的直方图分桶（秒）
+AZURE_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+# 本地处理步骤（解析、生成文件）耗时的直方图分桶（秒）
+STEP_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+# 数据大小的直方图分桶（字节）
+SIZE_BUCKETS = tuple(2 ** n for n in range(14, 25))  # 16KB ~ 16MB
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 多进程快照目录中合并了已退出进程计数的文件
+RETIRED_SNAPSHOT = 'retired.json'
+
+
+class _Child:
+    """绑定了标签值的指标"""
+
+    __slots__ = ('_metric', '_key')
+
+    def __init__(self, metric: '_Metric', key: Tuple[str, ...]):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1):
+        self._metric._add(self._key, amount)
+
+    def dec(self, amount: float = 1):
+        self._metric._add(self._key, -amount)
+
+    def observe(self, value: float):
+        self._metric._observe(self._key, value)
+
+    def time(self) -> '_Timer':
+        return _Timer(self)
+
+
+class _Timer:
+    """以上下文管理器方式记录一段代码的耗时"""
+
+    __slots__ = ('_target', '_start')
+
+    def __init__(self, target):
+        self._target = target
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._target.observe(perf_counter() - self._start)
+        return False
+
+
+class _ShardHolder:
+    """线程分片的持有者（只被线程局部变量引用，线程结束时被回收）"""
+
+    __slots__ = ('values', '__weakref__')
+
+    def __init__(self, values: Dict[Tuple[str, ...], Any]):
+        self.values = values
+
+
+class _Metric:
+    """
+    指标基类
+
+    每个线程写入自己的分片（threading.local），记录时不加锁；
+    只有线程第一次写入某个指标时登记分片需要加锁，导出时合并所有分片。
+    线程（或gevent的greenlet）结束后它的分片被放入待合并队列，
+    下次登记分片或导出时并入公共的基础值，分片数不随处理过的线程数增长
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 registry: 'MetricsRegistry' = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._reset_values()
+        self._children: Dict[Tuple[str, ...], _Child] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values) -> _Child:
+        """按标签值取子指标（标签值按 labelnames 的顺序传入）"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(key, _Child(self, key))
+        return child
+
+    def _reset_values(self):
+        self._shards: Dict[int, Dict[Tuple[str, ...], Any]] = {}
+        self._base: Dict[Tuple[str, ...], Any] = {}
+        self._retired = deque()
+
+    def _shard(self) -> Dict[Tuple[str, ...], Any]:
+        """当前线程的分片"""
+        try:
+            return self._local.holder.values
+        except AttributeError:
+            values = {}
+            holder = _ShardHolder(values)
+            # 回调可能在任意线程的任意位置执行（垃圾回收），只做线程安全的入队，合并在持有锁时进行
+            weakref.finalize(holder, self._retired.append, values)
+            with self._lock:
+                self._fold_retired()
+                self._shards[id(values)] = values
+            self._local.holder = holder
+            return values
+
+    def _fold_retired(self):
+        """把已结束线程的分片并入基础值（调用方需持有锁）"""
+        while self._retired:
+            values = self._retired.popleft()
+            self._shards.pop(id(values), None)
+            for key, value in values.items():
+                self._base[key] = self._merge(self._base.get(key), value)
+
+    def _add(self, key: Tuple[str, ...], amount: float):
+        shard = self._shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def _observe(self, key: Tuple[str, ...], value: float):
+        raise TypeError(f"{self.type} {self.name} does not support observe()")
+
+    def inc(self, amount: float = 1):
+        self._add((), amount)
+
+    def collect(self) -> Dict[Tuple[str, ...], Any]:
+        """合并基础值和所有线程的分片"""
+        with self._lock:
+            self._fold_retired()
+            shards = list(self._shards.values())
+            merged = {key: self._merge(None, value) for key, value in self._base.items()}
+        for shard in shards:
+            for key, value in shard.copy().items():
+                merged[key] = self._merge(merged.get(key), value)
+        return merged
+
+    @staticmethod
+    def _merge(total, value):
+        return value if total is None else total + value
+
+    def render(self, values: Dict[Tuple[str, ...], Any]) -> Iterator[str]:
+        """以Prometheus文本格式输出"""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    """只增不减的计数器（名称以 _total 结尾）"""
+
+    type = 'counter'
+
+
+class Gauge(_Metric):
+    """可增可减的当前值，如进行中的请求数"""
+
+    type = 'gauge'
+
+    def dec(self, amount: float = 1):
+        self._add((), -amount)
+
+
+class Histogram(_Metric):
+    """直方图：按分桶统计观测值的分布，同时记录总和与次数"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS, registry: 'MetricsRegistry' = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _observe(self, key: Tuple[str, ...], value: float):
+        shard = self._shard()
+        # [各分桶计数（非累计）..., +Inf分桶计数, 总和]
+        counts = shard.get(key)
+        if counts is None:
+            counts = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def observe(self, value: float):
+        self._observe((), value)
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def _add(self, key, amount):
+        raise TypeError(f"histogram {self.name} does not support inc()/dec()")
+
+    @staticmethod
+    def _merge(total, value):
+        return list(value) if total is None else [a + b for a, b in zip(total, value)]
+
+    def render(self, values: Dict[Tuple[str, ...], Any]) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        names = self.labelnames + ('le',)
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(counts[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+
+    多进程部署（gunicorn/uvicorn多worker）时，每个进程定期把自己的指标快照写入 METRICS_MULTIPROC_DIR，
+    任意一个worker响应 /metrics 时汇总所有进程的快照：计数器和直方图累加（包括已退出的进程），
+    gauge只累加仍在运行的进程。已退出进程的计数器和直方图由快照线程合并到 retired.json 后删除其快照，
+    快照文件数不随重启过的worker数增长
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stopping = threading.Event()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicated metric: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def collect(self) -> Dict[str, Dict[Tuple[str, ...], Any]]:
+        """当前进程的指标值"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.collect() for metric in metrics}
+
+    def render(self, directory: str = None) -> str:
+        """
+        以Prometheus文本格式导出指标
+
+        Args:
+            directory (str): 多进程快照目录，为空时只导出当前进程
+
+        Returns:
+            str: 指标文本
+        """
+        values = self.collect()
+        if directory:
+            with _snapshot_lock(directory, exclusive=False):
+                snapshots = list(_read_snapshots(directory))
+            for pid, snapshot in snapshots:
+                if pid == os.getpid():
+                    continue
+                alive = pid is not None and _pid_alive(pid)
+                for name, entries in snapshot.items():
+                    metric = self._metrics.get(name)
+                    if metric is None or (metric.type == 'gauge' and not alive):
+                        continue
+                    merged = values.setdefault(name, {})
+                    for key, value in entries:
+                        key = tuple(key)
+                        merged[key] = metric._merge(merged.get(key), value)
+
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.extend(metric.render(values.get(name, {})))
+        return '\n'.join(lines) + '\n'
+
+    def flush(self, directory: str):
+        """把当前进程的指标快照原子写入 directory/<pid>.json"""
+        os.makedirs(directory, exist_ok=True)
+        _write_snapshot(directory, f"{os.getpid()}.json", self.collect())
+
+    def prune(self, directory: str):
+        """把已退出进程的快照中的计数器和直方图合并到 retired.json，并删除这些快照"""
+        if fcntl is None:
+            return
+        with _snapshot_lock(directory, exclusive=True):
+            retired: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+            dead = []
+            for pid, snapshot in _read_snapshots(directory):
+                if pid is not None:
+                    if pid == os.getpid() or _pid_alive(pid):
+                        continue
+                    dead.append(pid)
+                for name, entries in snapshot.items():
+                    metric = self._metrics.get(name)
+                    if metric is None or metric.type == 'gauge':
+                        continue
+                    merged = retired.setdefault(name, {})
+                    for key, value in entries:
+                        key = tuple(key)
+                        merged[key] = metric._merge(merged.get(key), value)
+            if not dead:
+                return
+            _write_snapshot(directory, RETIRED_SNAPSHOT, retired)
+            for pid in dead:
+                try:
+                    os.remove(os.path.join(directory, f"{pid}.json"))
+                except OSError:
+                    pass
+
+    def start_flusher(self, directory: str, interval: float):
+        """启动定期写入快照的后台线程"""
+        if self._flusher is not None:
+            return
+        self._stopping.clear()
+        self._flusher = threading.Thread(target=self._run_flusher, args=(directory, interval),
+                                         name='metrics-flusher', daemon=True)
+        self._flusher.start()
+
+    def stop_flusher(self, directory: str = None):
+        """停止后台线程并写入最后一次快照"""
+        self._stopping.set()
+        if self._flusher is not None:
+            self._flusher.join(5.0)
+            self._flusher = None
+        if directory:
+            try:
+                self.flush(directory)
+            except OSError as e:
+                logger.warning(f"写入指标快照失败: {str(e)}")
+
+    def _run_flusher(self, directory: str, interval: float):
+        while not self._stopping.wait(interval):
+            try:
+                self.flush(directory)
+                self.prune(directory)
+            except OSError as e:
+                logger.warning(f"写入指标快照失败: {str(e)}")
+
+    def reset_after_fork(self):
+        """fork后在子进程中调用：清空从父进程继承的指标值，丢弃快照线程"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric._local = threading.local()
+            metric._reset_values()
+            metric._lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stopping = threading.Event()
+
+
+def _write_snapshot(directory: str, name: str, values: Dict[str, Dict[Tuple[str, ...], Any]]):
+    """原子写入指标快照"""
+    snapshot = {metric: [[list(key), value] for key, value in entries.items()]
+                for metric, entries in values.items() if entries}
+    path = os.path.join(directory, name)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _snapshot_lock(directory: str, exclusive: bool):
+    """快照目录的文件锁：读取快照时共享，合并已退出进程的快照时独占（避免读到合并了一半的结果）"""
+    if fcntl is None or not os.path.isdir(directory):
+        yield
+        return
+    with open(os.path.join(directory, '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_snapshots(directory: str) -> Iterator[Tuple[Optional[int], Dict[str, Any]]]:
+    """读取指标快照，retired.json 的进程号为None"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        pid, _, extension = name.partition('.')
+        if name == RETIRED_SNAPSHOT:
+            pid = None
+        elif extension != 'json' or not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                yield (None if pid is None else int(pid)), json.load(f)
+        except (OSError, ValueError):
+            continue
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+REGISTRY = MetricsRegistry()
+
+# HTTP接口
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'HTTP请求处理耗时', ('method', 'route', 'status'), LATENCY_BUCKETS)
+HTTP_REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', '正在处理的HTTP请求数', ('route',))
+
+# Azure OpenAI调用（每次HTTP请求，不含排队等待配额的时间）
+AZURE_TIME_TO_FIRST_TOKEN = Histogram(
+    'azure_openai_time_to_first_token_seconds', 'Azure OpenAI调用从发出请求到收到第一个输出token的耗时',
+    ('deployment', 'operation'), AZURE_LATENCY_BUCKETS)
+AZURE_REQUEST_DURATION = Histogram(
+    'azure_openai_request_duration_seconds', 'Azure OpenAI调用从发出请求到收到完整输出的耗时',
+    ('deployment', 'operation'), AZURE_LATENCY_BUCKETS)
+AZURE_TOKENS = Counter(
+    'azure_openai_tokens_total', 'Azure OpenAI调用使用的token数', ('deployment', 'operation', 'type'))
+AZURE_ERRORS = Counter('azure_openai_errors_total', 'Azure OpenAI调用失败次数（按异常类型）', ('deployment', 'type'))
+AZURE_REQUESTS_IN_FLIGHT = Gauge('azure_openai_requests_in_flight', '正在进行的Azure OpenAI请求数', ('deployment',))
+
+# 本地处理步骤
+MINDMAP_PARSE_DURATION = Histogram(
+    'mindmap_parse_duration_seconds', 'parse_markdown_to_structure解析思维导图结构的耗时', buckets=STEP_BUCKETS)
+XMIND_GENERATE_DURATION = Histogram(
+    'xmind_generate_duration_seconds', '生成并保存XMind文件的耗时', buckets=STEP_BUCKETS)
+OCR_IMAGE_BYTES = Histogram(
+    'ocr_image_bytes', 'OCR图片大小（upload为上传的原图，sent为预处理后发送给Azure的图片）', ('stage',), SIZE_BUCKETS)
+
+# 错误
+ERRORS = Counter('app_errors_total', '未处理的异常次数（按组件和异常类型）', ('component', 'type'))
+
+
+class AzureCall:
+    """
+    记录一次Azure OpenAI调用的指标
+
+    每次发出请求前调用 begin()；失败时 fail()；成功后收到第一个输出token时 first_token()，
+    输出完整后 finish()（非流式调用两者同时发生）
+    """
+
+    __slots__ = ('deployment', 'operation', '_start', '_first_token')
+
+    def __init__(self, deployment: str, operation: str):
+        self.deployment = deployment
+        self.operation = operation
+        self._start = None
+        self._first_token = False
+
+    def begin(self):
+        self._start = perf_counter()
+        self._first_token = False
+        AZURE_REQUESTS_IN_FLIGHT.labels(self.deployment).inc()
+
+    def fail(self, error: BaseException):
+        AZURE_REQUESTS_IN_FLIGHT.labels(self.deployment).dec()
+        self.error(error)
+
+    def error(self, error: BaseException):
+        """只计数错误（如等待配额超时，请求没有发出）"""
+        AZURE_ERRORS.labels(self.deployment, type(error).__name__).inc()
+
+    def first_token(self):
+        if not self._first_token:
+            self._first_token = True
+            AZURE_TIME_TO_FIRST_TOKEN.labels(self.deployment, self.operation).observe(perf_counter() - self._start)
+
+    def finish(self, usage=None):
+        self.first_token()
+        AZURE_REQUESTS_IN_FLIGHT.labels(self.deployment).dec()
+        AZURE_REQUEST_DURATION.labels(self.deployment, self.operation).observe(perf_counter() - self._start)
+        if usage:
+            AZURE_TOKENS.labels(self.deployment, self.operation, 'prompt').inc(usage.prompt_tokens or 0)
+            AZURE_TOKENS.labels(self.deployment, self.operation, 'completion').inc(usage.completion_tokens or 0)
+
+
+def render() -> str:
+    """导出所有进程（配置了 METRICS_MULTIPROC_DIR 时）的指标"""
+    return REGISTRY.render(Config.METRICS_MULTIPROC_DIR or None)
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：worker只统计自己处理的请求"""
+    REGISTRY.reset_after_fork()
+
+
+def start_flusher():
+    """多进程部署时启动定期写入指标快照的后台线程"""
+    if Config.METRICS_MULTIPROC_DIR:
+        REGISTRY.start_flusher(Config.METRICS_MULTIPROC_DIR, Config.METRICS_FLUSH_INTERVAL)
+        atexit.register(stop_flusher)
+
+
+def stop_flusher():
+    """停止快照线程并写入最后一次快照"""
+    REGISTRY.stop_flusher(Config.METRICS_MULTIPROC_DIR or None)
+
+
+def clear_multiproc_dir():
+    """删除旧的指标快照（服务启动时在主进程中调用，以免累加上一次运行的计数）"""
+    directory = Config.METRICS_MULTIPROC_DIR
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.json') or name.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def init_app(app):
+    """
+    为Flask应用注册请求耗时、进行中请求数和未处理异常的统计
+
+    路由标签使用URL规则（如 /api/analyze/jobs/<string:job_id>），避免按实际路径产生过多的时间序列
+    流式响应的耗时统计到开始返回响应为止，完整的上游耗时见Azure OpenAI调用的指标
+
+    Args:
+        app: Flask应用实例
+    """
+    from flask import g, got_request_exception, request
+
+    @app.before_request
+    def _start_request_timer():
+        rule = request.url_rule
+        g._metrics_route = rule.rule if rule is not None else 'unmatched'
+        g._metrics_start = perf_counter()
+        g._metrics_status = 500
+        HTTP_REQUESTS_IN_FLIGHT.labels(g._metrics_route).inc()
+
+    @app.after_request
+    def _record_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _observe_request(exc):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return
+        route = g._metrics_route
+        HTTP_REQUESTS_IN_FLIGHT.labels(route).dec()
+        HTTP_REQUEST_DURATION.labels(request.method, route, g._metrics_status).observe(perf_counter() - start)
+
+    def _count_exception(sender, exception, **extra):
+        ERRORS.labels('http', type(exception).__name__).inc()
+
+    got_request_exception.connect(_count_exception, app, weak=False)
+    app.extensions['metrics'] = REGISTRY
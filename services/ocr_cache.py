@@ -0,0 +1,216 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from config import Config
+from services.image_service import ImageSource, hash_image_source, perceptual_hash
+
+logger = logging.getLogger(__name__)
+
+
+class OCRCache:
+    """
+    图片文字识别结果缓存
+
+    两级查找：
+    - 精确层：原始图片字节的SHA-256，命中字节完全相同的重复上传
+    - 感知层：图片dHash指纹，按汉明距离查找同一页面的近似重复照片
+
+    感知层使用多索引哈希：指纹切分为 max_distance+1 段，
+    由抽屉原理，距离不超过max_distance的两个指纹至少有一段完全相同，
+    因此只需比较与查询指纹有相同分段的候选条目。
+    所有条目在内存中按LRU淘汰，并支持TTL过期
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: int = 7 * 24 * 3600,
+                 hash_size: int = 16, max_distance: int = 24, perceptual: bool = True):
+        """
+        初始化缓存
+
+        Args:
+            max_entries (int): 最大条目数
+            ttl_seconds (int): 条目有效期（秒）
+            hash_size (int): dHash网格边长，指纹位数为 2*hash_size^2
+            max_distance (int): 视为同一页面的最大汉明距离
+            perceptual (bool): 是否启用感知层
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hash_size = hash_size
+        self.max_distance = max_distance
+        self.perceptual = perceptual
+
+        bits = 2 * hash_size * hash_size
+        band_count = min(max_distance + 1, bits)
+        # 各分段的(起始位, 位数)
+        self._bands: List[Tuple[int, int]] = []
+        start = 0
+        for i in range(band_count):
+            width = bits // band_count + (1 if i < bits % band_count else 0)
+            self._bands.append((start, width))
+            start += width
+
+        self._entries = OrderedDict()  # entry_key -> (expires_at, namespace, sha256, phash, value)
+        self._exact: Dict[str, str] = {}  # namespace|sha256 -> entry_key
+        self._band_index: List[Dict[int, set]] = [{} for _ in self._bands]
+        self._lock = threading.Lock()
+
+        self._hits_exact = 0
+        self._hits_perceptual = 0
+        self._misses = 0
+        self._sets = 0
+        self._evictions = 0
+
+    def _band_values(self, phash: int):
+        for i, (start, width) in enumerate(self._bands):
+            yield i, (phash >> start) & ((1 << width) - 1)
+
+    def _remove(self, entry_key: str):
+        """删除条目及其索引（调用方需持有锁）"""
+        _, namespace, sha256, phash, _ = self._entries.pop(entry_key)
+        self._exact.pop(f"{namespace}|{sha256}", None)
+        if phash is not None:
+            for i, band in self._band_values(phash):
+                keys = self._band_index[i].get(band)
+                if keys:
+                    keys.discard(entry_key)
+                    if not keys:
+                        del self._band_index[i][band]
+
+    def fingerprint(self, image_data: ImageSource) -> Tuple[str, Optional[int]]:
+        """
+        计算图片的查找键
+
+        Args:
+            image_data (ImageSource): 原始图片数据
+
+        Returns:
+            Tuple: (SHA-256, dHash指纹；未启用感知层或无法计算时为None)
+        """
+        sha256 = hash_image_source(image_data)
+        phash = perceptual_hash(image_data, self.hash_size) if self.perceptual else None
+        return sha256, phash
+
+    def get(self, namespace: str, sha256: str, phash: Optional[int]) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存：先精确匹配，再按汉明距离查找最相近的近似重复图片
+
+        Args:
+            namespace (str): 命名空间（部署名 + 提示词版本）
+            sha256 (str): 原始图片的SHA-256
+            phash (int): 图片dHash指纹
+
+        Returns:
+            Dict: 缓存的识别结果，未命中返回None
+        """
+        now = time.time()
+        with self._lock:
+            entry_key = self._exact.get(f"{namespace}|{sha256}")
+            if entry_key is not None:
+                entry = self._entries[entry_key]
+                if entry[0] > now:
+                    self._entries.move_to_end(entry_key)
+                    self._hits_exact += 1
+                    return entry[4]
+                self._remove(entry_key)
+
+            if phash is not None:
+                candidates = set()
+                for i, band in self._band_values(phash):
+                    candidates.update(self._band_index[i].get(band, ()))
+
+                best_key, best_distance = None, self.max_distance + 1
+                for key in candidates:
+                    expires_at, entry_namespace, _, entry_phash, _ = self._entries[key]
+                    if entry_namespace != namespace or expires_at <= now:
+                        continue
+                    distance = bin(entry_phash ^ phash).count('1')
+                    if distance < best_distance:
+                        best_key, best_distance = key, distance
+
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self._hits_perceptual += 1
+                    logger.info(f"OCR cache perceptual hit, hamming distance: {best_distance}")
+                    return self._entries[best_key][4]
+
+            self._misses += 1
+            return None
+
+    def set(self, namespace: str, sha256: str, phash: Optional[int], value: Dict[str, Any]):
+        """
+        写入缓存
+
+        Args:
+            namespace (str): 命名空间（部署名 + 提示词版本）
+            sha256 (str): 原始图片的SHA-256
+            phash (int): 图片dHash指纹
+            value (Dict): 识别结果
+        """
+        entry_key = f"{namespace}|{sha256}"
+        with self._lock:
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            self._entries[entry_key] = (time.time() + self.ttl_seconds, namespace, sha256, phash, value)
+            self._exact[entry_key] = entry_key
+            if phash is not None:
+                for i, band in self._band_values(phash):
+                    self._band_index[i].setdefault(band, set()).add(entry_key)
+            self._sets += 1
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        with self._lock:
+            hits = self._hits_exact + self._hits_perceptual
+            total = hits + self._misses
+            return {
+                'hits': hits,
+                'hits_exact': self._hits_exact,
+                'hits_perceptual': self._hits_perceptual,
+                'misses': self._misses,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+                'sets': self._sets,
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'perceptual': self.perceptual,
+                'max_distance': self.max_distance
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：丢弃从父进程继承的缓存实例，下次使用时重新创建"""
+    global _cache, _cache_lock
+    _cache = None
+    _cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> Optional[OCRCache]:
+    """
+    获取进程级共享的OCR结果缓存
+
+    Returns:
+        OCRCache: 缓存实例，未启用缓存时返回None
+    """
+    global _cache
+    if not Config.OCR_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = OCRCache(
+                    max_entries=Config.OCR_CACHE_MAX_ENTRIES,
+                    ttl_seconds=Config.OCR_CACHE_TTL,
+                    hash_size=Config.OCR_CACHE_HASH_SIZE,
+                    max_distance=Config.OCR_CACHE_MAX_DISTANCE,
+                    perceptual=Config.OCR_CACHE_PERCEPTUAL
+                )
+    return _cache
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+from config import Config
+from services.openai_service import OpenAIService
+from services.async_openai_service import AsyncOpenAIService
+from services.image_service import ImageSource
+from services.analysis_service import AnalysisService
+from services.rate_limiter import PRIORITY_INTERACTIVE
+from services import tracing
+from utils.helpers import validate_text_content
+
+logger = logging.getLogger(__name__)
+
+# 进程级多页识别线程池，所有请求共享，限制对Azure的总并发
+_ocr_executor = None
+_ocr_executor_lock = threading.Lock()
+
+# 页尾以连字符断开的单词，如 "impor-"
+_TRAILING_HYPHEN_RE = re.compile(r'([A-Za-z])[-\u00ad]\s*$')
+# 句末标点（含引号、括号收尾）
+_SENTENCE_END_RE = re.compile(r'[.!?:;"\'”’)\]]\s*$')
+
+
+def _get_ocr_executor() -> ThreadPoolExecutor:
+    """获取共享的多页识别线程池"""
+    global _ocr_executor
+    if _ocr_executor is None:
+        with _ocr_executor_lock:
+            if _ocr_executor is None:
+                _ocr_executor = ThreadPoolExecutor(
+                    max_workers=Config.OCR_MAX_WORKERS,
+                    thread_name_prefix='ocr-page'
+                )
+    return _ocr_executor
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：父进程线程池的线程不会被复制到子进程，丢弃后下次使用时重新创建"""
+    global _ocr_executor, _ocr_executor_lock
+    _ocr_executor = None
+    _ocr_executor_lock = threading.Lock()
+
+
+def merge_pages(texts: List[str]) -> str:
+    """
+    按页码顺序合并多页识别文本
+
+    - 上一页以连字符断词结尾、下一页以小写字母开头时，去掉连字符直接拼接单词
+    - 上一页在句子中间结束、下一页以小写字母开头时，视为同一段落，以空格连接
+    - 其余情况按段落分隔
+
+    Args:
+        texts (List[str]): 各页识别出的文本
+
+    Returns:
+        str: 合并后的文本
+    """
+    merged = ''
+    for text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        if not merged:
+            merged = text
+            continue
+
+        continues_lower = text[0].islower()
+        if continues_lower and _TRAILING_HYPHEN_RE.search(merged):
+            merged = _TRAILING_HYPHEN_RE.sub(r'\1', merged) + text
+        elif continues_lower and not _SENTENCE_END_RE.search(merged):
+            merged = f"{merged.rstrip()} {text}"
+        else:
+            merged = f"{merged}\n\n{text}"
+    return merged
+
+
+class OCRService:
+    """多页图片文字识别服务：并发识别各页，按页码顺序合并文本"""
+
+    def __init__(self, priority: int = PRIORITY_INTERACTIVE):
+        """
+        初始化依赖的服务
+
+        Args:
+            priority (int): Azure OpenAI调用优先级
+        """
+        self.priority = priority
+        self.openai_service = OpenAIService(priority)
+        self._async_openai_service = None
+
+    @property
+    def async_openai_service(self) -> AsyncOpenAIService:
+        """异步Azure OpenAI服务（只有 extract_pages_async 用到，首次调用时创建）"""
+        if self._async_openai_service is None:
+            self._async_openai_service = AsyncOpenAIService(self.priority)
+        return self._async_openai_service
+
+    def extract_pages(self, images: List[ImageSource]) -> Dict[str, Any]:
+        """
+        并发识别多张图片并合并文本
+
+        总耗时约等于最慢的一页，而不是各页之和；任意一页识别失败时整体失败
+
+        Args:
+            images (List[ImageSource]): 按页码顺序排列的图片数据或文件对象
+
+        Returns:
+            Dict: 成功时包含 extracted_text（合并文本）、pages（各页结果）、tokens_used、cached；
+                  失败时包含 error 和 pages
+        """
+        with tracing.span('ocr', pages=len(images)):
+            if len(images) == 1:
+                pages = [self._extract_page(images[0])]
+            else:
+                logger.info(f"Starting multi-page OCR: {len(images)} pages")
+                executor = _get_ocr_executor()
+                futures = [executor.submit(tracing.bind(self._extract_page), image) for image in images]
+                pages = [future.result() for future in futures]
+        return self._merge_results(pages)
+
+    async def extract_pages_async(self, images: List[ImageSource]) -> Dict[str, Any]:
+        """
+        extract_pages 的协程版本：各页在事件循环中并发识别，等待Azure OpenAI期间不占用线程
+
+        Args:
+            images (List[ImageSource]): 按页码顺序排列的图片数据或文件对象
+
+        Returns:
+            Dict: 与 extract_pages 相同
+        """
+        if len(images) > 1:
+            logger.info(f"Starting async multi-page OCR: {len(images)} pages")
+        with tracing.span('ocr', pages=len(images)):
+            pages = await asyncio.gather(*(self._extract_page_async(image) for image in images))
+        return self._merge_results(pages)
+
+    @staticmethod
+    def _merge_results(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """汇总各页识别结果，任意一页失败时整体失败"""
+        page_results = [
+            {
+                'page': index + 1,
+                'success': bool(page.get('success')),
+                'extracted_text': page.get('extracted_text'),
+                'tokens_used': page.get('tokens_used', 0),
+                'cached': page.get('cached', False),
+                'error': page.get('error')
+            }
+            for index, page in enumerate(pages)
+        ]
+        tokens_used = sum(page['tokens_used'] or 0 for page in page_results)
+
+        failed = [page for page in page_results if not page['success']]
+        if failed:
+            errors = '; '.join(f"第{page['page']}页: {page['error']}" for page in failed)
+            return {
+                'success': False,
+                'error': errors if len(pages) > 1 else failed[0]['error'],
+                'pages': page_results,
+                'tokens_used': tokens_used
+            }
+
+        return {
+            'success': True,
+            'extracted_text': merge_pages([page['extracted_text'] for page in page_results]),
+            'pages': page_results,
+            'tokens_used': tokens_used,
+            'cached': all(page['cached'] for page in page_results)
+        }
+
+    def extract_and_analyze(self, images: List[ImageSource]) -> Dict[str, Any]:
+        """
+        识别多张图片后直接分析合并文本并生成思维导图结构数据
+
+        Args:
+            images (List[ImageSource]): 按页码顺序排列的图片数据或文件对象
+
+        Returns:
+            Dict: 识别结果，分析成功时额外包含 analysis、mindmap_data；
+                  识别成功但分析失败时保留 extracted_text 并返回 error
+        """
+        result = self.extract_pages(images)
+        if not result['success']:
+            return result
+
+        text, error = self._check_extracted(result)
+        if error:
+            return error
+
+        analysis_result = AnalysisService(self.priority).analyze(text)
+        return self._with_analysis(result, analysis_result)
+
+    async def extract_and_analyze_async(self, images: List[ImageSource]) -> Dict[str, Any]:
+        """
+        extract_and_analyze 的协程版本
+
+        Args:
+            images (List[ImageSource]): 按页码顺序排列的图片数据或文件对象
+
+        Returns:
+            Dict: 与 extract_and_analyze 相同
+        """
+        result = await self.extract_pages_async(images)
+        if not result['success']:
+            return result
+
+        text, error = self._check_extracted(result)
+        if error:
+            return error
+
+        analysis_result = await AnalysisService(self.priority).analyze_async(text)
+        return self._with_analysis(result, analysis_result)
+
+    @staticmethod
+    def _check_extracted(result: Dict[str, Any]):
+        """校验识别出的文本能否分析，返回 (文本, 失败结果)"""
+        is_valid, error_msg = validate_text_content(result['extracted_text'])
+        if not is_valid:
+            return None, {**result, 'success': False, 'error': f'识别出的文本无法分析: {error_msg}'}
+        return result['extracted_text'], None
+
+    @staticmethod
+    def _with_analysis(result: Dict[str, Any], analysis_result: Dict[str, Any]) -> Dict[str, Any]:
+        """把分析结果合并到识别结果中"""
+        if not analysis_result['success']:
+            return {**result, 'success': False, 'error': analysis_result['error']}
+
+        return {
+            **result,
+            'analysis': analysis_result['analysis'],
+            'mindmap_data': analysis_result['mindmap_data'],
+            'tokens_used': result['tokens_used'] + analysis_result.get('tokens_used', 0)
+        }
+
+    def _extract_page(self, image_data: ImageSource) -> Dict[str, Any]:
+        """识别单页，异常转换为失败结果"""
+        try:
+            with tracing.span('ocr_page'):
+                return self.openai_service.extract_text_from_image(image_data) or {
+                    'success': False, 'error': '图片识别失败'
+                }
+        except Exception as e:
+            logger.error(f"单页图片识别失败: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+    async def _extract_page_async(self, image_data: ImageSource) -> Dict[str, Any]:
+        """识别单页（协程版本），异常转换为失败结果"""
+        try:
+            with tracing.span('ocr_page'):
+                return await self.async_openai_service.extract_text_from_image(image_data) or {
+                    'success': False, 'error': '图片识别失败'
+                }
+        except Exception as e:
+            logger.error(f"单页图片识别失败: {str(e)}")
+            return {'success': False, 'error': str(e)}
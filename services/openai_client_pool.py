@@ -0,0 +1,199 @@
+import atexit
+import importlib.util
+import logging
+import threading
+from typing import Dict, Tuple
+
+import httpx
+from openai import AsyncAzureOpenAI, AzureOpenAI
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 进程级客户端注册表: (endpoint, api_version, api_key) -> AzureOpenAI
+_clients: Dict[Tuple[str, str, str], AzureOpenAI] = {}
+# 异步客户端注册表（ASGI入口使用，每个进程一个事件循环）
+_async_clients: Dict[Tuple[str, str, str], AsyncAzureOpenAI] = {}
+_lock = threading.Lock()
+_shutdown_registered = False
+
+
+def _http2_available() -> bool:
+    """检查是否安装了HTTP/2依赖(h2)"""
+    return importlib.util.find_spec('h2') is not None
+
+
+def _http_settings(max_connections: int) -> dict:
+    """
+    根据配置生成httpx客户端参数
+
+    每个Azure端点独占一个客户端，因此这里的连接数限制即为单主机连接数限制
+    """
+    http2 = Config.AZURE_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("AZURE_HTTP2已开启但未安装h2依赖，回退到HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=Config.AZURE_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=Config.AZURE_HTTP_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(Config.AZURE_HTTP_TIMEOUT, connect=Config.AZURE_HTTP_CONNECT_TIMEOUT)
+    return {'limits': limits, 'timeout': timeout, 'http2': http2}
+
+
+def _build_http_client() -> httpx.Client:
+    """根据配置构建带连接池的httpx客户端"""
+    return httpx.Client(**_http_settings(Config.AZURE_HTTP_MAX_CONNECTIONS))
+
+
+def _build_async_http_client() -> httpx.AsyncClient:
+    """
+    构建异步httpx客户端
+
+    连接数不低于每个部署的异步并发上限，避免协程在连接池中排队超时
+    （上游并发由 ASYNC_AZURE_CONCURRENCY 信号量控制）
+    """
+    max_connections = max(Config.AZURE_HTTP_MAX_CONNECTIONS, Config.ASYNC_AZURE_CONCURRENCY)
+    return httpx.AsyncClient(**_http_settings(max_connections))
+
+
+def get_openai_client(endpoint: str = None, api_key: str = None, api_version: str = None) -> AzureOpenAI:
+    """
+    获取共享的AzureOpenAI客户端（线程安全）
+
+    同一端点的所有请求复用同一个连接池，避免每次请求重新建立TLS连接和DNS解析
+
+    Args:
+        endpoint (str): Azure OpenAI端点，默认使用Config配置
+        api_key (str): API密钥，默认使用Config配置
+        api_version (str): API版本，默认使用Config配置
+
+    Returns:
+        AzureOpenAI: 共享的客户端实例
+    """
+    endpoint = endpoint or Config.AZURE_OPENAI_ENDPOINT
+    api_key = api_key or Config.AZURE_OPENAI_API_KEY
+    api_version = api_version or Config.AZURE_API_VERSION
+    key = (endpoint, api_version, api_key)
+
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            logger.info(f"Creating pooled AzureOpenAI client for endpoint: {endpoint}")
+            http_client = _build_http_client()
+            try:
+                client = AzureOpenAI(
+                    api_key=api_key,
+                    api_version=api_version,
+                    azure_endpoint=endpoint,
+                    http_client=http_client,
+                    max_retries=0  # 重试由services.rate_limiter统一调度
+                )
+            except Exception:
+                http_client.close()
+                raise
+            _clients[key] = client
+    return client
+
+
+def get_async_openai_client(endpoint: str = None, api_key: str = None,
+                            api_version: str = None) -> AsyncAzureOpenAI:
+    """
+    获取共享的AsyncAzureOpenAI客户端（在事件循环中使用）
+
+    与 get_openai_client 相同，每个端点一个连接池；连接绑定到首次使用它的事件循环，
+    因此每个进程只应在一个事件循环中使用（ASGI服务器的worker进程）
+
+    Args:
+        endpoint (str): Azure OpenAI端点，默认使用Config配置
+        api_key (str): API密钥，默认使用Config配置
+        api_version (str): API版本，默认使用Config配置
+
+    Returns:
+        AsyncAzureOpenAI: 共享的客户端实例
+    """
+    endpoint = endpoint or Config.AZURE_OPENAI_ENDPOINT
+    api_key = api_key or Config.AZURE_OPENAI_API_KEY
+    api_version = api_version or Config.AZURE_API_VERSION
+    key = (endpoint, api_version, api_key)
+
+    client = _async_clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _async_clients.get(key)
+        if client is None:
+            logger.info(f"Creating pooled AsyncAzureOpenAI client for endpoint: {endpoint}")
+            client = AsyncAzureOpenAI(
+                api_key=api_key,
+                api_version=api_version,
+                azure_endpoint=endpoint,
+                http_client=_build_async_http_client(),
+                max_retries=0  # 重试由services.rate_limiter统一调度
+            )
+            _async_clients[key] = client
+    return client
+
+
+async def close_all_async_clients():
+    """关闭所有共享的异步客户端（在其所属的事件循环中调用）"""
+    with _lock:
+        clients = list(_async_clients.values())
+        _async_clients.clear()
+
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"关闭AsyncAzureOpenAI客户端失败: {str(e)}")
+
+    if clients:
+        logger.info(f"Closed {len(clients)} pooled AsyncAzureOpenAI client(s)")
+
+
+def close_all_clients():
+    """关闭所有共享客户端并释放连接池"""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"关闭AzureOpenAI客户端失败: {str(e)}")
+
+    if clients:
+        logger.info(f"Closed {len(clients)} pooled AzureOpenAI client(s)")
+
+
+def reset_after_fork():
+    """
+    fork后在子进程中调用：丢弃从父进程继承的客户端（连接池中的socket不能跨进程共享），
+    下次调用时重新创建；继承的连接不在子进程中关闭，以免影响父进程
+    """
+    global _clients, _async_clients, _lock
+    _clients = {}
+    _async_clients = {}
+    _lock = threading.Lock()
+
+
+def init_app(app):
+    """
+    在应用上注册连接池的关闭钩子
+
+    Args:
+        app: Flask应用实例
+    """
+    global _shutdown_registered
+    if not _shutdown_registered:
+        atexit.register(close_all_clients)
+        _shutdown_registered = True
+    app.extensions['openai_client_pool'] = _clients
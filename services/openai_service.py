@@ -1,114 +1,30 @@
 import openai
-from openai import AzureOpenAI
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Iterator
 from config import Config
+from services.openai_client_pool import get_openai_client
+from services.deployment_router import get_deployment_router
+from services.single_flight import SingleFlight
+from services.rate_limiter import (
+    get_rate_limiter, estimate_tokens, RateLimitTimeout, PRIORITY_INTERACTIVE
+)
+from services.image_service import ImageService, ImageSource, hash_image_source
+from services.ocr_cache import get_ocr_cache
+from services.metrics import AzureCall
+from services import tracing
 import base64
+import time
 
 logger = logging.getLogger(__name__)
 
-class OpenAIService:
-    """Azure OpenAI服务类"""
-    
-    def __init__(self):
-        """初始化Azure OpenAI客户端"""
-        self.client = AzureOpenAI(
-            api_key=Config.AZURE_OPENAI_API_KEY,
-            api_version=Config.AZURE_API_VERSION,
-            azure_endpoint=Config.AZURE_OPENAI_ENDPOINT
-        )
-        self.deployment_name = Config.AZURE_DEPLOYMENT_NAME
-
-    def extract_text_from_image(self, image_data: bytes) -> Optional[Dict[str, Any]]:
-        """
-        从图片中提取英文文章内容
-        
-        Args:
-            image_data (bytes): 图片的二进制数据
-            
-        Returns:
-            Dict: 包含提取结果的字典
-        """
-        try:
-            # 将图片转换为base64编码
-            base64_image = base64.b64encode(image_data).decode('utf-8')
-            
-            # 构建专门用于OCR的提示词
-            system_prompt = """You are a professional OCR (Optical Character Recognition) assistant. Your task is to extract all English text content from the uploaded image accurately.
-
-IMPORTANT INSTRUCTIONS:
-1. Extract ALL visible English text from the image, maintaining the original structure and formatting as much as possible
-2. If the image contains an English article, essay, or document, transcribe it completely
-3. Preserve paragraph breaks, bullet points, and basic formatting
-4. If there are titles, headings, or subheadings, include them
-5. Only extract text - do not add explanations, comments, or descriptions about the image
-6. If the text is unclear or partially obscured, do your best to transcribe what is visible
-7. If no English text is found, respond with "No English text detected in the image"
+# 分析提示词版本，修改analyze_text的提示词时需要递增，使旧的缓存结果失效
+ANALYSIS_PROMPT_VERSION = '1'
 
-Please provide the extracted text directly without any additional commentary."""
+# OCR提示词版本，修改extract_text_from_image的提示词时需要递增，使旧的OCR缓存失效
+OCR_PROMPT_VERSION = '1'
 
-            user_prompt = "Please extract all English text content from this image:"
-            
-            # 调用GPT-4 Vision API
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,  # 需要支持vision的模型
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": user_prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                temperature=0.1,  # 低温度确保准确性
-                max_tokens=2000
-            )
-            
-            extracted_text = response.choices[0].message.content
-            
-            # 检查是否成功提取到文本
-            if extracted_text and extracted_text.strip() != "No English text detected in the image":
-                return {
-                    'success': True,
-                    'extracted_text': extracted_text.strip(),
-                    'tokens_used': response.usage.total_tokens if response.usage else 0
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': '图片中未检测到英文文本或文本不清晰',
-                    'extracted_text': None
-                }
-            
-        except Exception as e:
-            logger.error(f"图片文字识别失败: {str(e)}")
-            return {
-                'success': False,
-                'error': f'图片识别失败: {str(e)}',
-                'extracted_text': None
-            }
-    
-    def analyze_text(self, text: str) -> Optional[Dict[str, Any]]:
-        """
-        分析英文文本，提取主要思想和结构
-        
-        Args:
-            text (str): 需要分析的英文文本
-            
-        Returns:
-            Dict: 包含分析结果的字典
-        """
-        try:
-            # 构建专门用于阅读理解分析的提示词
-            system_prompt = """You are a professional English reading comprehension analyst. Please analyze the provided English article and extract its main ideas and structure to help high school students better understand the text.
+# 阅读理解分析的系统提示词
+ANALYSIS_SYSTEM_PROMPT = """You are a professional English reading comprehension analyst. Please analyze the provided English article and extract its main ideas and structure to help high school students better understand the text.
 
 IMPORTANT: Please output the analysis results in the EXACT format below (using markdown format). Each section must contain both English and Chinese content:
 
@@ -151,14 +67,298 @@ IMPORTANT: Please output the analysis results in the EXACT format below (using m
 Please ensure each section has 2-4 bullet points, with each point containing both English and Chinese content. Keep the analysis well-organized and suitable for high school students' comprehension level.
 """
 
-            user_prompt = f"Please analyze the following English article:\n\n{text}"
+# 专门用于OCR的提示词
+OCR_SYSTEM_PROMPT = """You are a professional OCR (Optical Character Recognition) assistant. Your task is to extract all English text content from the uploaded image accurately.
+
+IMPORTANT INSTRUCTIONS:
+1. Extract ALL visible English text from the image, maintaining the original structure and formatting as much as possible
+2. If the image contains an English article, essay, or document, transcribe it completely
+3. Preserve paragraph breaks, bullet points, and basic formatting
+4. If there are titles, headings, or subheadings, include them
+5. Only extract text - do not add explanations, comments, or descriptions about the image
+6. If the text is unclear or partially obscured, do your best to transcribe what is visible
+7. If no English text is found, respond with "No English text detected in the image"
+
+Please provide the extracted text directly without any additional commentary."""
+
+OCR_USER_PROMPT = "Please extract all English text content from this image:"
+
+# 图片中没有英文文本时模型的固定回复
+OCR_NO_TEXT_REPLY = "No English text detected in the image"
+
+# 触发故障转移的错误：限流、服务端错误、网络错误、等待配额超时
+_FAILOVER_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+    RateLimitTimeout
+)
+
+# 进程级请求合并器：相同输入的并发请求只调用一次Azure
+_ocr_flight = SingleFlight('extract_text_from_image')
+
+class OpenAIService:
+    """Azure OpenAI服务类"""
+    
+    def __init__(self, priority: int = PRIORITY_INTERACTIVE):
+        """
+        初始化Azure OpenAI服务（客户端从进程级连接池按部署获取共享实例）
+        
+        Args:
+            priority (int): 调用优先级，交互式请求优先于批量/后台任务获得配额
+        """
+        self.router = get_deployment_router()
+        # 逻辑模型名，用于缓存和请求合并的键；同一路由池中的部署应提供相同模型
+        self.deployment_name = Config.AZURE_DEPLOYMENT_NAME
+        self.priority = priority
+
+    def _create_completion(self, estimated_tokens: int, operation: str, **kwargs):
+        """
+        选择部署并通过调用调度器发起chat completions请求
+        （负载均衡、配额控制、响应头校准、退避重试，部署故障时自动切换到其他部署）
+        
+        流式请求的延迟统计以收到响应头为准
+        
+        Args:
+            estimated_tokens (int): 预估的token数
+            operation (str): 调用类型（analyze、ocr等），用于监控指标
+            **kwargs: chat.completions.create的参数（不含model）
+            
+        Returns:
+            ChatCompletion或Stream: 解析后的响应
+        """
+        with tracing.span('azure', operation=operation):
+            tried = set()
+            last_error = None
+        
+            while True:
+                deployment = self.router.acquire(exclude=tried)
+                if deployment is None:
+                    raise last_error
+                tried.add(deployment.name)
+            
+                client = get_openai_client(deployment.endpoint, deployment.api_key, deployment.api_version)
+                limiter = get_rate_limiter(deployment.name, deployment.rpm_limit, deployment.tpm_limit)
+                # 还有其他健康部署时不在当前部署上重试，直接故障转移
+                max_retries = 0 if self.router.has_alternative(tried) else None
+            
+                call = AzureCall(deployment.name, operation)
             
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                def send():
+                    call.begin()
+                    try:
+                        with tracing.span('azure.request', tracing.SPAN_KIND_CLIENT, deployment=deployment.name):
+                            return client.chat.completions.with_raw_response.create(
+                                model=deployment.deployment, **kwargs
+                            )
+                    except BaseException as e:
+                        call.fail(e)
+                        raise
+            
+                start = time.monotonic()
+                try:
+                    raw = limiter.call(send, estimated_tokens, self.priority, max_retries=max_retries)
+                except _FAILOVER_ERRORS as e:
+                    if isinstance(e, RateLimitTimeout):
+                        call.error(e)
+                    self.router.release(deployment, None, success=False)
+                    logger.warning(f"部署 {deployment.name} 调用失败({type(e).__name__})，尝试其他部署")
+                    last_error = e
+                    continue
+                except Exception:
+                    # 请求本身的错误（如参数错误）不代表部署故障
+                    self.router.release(deployment, None, success=True)
+                    raise
+            
+                self.router.release(deployment, time.monotonic() - start, success=True)
+                response = raw.parse()
+                # 以Azure返回的剩余配额为准校准本地令牌桶
+                limiter.update_from_headers(raw.headers)
+                if kwargs.get('stream'):
+                    return self._track_stream_usage(response, limiter, estimated_tokens, call)
+                call.finish(response.usage)
+                if response.usage:
+                    limiter.record_usage(estimated_tokens, response.usage.total_tokens)
+                return response
+
+    @staticmethod
+    def _track_stream_usage(stream, limiter, estimated_tokens: int, call: AzureCall):
+        """透传流式响应，在收到usage时修正配额用量，并记录首个token和完整输出的耗时"""
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                    limiter.record_usage(estimated_tokens, chunk.usage.total_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    call.first_token()
+                yield chunk
+        except BaseException as e:
+            # 包括客户端断开时生成器被关闭（GeneratorExit）
+            call.fail(e)
+            raise
+        else:
+            call.finish(usage)
+
+    def _run_single_flight(self, flight: SingleFlight, key: str, fn) -> Dict[str, Any]:
+        """
+        通过请求合并器执行上游调用，超时或异常统一转换为失败结果
+        
+        Args:
+            flight (SingleFlight): 请求合并器
+            key (str): 输入的唯一标识
+            fn: 实际执行的上游调用
+            
+        Returns:
+            Dict: 调用结果（每个调用方获得独立副本）
+        """
+        try:
+            result = flight.do(key, fn, timeout=Config.SINGLE_FLIGHT_TIMEOUT)
+        except TimeoutError as e:
+            logger.error(f"等待合并请求结果超时: {str(e)}")
+            return {'success': False, 'error': str(e)}
+        except Exception as e:
+            logger.error(f"合并请求执行失败: {str(e)}")
+            return {'success': False, 'error': str(e)}
+        return dict(result)
+
+    def extract_text_from_image(self, image_data: ImageSource) -> Optional[Dict[str, Any]]:
+        """
+        从图片中提取英文文章内容
+        
+        相同或近似相同（同一页面的重复拍摄）的图片优先使用OCR缓存，
+        相同图片的并发请求会合并为一次调用
+        
+        Args:
+            image_data (ImageSource): 图片的二进制数据或可seek的文件对象
+            
+        Returns:
+            Dict: 包含提取结果的字典
+        """
+        cache = get_ocr_cache()
+        namespace = f"{self.deployment_name}|{OCR_PROMPT_VERSION}"
+        if cache:
+            with tracing.span('ocr_cache_lookup') as stage:
+                sha256, phash = cache.fingerprint(image_data)
+                cached_result = cache.get(namespace, sha256, phash)
+                stage.set_attribute('hit', bool(cached_result))
+            if cached_result:
+                logger.info(f"OCR cache hit: {sha256}")
+                return {**cached_result, 'cached': True}
+        else:
+            sha256, phash = hash_image_source(image_data), None
+
+        result = self._run_single_flight(
+            _ocr_flight, f"{namespace}|{sha256}", lambda: self._extract_text_from_image(image_data)
+        )
+        if cache and result.get('success'):
+            cache.set(namespace, sha256, phash, {
+                'success': True,
+                'extracted_text': result['extracted_text'],
+                'tokens_used': result.get('tokens_used', 0)
+            })
+        result['cached'] = False
+        return result
+
+    def _extract_text_from_image(self, image_data: ImageSource) -> Optional[Dict[str, Any]]:
+        """
+        从图片中提取英文文章内容
+        
+        Args:
+            image_data (ImageSource): 图片的二进制数据或可seek的文件对象
+            
+        Returns:
+            Dict: 包含提取结果的字典
+        """
+        try:
+            # 缩放、灰度化并重新压缩，减少上传大小和vision token消耗
+            with tracing.span('image_preprocess'):
+                image = ImageService().preprocess(image_data)
+            
+            # 调用GPT-4 Vision API（需要支持vision的模型）
+            messages = self._build_ocr_messages(image)
+            response = self._create_completion(
+                estimate_tokens(OCR_SYSTEM_PROMPT + OCR_USER_PROMPT, 2000) + image['estimated_tokens'],
+                'ocr',
+                messages=messages,
+                temperature=0.1,  # 低温度确保准确性
+                max_tokens=2000
+            )
+            
+            return self._parse_ocr_response(response)
+            
+        except Exception as e:
+            logger.error(f"图片文字识别失败: {str(e)}")
+            return {
+                'success': False,
+                'error': f'图片识别失败: {str(e)}',
+                'extracted_text': None
+            }
+    
+    @staticmethod
+    def _parse_ocr_response(response) -> Dict[str, Any]:
+        """把OCR调用的响应转换为识别结果"""
+        extracted_text = response.choices[0].message.content
+        
+        # 检查是否成功提取到文本
+        if extracted_text and extracted_text.strip() != OCR_NO_TEXT_REPLY:
+            return {
+                'success': True,
+                'extracted_text': extracted_text.strip(),
+                'tokens_used': response.usage.total_tokens if response.usage else 0
+            }
+        return {
+            'success': False,
+            'error': '图片中未检测到英文文本或文本不清晰',
+            'extracted_text': None
+        }
+
+    @staticmethod
+    def _build_ocr_messages(image: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """构建OCR对话消息（image为ImageService.preprocess的结果）"""
+        base64_image = base64.b64encode(image['data']).decode('utf-8')
+        return [
+            {"role": "system", "content": OCR_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": OCR_USER_PROMPT},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{image['mime_type']};base64,{base64_image}",
+                            "detail": image['detail']
+                        }
+                    }
+                ]
+            }
+        ]
+
+    @staticmethod
+    def _build_analysis_messages(text: str) -> List[Dict[str, str]]:
+        """构建阅读理解分析的对话消息"""
+        user_prompt = f"Please analyze the following English article:\n\n{text}"
+        return [
+            {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def analyze_text(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        分析英文文本，提取主要思想和结构
+        
+        Args:
+            text (str): 需要分析的英文文本
+            
+        Returns:
+            Dict: 包含分析结果的字典
+        """
+        try:
+            messages = self._build_analysis_messages(text)
+            response = self._create_completion(
+                estimate_tokens(messages[0]['content'] + messages[1]['content'], 2000),
+                'analyze',
+                messages=messages,
                 temperature=0.3,
                 max_tokens=2000
             )
@@ -180,12 +380,60 @@ Please ensure each section has 2-4 bullet points, with each point containing bot
                 'analysis': None
             }
     
+    def stream_analyze_text(self, text: str) -> Iterator[Dict[str, Any]]:
+        """
+        以流式方式分析英文文本，逐段返回模型输出
+        
+        Args:
+            text (str): 需要分析的英文文本
+            
+        Yields:
+            Dict: {'type': 'delta', 'content': 增量文本}，
+                  结束时 {'type': 'done', 'analysis': 完整结果, 'tokens_used': token数量}，
+                  失败时 {'type': 'error', 'error': 错误信息}
+        """
+        try:
+            messages = self._build_analysis_messages(text)
+            stream = self._create_completion(
+                estimate_tokens(messages[0]['content'] + messages[1]['content'], 2000),
+                'analyze_stream',
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2000,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            
+            parts = []
+            tokens_used = 0
+            for chunk in stream:
+                if chunk.usage:
+                    tokens_used = chunk.usage.total_tokens
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    parts.append(content)
+                    yield {'type': 'delta', 'content': content}
+            
+            yield {
+                'type': 'done',
+                'analysis': ''.join(parts),
+                'tokens_used': tokens_used
+            }
+            
+        except Exception as e:
+            logger.error(f"OpenAI流式API调用失败: {str(e)}")
+            yield {'type': 'error', 'error': str(e)}
+    
     def test_connection(self) -> Dict[str, Any]:
         """测试Azure OpenAI连接"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[{"role": "user", "content": "Hello, this is a connection test."}],
+            test_prompt = "Hello, this is a connection test."
+            response = self._create_completion(
+                estimate_tokens(test_prompt, 50),
+                'test',
+                messages=[{"role": "user", "content": test_prompt}],
                 max_tokens=50
             )
             
@@ -0,0 +1,450 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import openai
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 调用优先级：交互式请求优先于批量/后台任务
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# 图片在high detail下的保守token估算
+IMAGE_TOKEN_ESTIMATE = 1105
+
+
+class RateLimitTimeout(Exception):
+    """等待调用配额超时"""
+
+
+def estimate_tokens(text: str, max_tokens: int = 0) -> int:
+    """
+    估算一次调用计入配额的token数
+
+    Azure按 prompt token + max_tokens 预估每次调用的配额占用；
+    prompt token按约4个字符1个token粗略估算（中文字符按1字符1token）
+
+    Args:
+        text (str): 提示词文本
+        max_tokens (int): 请求的最大输出token数
+
+    Returns:
+        int: 估算的token数
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars) + max_tokens
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    """从响应头中解析重试等待时间（秒）"""
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return None
+
+
+class _TokenBucket:
+    """令牌桶（调用方需持有锁）"""
+
+    def __init__(self, per_minute: int):
+        # 容量按10秒窗口计算，与Azure的短窗口限流方式一致，避免整分钟配额一次性突发
+        self.capacity = max(per_minute / 6.0, 1.0)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class RateLimiter:
+    """
+    Azure OpenAI调用调度器
+
+    - 请求数(RPM)和token数(TPM)两个令牌桶，配额为0表示不限制
+    - 等待者按优先级排队，交互式请求优先于批量请求
+    - 根据 x-ratelimit-remaining-* 响应头校准本地令牌桶
+    - 429时按 retry-after 暂停所有调用（没有该响应头时暂停 RATE_LIMIT_BACKOFF_BASE 秒），
+      失败的调用自身再按带抖动的指数退避等待后重试
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 safety_factor: float = 0.9):
+        """
+        初始化调度器
+
+        Args:
+            requests_per_minute (int): 每分钟请求配额
+            tokens_per_minute (int): 每分钟token配额
+            safety_factor (float): 实际使用的配额比例，留出余量避免触发429
+        """
+        self._requests = _TokenBucket(requests_per_minute * safety_factor) if requests_per_minute else None
+        self._tokens = _TokenBucket(tokens_per_minute * safety_factor) if tokens_per_minute else None
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._blocked_until = 0.0
+        # 协程等待者在事件循环中按先来后到排队，只有队首协程等待令牌桶
+        self._async_lock = None
+        self._async_waiting = 0
+        # 队首协程的唤醒事件：(事件循环, asyncio.Event)，线程中释放配额时通过 call_soon_threadsafe 唤醒
+        self._async_wakeups = set()
+
+        self._stats = {
+            'calls': 0,
+            'retries': 0,
+            'throttled': 0,
+            'failures': 0,
+            'wait_seconds': 0.0
+        }
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        """计算距离配额可用的等待时间（调用方需持有锁）"""
+        wait = max(self._blocked_until - now, 0.0)
+        if self._requests:
+            self._requests.refill(now)
+            wait = max(wait, self._requests.wait_time(1))
+        if self._tokens:
+            self._tokens.refill(now)
+            wait = max(wait, self._tokens.wait_time(tokens))
+        return wait
+
+    def _notify(self):
+        """唤醒等待配额的线程和协程（调用方需持有锁）"""
+        self._cond.notify_all()
+        for loop, event in self._async_wakeups:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # 事件循环已关闭
+                pass
+
+    def _take(self, tokens: int):
+        """占用一次调用的配额（调用方需持有锁）"""
+        if self._requests:
+            self._requests.level -= 1
+        if self._tokens:
+            self._tokens.level -= min(tokens, self._tokens.capacity)
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE, timeout: float = None):
+        """
+        按优先级等待并占用配额
+
+        Args:
+            tokens (int): 预估的token数
+            priority (int): 优先级，数值越小越优先
+            timeout (float): 最长等待时间（秒）
+
+        Raises:
+            RateLimitTimeout: 等待超时
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout else None
+        ticket = (priority, next(self._seq))
+
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._waiters[0] == ticket:
+                        wait = self._wait_time(tokens, now)
+                        if wait <= 0:
+                            self._take(tokens)
+                            self._stats['wait_seconds'] += now - start
+                            return
+
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise RateLimitTimeout(f'等待Azure OpenAI调用配额超时（{timeout}秒）')
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._notify()
+
+    async def acquire_async(self, tokens: int, priority: int = PRIORITY_INTERACTIVE, timeout: float = None):
+        """
+        acquire 的协程版本：在事件循环中等待配额，不占用线程
+
+        同一事件循环中的协程按到达顺序排队；线程中有优先级相同或更高的等待者时让其先获得配额，
+        等到线程离开队列或实际用量修正释放配额时被唤醒，不轮询
+
+        Args:
+            tokens (int): 预估的token数
+            priority (int): 优先级，数值越小越优先
+            timeout (float): 最长等待时间（秒）
+
+        Raises:
+            RateLimitTimeout: 等待超时
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout else None
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+
+        self._async_waiting += 1
+        try:
+            try:
+                await asyncio.wait_for(self._async_lock.acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise RateLimitTimeout(f'等待Azure OpenAI调用配额超时（{timeout}秒）')
+            wakeup = (asyncio.get_running_loop(), asyncio.Event())
+            try:
+                while True:
+                    now = time.monotonic()
+                    with self._cond:
+                        if self._waiters and self._waiters[0][0] <= priority:
+                            wait = None
+                        else:
+                            wait = self._wait_time(tokens, now)
+                            if wait <= 0:
+                                self._take(tokens)
+                                self._stats['wait_seconds'] += now - start
+                                return
+                        # 在锁内登记，检查之后的释放都能唤醒这里
+                        wakeup[1].clear()
+                        self._async_wakeups.add(wakeup)
+
+                    try:
+                        if deadline is not None:
+                            remaining = deadline - now
+                            if remaining <= 0:
+                                raise RateLimitTimeout(f'等待Azure OpenAI调用配额超时（{timeout}秒）')
+                            wait = remaining if wait is None else min(wait, remaining)
+                        try:
+                            await asyncio.wait_for(wakeup[1].wait(), wait)
+                        except asyncio.TimeoutError:
+                            pass
+                    finally:
+                        with self._cond:
+                            self._async_wakeups.discard(wakeup)
+            finally:
+                self._async_lock.release()
+        finally:
+            self._async_waiting -= 1
+
+    def record_usage(self, estimated: int, actual: int):
+        """
+        用实际token用量修正令牌桶
+
+        Args:
+            estimated (int): 调用前的估算值
+            actual (int): 实际用量
+        """
+        if not self._tokens or not actual:
+            return
+        with self._cond:
+            self._tokens.level += min(estimated, self._tokens.capacity) - actual
+            self._notify()
+
+    def update_from_headers(self, headers):
+        """
+        根据Azure返回的剩余配额响应头校准令牌桶
+
+        Args:
+            headers: 响应头
+        """
+        if not headers:
+            return
+        with self._cond:
+            for bucket, name in ((self._requests, 'x-ratelimit-remaining-requests'),
+                                 (self._tokens, 'x-ratelimit-remaining-tokens')):
+                value = headers.get(name)
+                if bucket is None or value is None:
+                    continue
+                try:
+                    remaining = float(value)
+                except ValueError:
+                    continue
+                bucket.refill(time.monotonic())
+                if remaining < bucket.level:
+                    bucket.level = remaining
+
+    def penalize(self, retry_after: float):
+        """收到429后在retry_after秒内暂停所有调用（不含单个调用的退避时间）"""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            self._stats['throttled'] += 1
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int,
+             priority: int = PRIORITY_INTERACTIVE, max_retries: int = None) -> Any:
+        """
+        在配额内执行一次Azure OpenAI调用，遇到可重试错误时退避重试
+
+        Args:
+            fn (Callable): 执行调用，返回 with_raw_response 的原始响应
+                （成功响应的配额响应头由调用方在修正实际用量后通过update_from_headers同步）
+            estimated_tokens (int): 预估的token数
+            priority (int): 优先级
+            max_retries (int): 最大重试次数，默认使用RATE_LIMIT_MAX_RETRIES
+
+        Returns:
+            Any: fn的返回值
+        """
+        if max_retries is None:
+            max_retries = Config.RATE_LIMIT_MAX_RETRIES
+        attempt = 0
+        while True:
+            self.acquire(estimated_tokens, priority, timeout=Config.RATE_LIMIT_QUEUE_TIMEOUT)
+            try:
+                raw = fn()
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                delay = self._retry_delay(e, attempt, max_retries)
+                attempt += 1
+                time.sleep(delay)
+                continue
+
+            with self._cond:
+                self._stats['calls'] += 1
+            return raw
+
+    async def call_async(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int,
+                         priority: int = PRIORITY_INTERACTIVE, max_retries: int = None) -> Any:
+        """
+        call 的协程版本：排队等待配额和退避重试期间不占用线程
+
+        Args:
+            fn (Callable): 返回协程的调用，协程结果为 with_raw_response 的原始响应
+            estimated_tokens (int): 预估的token数
+            priority (int): 优先级
+            max_retries (int): 最大重试次数，默认使用RATE_LIMIT_MAX_RETRIES
+
+        Returns:
+            Any: fn返回的协程的结果
+        """
+        if max_retries is None:
+            max_retries = Config.RATE_LIMIT_MAX_RETRIES
+        attempt = 0
+        while True:
+            await self.acquire_async(estimated_tokens, priority, timeout=Config.RATE_LIMIT_QUEUE_TIMEOUT)
+            try:
+                raw = await fn()
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                delay = self._retry_delay(e, attempt, max_retries)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            with self._cond:
+                self._stats['calls'] += 1
+            return raw
+
+    def _retry_delay(self, error: Exception, attempt: int, max_retries: int) -> float:
+        """
+        处理一次可重试错误：同步响应头中的配额，429时按 retry-after 暂停所有调用，计算本次调用的退避时间
+
+        Args:
+            error (Exception): 调用抛出的异常
+            attempt (int): 已重试次数
+            max_retries (int): 最大重试次数
+
+        Returns:
+            float: 重试前的等待时间（秒）
+
+        Raises:
+            Exception: 已达到最大重试次数时重新抛出error
+        """
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+        self.update_from_headers(headers)
+        retry_after = _parse_retry_after(headers)
+        backoff = Config.RATE_LIMIT_BACKOFF_BASE * (2 ** attempt) * random.uniform(0.5, 1.5)
+        delay = min(max(retry_after or 0.0, backoff), Config.RATE_LIMIT_BACKOFF_MAX)
+        if isinstance(error, openai.RateLimitError):
+            # 其它调用只需等到服务端要求的时间；指数退避只作用于失败的这次调用
+            pause = retry_after if retry_after is not None else Config.RATE_LIMIT_BACKOFF_BASE
+            self.penalize(min(pause, Config.RATE_LIMIT_BACKOFF_MAX))
+
+        if attempt >= max_retries:
+            with self._cond:
+                self._stats['failures'] += 1
+            raise error
+        with self._cond:
+            self._stats['retries'] += 1
+        logger.warning(f"Azure OpenAI调用失败({type(error).__name__})，{delay:.1f}秒后第{attempt + 1}次重试")
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        """获取调度统计"""
+        with self._cond:
+            now = time.monotonic()
+            self._wait_time(0, now)
+            return {
+                **self._stats,
+                'queued': len(self._waiters) + self._async_waiting,
+                'requests_available': round(self._requests.level, 1) if self._requests else None,
+                'tokens_available': round(self._tokens.level, 1) if self._tokens else None,
+                'blocked_for': round(max(self._blocked_until - now, 0.0), 2)
+            }
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiter_lock = threading.Lock()
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：丢弃从父进程继承的调度器（含等待队列和锁），下次使用时重新创建"""
+    global _limiters, _limiter_lock
+    _limiters = {}
+    _limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str = 'default', requests_per_minute: int = None,
+                     tokens_per_minute: int = None) -> RateLimiter:
+    """
+    获取进程级共享的调用调度器（每个部署一个，配额相互独立）
+
+    Args:
+        name (str): 部署名
+        requests_per_minute (int): 每分钟请求配额，默认使用AZURE_RPM_LIMIT
+        tokens_per_minute (int): 每分钟token配额，默认使用AZURE_TPM_LIMIT
+
+    Returns:
+        RateLimiter: 调度器
+    """
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiter_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = RateLimiter(
+                    requests_per_minute=Config.AZURE_RPM_LIMIT if requests_per_minute is None else requests_per_minute,
+                    tokens_per_minute=Config.AZURE_TPM_LIMIT if tokens_per_minute is None else tokens_per_minute,
+                    safety_factor=Config.RATE_LIMIT_SAFETY_FACTOR
+                )
+                _limiters[name] = limiter
+    return limiter
+
+
+def all_rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """获取所有部署调度器的统计"""
+    with _limiter_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
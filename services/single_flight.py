@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """一次正在进行中的上游调用"""
+
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    并发请求合并
+
+    相同key的并发调用只会执行一次fn，其余调用方等待并共享同一结果；
+    fn抛出的异常会传递给每一个等待者
+    """
+
+    def __init__(self, name: str = 'default'):
+        """
+        初始化请求合并器
+
+        Args:
+            name (str): 名称，仅用于日志
+        """
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        执行或加入一次调用
+
+        Args:
+            key (str): 输入的唯一标识
+            fn (Callable): 实际执行的上游调用
+            timeout (float): 等待者的最长等待时间（秒），None表示一直等待
+
+        Returns:
+            Any: fn的返回值
+
+        Raises:
+            TimeoutError: 等待者超时
+            Exception: fn抛出的异常
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            logger.info(f"[{self.name}] Joining in-flight call: {key}")
+            if not call.event.wait(timeout):
+                raise TimeoutError(f'等待相同请求的结果超时（{timeout}秒）')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            if call.waiters:
+                logger.info(f"[{self.name}] Shared result with {call.waiters} waiting caller(s): {key}")
+            call.event.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        """当前正在进行中的调用数量"""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    协程版本的并发请求合并（只在一个事件循环中使用）
+
+    相同key的并发调用只会执行一次fn；fn在独立的Task中运行，
+    发起调用的请求断开（协程被取消）时不会中断上游调用，其余等待者仍能获得结果
+    """
+
+    def __init__(self, name: str = 'default'):
+        """
+        初始化请求合并器
+
+        Args:
+            name (str): 名称，仅用于日志
+        """
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """
+        执行或加入一次调用
+
+        Args:
+            key (str): 输入的唯一标识
+            fn (Callable): 返回协程的上游调用
+            timeout (float): 等待者的最长等待时间（秒），None表示一直等待
+
+        Returns:
+            Any: fn的返回值
+
+        Raises:
+            TimeoutError: 等待者超时
+            Exception: fn抛出的异常
+        """
+        task = self._calls.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            logger.info(f"[{self.name}] Joining in-flight call: {key}")
+            self._waiters[key] += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), None if leader else timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f'等待相同请求的结果超时（{timeout}秒）')
+
+    def _finish(self, key: str, task: asyncio.Task):
+        """调用结束：移除记录，并读取异常，避免所有调用方都已取消时产生未读取异常的警告"""
+        waiters = 0
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            waiters = self._waiters.pop(key, 0)
+        if not task.cancelled():
+            task.exception()
+        if waiters:
+            logger.info(f"[{self.name}] Shared result with {waiters} waiting caller(s): {key}")
+
+    def in_flight(self) -> int:
+        """当前正在进行中的调用数量"""
+        return len(self._calls)
@@ -0,0 +1,357 @@
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+from config import Config
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # 只有使用S3存储时需要
+    boto3 = None
+    ClientError = None
+
+logger = logging.getLogger(__name__)
+
+# 允许下载的存储键：分片存储的生成文件、导出缓存，以及旧版平铺在根目录的.xmind文件
+# （UPLOAD_FOLDER中的其它文件如分析缓存、追踪日志不对外提供）
+_DOWNLOAD_KEY_RE = re.compile(r'^(exports/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+$|^[^/]+\.xmind$')
+
+
+class StoredObject(NamedTuple):
+    """存储对象的元数据"""
+    key: str
+    size: int
+    modified: float  # 最后修改时间（Unix时间戳）
+    etag: Optional[str] = None  # 存储后端提供的ETag（本地存储为None）
+
+
+def shard_key(content_hash: str, extension: str, prefix: str = '') -> str:
+    """
+    生成按内容哈希分片的存储键，如 ab/cd/abcd1234....xmind
+
+    前两级目录各取哈希的两个字符，每级最多256个子目录，
+    单个目录中的文件数随总量增长保持在可控范围
+
+    Args:
+        content_hash (str): 十六进制内容哈希
+        extension (str): 扩展名（不含点）
+        prefix (str): 键前缀，如 exports
+
+    Returns:
+        str: 存储键（以 / 分隔）
+    """
+    key = f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.{extension}"
+    return f"{prefix.strip('/')}/{key}" if prefix else key
+
+
+def hash_from_key(key: str) -> Optional[str]:
+    """从分片存储键中取出内容哈希，不是分片键时返回None"""
+    parts = key.split('/')
+    if len(parts) < 3:
+        return None
+    content_hash = parts[-1].split('.', 1)[0]
+    if parts[-3] != content_hash[:2] or parts[-2] != content_hash[2:4]:
+        return None
+    return content_hash
+
+
+def is_download_key(key: str) -> bool:
+    """是否为允许通过 /downloads 下载的存储键"""
+    if not _DOWNLOAD_KEY_RE.match(key):
+        return False
+    return '/' not in key or hash_from_key(key) is not None
+
+
+class StorageBackend:
+    """
+    文件存储接口
+
+    键为以 / 分隔的相对路径；put 必须是原子的，读取方不会看到写了一半的对象
+    """
+
+    def put(self, key: str, data: bytes, content_type: str = 'application/octet-stream'):
+        """写入对象（覆盖已存在的同名对象）"""
+        raise NotImplementedError
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        """获取对象元数据，不存在时返回None"""
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        """打开对象读取，不存在时抛出FileNotFoundError"""
+        raise NotImplementedError
+
+    def delete_many(self, keys: List[str]) -> List[str]:
+        """批量删除对象，返回实际删除的键（不存在的对象忽略）"""
+        raise NotImplementedError
+
+    def touch(self, key: str):
+        """记录对象被访问（更新最近访问时间），不支持时忽略"""
+        return None
+
+    def iter_objects(self, prefix: str = '') -> Iterator[StoredObject]:
+        """遍历前缀下的所有对象"""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        """对象在本地文件系统中的路径（可直接sendfile），非本地存储返回None"""
+        return None
+
+    def url(self, key: str, download_name: str = None) -> Optional[str]:
+        """对象的临时直接下载地址，不支持时返回None"""
+        return None
+
+    def exists(self, key: str) -> bool:
+        """对象是否存在"""
+        return self.stat(key) is not None
+
+
+def _valid_key(key: str) -> bool:
+    """键只能是相对路径，不能包含 .. 或空路径段"""
+    parts = key.split('/')
+    return bool(key) and not key.startswith('/') and all(part not in ('', '.', '..') for part in parts) \
+        and '\\' not in key and '\x00' not in key
+
+
+class LocalStorage(StorageBackend):
+    """本地文件系统存储：先写同目录下的临时文件再rename，保证原子替换"""
+
+    def __init__(self, root: str):
+        """
+        初始化本地存储
+
+        Args:
+            root (str): 存储根目录
+        """
+        self.root = os.path.abspath(root)
+
+    def local_path(self, key: str) -> Optional[str]:
+        if not _valid_key(key):
+            return None
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key: str, data: bytes, content_type: str = 'application/octet-stream'):
+        path = self.local_path(key)
+        if path is None:
+            raise ValueError(f"Invalid storage key: {key}")
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        path = self.local_path(key)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        return StoredObject(key, stat.st_size, max(stat.st_atime, stat.st_mtime))
+
+    def open(self, key: str) -> BinaryIO:
+        path = self.local_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        return open(path, 'rb')
+
+    def touch(self, key: str):
+        """只更新atime（mtime保持不变），noatime挂载时下载也能被其他进程的清理器看到"""
+        path = self.local_path(key)
+        if path is None:
+            return
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+
+    def delete_many(self, keys: List[str]) -> List[str]:
+        deleted = []
+        for key in keys:
+            path = self.local_path(key)
+            if path is None:
+                continue
+            try:
+                os.remove(path)
+                deleted.append(key)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"删除文件失败 {path}: {str(e)}")
+        return deleted
+
+    def iter_objects(self, prefix: str = '') -> Iterator[StoredObject]:
+        """用os.scandir递归遍历目录（每个条目一次stat），最近访问时间取atime与mtime中较新的一个"""
+        start = self.local_path(prefix.strip('/')) if prefix.strip('/') else self.root
+        if start is None:
+            return
+        stack = [start]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                                continue
+                            if not entry.is_file(follow_symlinks=False):
+                                continue
+                            stat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        key = os.path.relpath(entry.path, self.root).replace(os.sep, '/')
+                        yield StoredObject(key, stat.st_size, max(stat.st_atime, stat.st_mtime))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+
+class S3Storage(StorageBackend):
+    """S3兼容对象存储（AWS S3、MinIO等）；PUT本身是原子的，下载通过预签名地址直连存储"""
+
+    # DeleteObjects单次请求的最大键数
+    _DELETE_BATCH = 1000
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: str = None, region: str = None,
+                 access_key: str = None, secret_key: str = None, url_expires: int = 3600):
+        """
+        初始化S3存储
+
+        Args:
+            bucket (str): 存储桶
+            prefix (str): 所有键的公共前缀
+            endpoint_url (str): S3兼容服务地址（如MinIO），为空时使用AWS
+            region (str): 区域
+            access_key (str): 访问密钥ID，为空时使用boto3默认凭据链
+            secret_key (str): 访问密钥
+            url_expires (int): 预签名下载地址有效期（秒）
+        """
+        if boto3 is None:
+            raise RuntimeError('S3 storage requires boto3, please install it: pip install boto3')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.url_expires = url_expires
+        self._client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None
+        )
+
+    def _object_key(self, key: str) -> str:
+        if not _valid_key(key):
+            raise ValueError(f"Invalid storage key: {key}")
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _storage_key(self, object_key: str) -> str:
+        return object_key[len(self.prefix) + 1:] if self.prefix else object_key
+
+    def put(self, key: str, data: bytes, content_type: str = 'application/octet-stream'):
+        self._client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data, ContentType=content_type)
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        if not _valid_key(key):
+            return None
+        try:
+            head = self._client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return StoredObject(key, head['ContentLength'], head['LastModified'].timestamp(),
+                            head.get('ETag', '').strip('"') or None)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self._client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(key)
+            raise
+
+    def delete_many(self, keys: List[str]) -> List[str]:
+        deleted = []
+        keys = [key for key in keys if _valid_key(key)]
+        for i in range(0, len(keys), self._DELETE_BATCH):
+            batch = keys[i:i + self._DELETE_BATCH]
+            response = self._client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': self._object_key(key)} for key in batch],
+                'Quiet': False
+            })
+            deleted.extend(self._storage_key(item['Key']) for item in response.get('Deleted', []))
+            for error in response.get('Errors', []):
+                logger.warning(f"删除对象失败 {error.get('Key')}: {error.get('Message')}")
+        return deleted
+
+    def iter_objects(self, prefix: str = '') -> Iterator[StoredObject]:
+        list_prefix = '/'.join(part for part in (self.prefix, prefix.strip('/')) if part)
+        if list_prefix:
+            list_prefix += '/'
+        paginator = self._client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=list_prefix):
+            for item in page.get('Contents', []):
+                yield StoredObject(self._storage_key(item['Key']), item['Size'],
+                                   item['LastModified'].timestamp(), item.get('ETag', '').strip('"') or None)
+
+    def url(self, key: str, download_name: str = None) -> Optional[str]:
+        params = {'Bucket': self.bucket, 'Key': self._object_key(key)}
+        if download_name:
+            params['ResponseContentDisposition'] = f'attachment; filename="{download_name}"'
+        return self._client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_expires)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：对象存储客户端的连接不能跨进程共享，丢弃后下次使用时重新创建"""
+    global _storage, _storage_lock
+    _storage = None
+    _storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """
+    获取进程级共享的文件存储（由 STORAGE_BACKEND 选择）
+
+    Returns:
+        StorageBackend: 存储实例
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                backend = Config.STORAGE_BACKEND.lower()
+                if backend == 's3':
+                    _storage = S3Storage(
+                        Config.STORAGE_S3_BUCKET,
+                        prefix=Config.STORAGE_S3_PREFIX,
+                        endpoint_url=Config.STORAGE_S3_ENDPOINT_URL,
+                        region=Config.STORAGE_S3_REGION,
+                        access_key=Config.STORAGE_S3_ACCESS_KEY,
+                        secret_key=Config.STORAGE_S3_SECRET_KEY,
+                        url_expires=Config.STORAGE_S3_URL_EXPIRES
+                    )
+                elif backend == 'local':
+                    _storage = LocalStorage(Config.UPLOAD_FOLDER)
+                else:
+                    raise ValueError(f"Unknown STORAGE_BACKEND: {Config.STORAGE_BACKEND}")
+                logger.info(f"Using {backend} file storage")
+    return _storage
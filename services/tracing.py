@@ -0,0 +1,578 @@
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 请求头：值为1且带有效Bearer token时强制追踪该请求，并在JSON响应中附加各阶段耗时（trace字段）
+DEBUG_HEADER = 'X-Trace-Debug'
+
+# OpenTelemetry的span类型
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+# W3C Trace Context: version-trace_id-parent_id-flags
+_TRACEPARENT_RE = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# 当前协程/线程正在执行的span（未采样的请求为None，此时 span() 不做任何记录）
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('current_span', default=None)
+
+
+class Trace:
+    """一次请求的追踪记录"""
+
+    __slots__ = ('trace_id', 'debug', 'spans')
+
+    def __init__(self, trace_id: str, debug: bool = False):
+        self.trace_id = trace_id
+        self.debug = debug
+        self.spans: List['Span'] = []
+
+
+class Span:
+    """
+    追踪中的一个阶段
+
+    用作上下文管理器时，阶段内创建的span都是它的子span；
+    也可以只创建后调用 end() 记录一段不包含其他阶段的耗时
+    """
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'attributes',
+                 'start_ns', '_start_perf', 'duration_ns', 'error', '_token')
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str] = None,
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self._start_perf = perf_counter_ns()
+        self.duration_ns = None
+        self.error = None
+        self._token = None
+        # list.append是原子操作，多页OCR等并发阶段可以在不同线程中结束
+        trace.spans.append(self)
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.duration_ns is None:
+            self.duration_ns = perf_counter_ns() - self._start_perf
+
+    def elapsed_ms(self) -> float:
+        """已结束时为阶段耗时，否则为到目前为止的耗时（毫秒）"""
+        duration = self.duration_ns if self.duration_ns is not None else perf_counter_ns() - self._start_perf
+        return duration / 1e6
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.record_error(exc)
+        self.end()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # 在创建token的上下文之外结束（如流式响应），直接清除
+            _current_span.set(None)
+        return False
+
+
+class _NoopSpan:
+    """未采样时使用的空span"""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """
+    创建当前span的子span；当前请求未采样时返回空span，开销只有一次ContextVar读取
+
+    Args:
+        name (str): 阶段名称（同时用作Server-Timing的指标名，只使用字母、数字、下划线和点）
+        kind (int): span类型
+        **attributes: span属性
+
+    Returns:
+        Span: 可用作上下文管理器
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, kind, attributes)
+
+
+def current_span():
+    """当前正在执行的span，未采样时为空span"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def bind(fn: Callable) -> Callable:
+    """
+    把当前追踪上下文绑定到函数上，用于提交到线程池执行的任务（线程池不会自动传递ContextVar）
+
+    Args:
+        fn (Callable): 要在其他线程中执行的函数
+
+    Returns:
+        Callable: 未采样时原样返回
+    """
+    if _current_span.get() is None:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def _should_sample(parent_sampled: Optional[bool], debug: bool) -> bool:
+    """采样决策：调试请求总是追踪；上游已做出决策时沿用；否则按 TRACING_SAMPLE_RATE 随机采样"""
+    if debug:
+        return True
+    if parent_sampled is not None:
+        return parent_sampled
+    rate = Config.TRACING_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def is_debug_request(headers) -> bool:
+    """
+    请求是否为调试请求：X-Trace-Debug: 1 只对带有效Bearer token的请求生效，
+    匿名请求不能借此绕过采样，也拿不到各阶段耗时
+
+    Args:
+        headers: 请求头（Flask或Starlette的请求头对象）
+
+    Returns:
+        bool: 是否为调试请求
+    """
+    if headers.get(DEBUG_HEADER) != '1':
+        return False
+    auth_header = headers.get('Authorization') or ''
+    if not auth_header.startswith('Bearer '):
+        return False
+    from services.auth_service import get_token_verifier  # auth_service导入了本模块
+    return get_token_verifier().verify(auth_header[7:]) is not None
+
+
+def start_request(name: str, traceparent: Optional[str] = None, debug: bool = False,
+                  **attributes) -> Optional[Span]:
+    """
+    开始追踪一个请求，采样时创建根span并设为当前span
+
+    Args:
+        name (str): 根span名称，如 "POST /api/analyze/text"
+        traceparent (str): 请求的W3C traceparent头，存在时延续上游的trace
+        debug (bool): 是否为调试请求（强制采样，响应中附加各阶段耗时）
+        **attributes: 根span属性
+
+    Returns:
+        Span: 根span，未采样时为None
+    """
+    trace_id = parent_id = parent_sampled = None
+    if traceparent:
+        match = _TRACEPARENT_RE.match(traceparent.strip().lower())
+        if match:
+            trace_id, parent_id = match.group(1), match.group(2)
+            parent_sampled = bool(int(match.group(3), 16) & 0x01)
+
+    if not _should_sample(parent_sampled, debug):
+        return None
+
+    trace = Trace(trace_id or '%032x' % random.getrandbits(128), debug)
+    root = Span(trace, name, parent_id, SPAN_KIND_SERVER, attributes)
+    root.__enter__()
+    return root
+
+
+def finish_request(root: Optional[Span], status_code: Optional[int] = None, error: BaseException = None):
+    """
+    结束请求的根span并提交导出
+
+    Args:
+        root (Span): start_request 返回的根span
+        status_code (int): HTTP状态码
+        error (BaseException): 未处理的异常
+    """
+    if root is None:
+        return
+    if status_code is not None:
+        root.set_attribute('http.status_code', status_code)
+    root.__exit__(None, error, None)
+    processor = get_span_processor()
+    if processor:
+        processor.submit(root.trace.spans)
+
+
+def _stage_durations(root: Span) -> Dict[str, float]:
+    """根span下各阶段的耗时（毫秒，同名阶段累加，按开始顺序）"""
+    stages: Dict[str, float] = {}
+    for item in list(root.trace.spans):
+        if item.parent_id == root.span_id and item is not root:
+            stages[item.name] = stages.get(item.name, 0.0) + item.elapsed_ms()
+    return stages
+
+
+def server_timing(root: Span) -> str:
+    """
+    生成Server-Timing响应头（浏览器开发者工具的Timing面板可直接查看）
+
+    Args:
+        root (Span): 请求的根span
+
+    Returns:
+        str: 如 'auth;dur=0.4, parse_body;dur=0.1, azure;dur=812.3, total;dur=815.0, trace;desc="<trace_id>"'
+    """
+    entries = [f"{name};dur={duration:.1f}" for name, duration in _stage_durations(root).items()]
+    entries.append(f"total;dur={root.elapsed_ms():.1f}")
+    entries.append(f'trace;desc="{root.trace.trace_id}"')
+    return ', '.join(entries)
+
+
+def debug_info(root: Span) -> Dict[str, Any]:
+    """
+    调试请求附加到响应中的追踪信息
+
+    Args:
+        root (Span): 请求的根span
+
+    Returns:
+        Dict: trace_id、total_ms 和各span（相对请求开始的偏移、耗时、父span名称、属性）
+    """
+    spans = list(root.trace.spans)
+    names = {item.span_id: item.name for item in spans}
+    return {
+        'trace_id': root.trace.trace_id,
+        'total_ms': round(root.elapsed_ms(), 3),
+        'spans': [{
+            'name': item.name,
+            'parent': names.get(item.parent_id),
+            'offset_ms': round((item._start_perf - root._start_perf) / 1e6, 3),
+            'duration_ms': round(item.elapsed_ms(), 3),
+            'attributes': item.attributes,
+            'error': item.error
+        } for item in spans if item is not root]
+    }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """转换为OTLP/JSON的AnyValue"""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_span(item: Span) -> Dict[str, Any]:
+    """转换为OTLP/JSON的Span"""
+    duration = item.duration_ns if item.duration_ns is not None else perf_counter_ns() - item._start_perf
+    data = {
+        'traceId': item.trace.trace_id,
+        'spanId': item.span_id,
+        'name': item.name,
+        'kind': item.kind,
+        'startTimeUnixNano': str(item.start_ns),
+        'endTimeUnixNano': str(item.start_ns + duration),
+        'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in item.attributes.items()],
+        'status': {'code': 2, 'message': item.error} if item.error else {}
+    }
+    if item.parent_id:
+        data['parentSpanId'] = item.parent_id
+    return data
+
+
+def otlp_payload(spans: List[Span]) -> Dict[str, Any]:
+    """
+    生成OTLP/JSON格式的ExportTraceServiceRequest（OpenTelemetry Collector的 /v1/traces 可直接接收）
+
+    Args:
+        spans (List[Span]): 已结束的span
+
+    Returns:
+        Dict: 可序列化为JSON的导出请求
+    """
+    return {
+        'resourceSpans': [{
+            'resource': {
+                'attributes': [{'key': 'service.name', 'value': {'stringValue': Config.TRACING_SERVICE_NAME}}]
+            },
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [_otlp_span(item) for item in spans]
+            }]
+        }]
+    }
+
+
+class FileSpanExporter:
+    """把span以OTLP/JSON格式追加写入本地文件（每批一行，可用OpenTelemetry Collector的filelog/otlpjsonfile接收器读取）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: List[Span]):
+        line = json.dumps(otlp_payload(spans), ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def shutdown(self):
+        pass
+
+
+class OTLPHttpSpanExporter:
+    """通过OTLP/HTTP（JSON编码）把span发送到OpenTelemetry Collector"""
+
+    def __init__(self, endpoint: str, timeout: float = 10.0):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self._client = httpx.Client(timeout=timeout)
+
+    def export(self, spans: List[Span]):
+        response = self._client.post(
+            self.url, content=json.dumps(otlp_payload(spans)), headers={'Content-Type': 'application/json'}
+        )
+        response.raise_for_status()
+
+    def shutdown(self):
+        self._client.close()
+
+
+class BatchSpanProcessor:
+    """
+    在后台线程中批量导出已结束的span
+
+    请求线程只把span放入有界队列，不等待导出；队列已满时直接丢弃（计入dropped），
+    collector不可用时不会拖慢请求或占满内存
+    """
+
+    def __init__(self, exporter, max_queue: int = 2048, interval: float = 5.0, max_batch: int = 512):
+        """
+        Args:
+            exporter: FileSpanExporter 或 OTLPHttpSpanExporter
+            max_queue (int): 等待导出的请求（trace）数上限
+            interval (float): 导出间隔（秒）
+            max_batch (int): 单次导出的span数上限，达到时立即导出
+        """
+        self.exporter = exporter
+        self.interval = interval
+        self.max_batch = max_batch
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, spans: List[Span]):
+        """提交一个请求的全部span（不阻塞）"""
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None and not self._stopping.is_set():
+                self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.interval
+        while True:
+            # 最多等待0.5秒，以便及时响应停止
+            timeout = min(max(deadline - time.monotonic(), 0), 0.5)
+            try:
+                batch.extend(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            if len(batch) >= self.max_batch or time.monotonic() >= deadline or self._stopping.is_set():
+                self._export(batch)
+                batch = []
+                deadline = time.monotonic() + self.interval
+                if self._stopping.is_set() and self._queue.empty():
+                    return
+
+    def _export(self, batch: List[Span]):
+        if not batch:
+            return
+        try:
+            self.exporter.export(batch)
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning(f"导出追踪数据失败({len(batch)} spans): {str(e)}")
+
+    def shutdown(self, timeout: float = 5.0):
+        """导出队列中剩余的span后停止后台线程"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        else:
+            spans = []
+            while not self._queue.empty():
+                spans.extend(self._queue.get_nowait())
+            self._export(spans)
+        self.exporter.shutdown()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'exported': self.exported,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'queued': self._queue.qsize()
+        }
+
+
+_processor: Optional[BatchSpanProcessor] = None
+_processor_lock = threading.Lock()
+_processor_initialized = False
+
+
+def _build_exporter():
+    """根据 TRACING_EXPORTER 创建导出器，未配置时返回None"""
+    exporter = Config.TRACING_EXPORTER.lower()
+    if not exporter:
+        return None
+    if exporter == 'file':
+        path = Config.TRACING_EXPORT_FILE or os.path.join(Config.DATA_FOLDER, 'traces.jsonl')
+        logger.info(f"Exporting traces to file: {path}")
+        return FileSpanExporter(path)
+    if exporter == 'otlp':
+        logger.info(f"Exporting traces to OTLP collector: {Config.TRACING_OTLP_ENDPOINT}")
+        return OTLPHttpSpanExporter(Config.TRACING_OTLP_ENDPOINT)
+    logger.warning(f"未知的TRACING_EXPORTER: {Config.TRACING_EXPORTER}，不导出追踪数据")
+    return None
+
+
+def get_span_processor() -> Optional[BatchSpanProcessor]:
+    """
+    获取进程级的span导出器（线程安全）
+
+    Returns:
+        BatchSpanProcessor: 未配置 TRACING_EXPORTER 时为None（仍会返回Server-Timing响应头）
+    """
+    global _processor, _processor_initialized
+    if not _processor_initialized:
+        with _processor_lock:
+            if not _processor_initialized:
+                exporter = _build_exporter()
+                if exporter is not None:
+                    _processor = BatchSpanProcessor(
+                        exporter, Config.TRACING_MAX_QUEUE, Config.TRACING_EXPORT_INTERVAL
+                    )
+                    atexit.register(shutdown)
+                _processor_initialized = True
+    return _processor
+
+
+def shutdown():
+    """导出剩余的span并停止后台线程（进程退出时调用）"""
+    global _processor, _processor_initialized
+    with _processor_lock:
+        processor, _processor = _processor, None
+        _processor_initialized = False
+    if processor is not None:
+        processor.shutdown()
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：父进程的导出线程和队列不能继续使用，丢弃后下次使用时重新创建"""
+    global _processor, _processor_lock, _processor_initialized
+    _processor = None
+    _processor_lock = threading.Lock()
+    _processor_initialized = False
+    _current_span.set(None)
+
+
+def init_app(app):
+    """
+    为Flask应用注册请求追踪
+
+    按 TRACING_SAMPLE_RATE 采样（请求带已采样的traceparent，或已认证的请求带 X-Trace-Debug: 1 时总是追踪），
+    采样的请求在响应中带上Server-Timing头，调试请求的JSON响应中附加 trace 字段
+
+    Args:
+        app: Flask应用实例
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_trace():
+        rule = request.url_rule
+        route = rule.rule if rule is not None else 'unmatched'
+        root = start_request(
+            f"{request.method} {route}",
+            request.headers.get('traceparent'),
+            is_debug_request(request.headers),
+            **{'http.method': request.method, 'http.route': route}
+        )
+        if root is not None:
+            g._trace_root = root
+
+    @app.after_request
+    def _add_timing(response):
+        root = g.get('_trace_root')
+        if root is None:
+            return response
+        response.headers['Server-Timing'] = server_timing(root)
+        if root.trace.debug and response.is_json and not response.is_streamed:
+            data = response.get_json(silent=True)
+            if isinstance(data, dict):
+                data['trace'] = debug_info(root)
+                response.set_data(json.dumps(data, ensure_ascii=False))
+        root.set_attribute('http.status_code', response.status_code)
+        return response
+
+    @app.teardown_request
+    def _finish_trace(exc):
+        root = g.pop('_trace_root', None)
+        finish_request(root, error=exc)
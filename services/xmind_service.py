@@ -1,14 +1,48 @@
-import xmind
-import os
-import uuid
+import hashlib
 import re
 import logging
 from typing import Dict, Any, List, Optional
-from datetime import datetime
 from config import Config
+from services.storage import get_storage, shard_key
+from services.xmind_writer import xmind_bytes, DEFAULT_SHEET_TITLE
+from services.janitor import track_file
+from services.metrics import MINDMAP_PARSE_DURATION, XMIND_GENERATE_DURATION
 
 logger = logging.getLogger(__name__)
 
+# 固定的一级节点标题（思维导图第二层）
+SECTION_TITLES = (
+    'Main Theme',
+    'Article Structure',
+    'Key Arguments',
+    'Important Details',
+    'Language Features',
+    'Reading Comprehension Points'
+)
+_SECTION_TITLES_LOWER = tuple(title.lower() for title in SECTION_TITLES)
+
+# 章节关键词 -> 一级节点序号，按匹配优先级排列（中英文关键词）
+_SECTION_KEYWORDS = (
+    ('theme', 0), ('主题', 0),
+    ('structure', 1), ('结构', 1),
+    ('argument', 2), ('观点', 2), ('论点', 2),
+    ('detail', 3), ('细节', 3), ('事实', 3),
+    ('language', 4), ('feature', 4), ('语言', 4), ('特征', 4),
+    ('comprehension', 5), ('reading', 5), ('理解', 5), ('阅读', 5)
+)
+
+# 预编译的正则表达式
+_HEADER_NUMBER_RE = re.compile(r'^\d+\.\s*')
+_NUMBERED_ITEM_RE = re.compile(r'\d+\.\s')
+# 行内markdown标记：必须按粗体、斜体、代码的顺序依次替换（先去掉粗体，落单的*才不会与粗体标记配对）
+_BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+_ITALIC_RE = re.compile(r'\*(.*?)\*')
+_CODE_RE = re.compile(r'`(.*?)`')
+
+# 章节标题匹配结果缓存（模型输出的标题种类很少）
+_section_lookup_cache: Dict[str, Optional[int]] = {}
+_SECTION_LOOKUP_CACHE_SIZE = 1024
+
 class XMindService:
     """XMind思维导图生成服务"""
     
@@ -29,198 +63,43 @@ class XMindService:
         Returns:
             Dict: 解析后的思维导图结构化数据（固定3层）
         """
-        lines = markdown_text.split('\n')
-        
-        # 固定的3层结构
-        structure = {
-            'title': 'Article Analysis',
-            'children': [
-                {'title': 'Main Theme', 'children': []},
-                {'title': 'Article Structure', 'children': []},
-                {'title': 'Key Arguments', 'children': []},
-                {'title': 'Important Details', 'children': []},
-                {'title': 'Language Features', 'children': []},
-                {'title': 'Reading Comprehension Points', 'children': []}
-            ]
-        }
-        
-        # 创建一级节点的映射，便于快速查找
-        section_map = {}
-        for section in structure['children']:
-            section_map[section['title']] = section
-        
-        current_section = None
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # 一级标题 (# Article Analysis) - 忽略，使用固定标题
-            if line.startswith('# '):
-                continue
-                
-            # 二级标题 (## Main Theme, ## Article Structure, etc.)
-            elif line.startswith('## '):
-                section_title = line[3:].strip()
-                # 清理标题中的序号
-                section_title = re.sub(r'^\d+\.\s*', '', section_title)
-                
-                # 查找匹配的固定节点
-                current_section = None
-                for fixed_title, section in section_map.items():
-                    if fixed_title.lower() in section_title.lower() or section_title.lower() in fixed_title.lower():
-                        current_section = section
-                        break
-                        
-                # 如果没找到匹配的，根据关键词判断
-                if not current_section:
-                    title_lower = section_title.lower()
-                    if 'theme' in title_lower or '主题' in title_lower:
-                        current_section = section_map['Main Theme']
-                    elif 'structure' in title_lower or '结构' in title_lower:
-                        current_section = section_map['Article Structure']
-                    elif 'argument' in title_lower or '观点' in title_lower or '论点' in title_lower:
-                        current_section = section_map['Key Arguments']
-                    elif 'detail' in title_lower or '细节' in title_lower or '事实' in title_lower:
-                        current_section = section_map['Important Details']
-                    elif 'language' in title_lower or 'feature' in title_lower or '语言' in title_lower or '特征' in title_lower:
-                        current_section = section_map['Language Features']
-                    elif 'comprehension' in title_lower or 'reading' in title_lower or '理解' in title_lower or '阅读' in title_lower:
-                        current_section = section_map['Reading Comprehension Points']
-                
-            # 三级标题 (### 子标题) - 在固定3层结构中忽略
-            elif line.startswith('### '):
-                continue
-                    
-            # 列表项 (- 内容 或 * 内容) - 作为二级节点
-            elif (line.startswith('- ') or line.startswith('* ')) and current_section:
-                content = line[2:].strip()
-                if content:
-                    # 清理内容
-                    content = self._clean_content(content)
-                    if content:  # 确保清理后的内容不为空
-                        item = {'title': content, 'children': []}
-                        current_section['children'].append(item)
-                        
-            # 数字列表 (1. 内容) - 作为二级节点
-            elif re.match(r'^\d+\.\s', line) and current_section:
-                content = re.sub(r'^\d+\.\s', '', line).strip()
-                if content:
-                    content = self._clean_content(content)
-                    if content:
-                        item = {'title': content, 'children': []}
-                        current_section['children'].append(item)
-        
-        # 确保每个一级节点至少有一些内容，如果为空则添加占位内容
-        for section in structure['children']:
-            if not section['children']:
-                section['children'].append({
-                    'title': 'Content will be analyzed here - 此处将分析相关内容',
-                    'children': []
-                })
-        
-        return structure
+        with MINDMAP_PARSE_DURATION.time():
+            parser = MarkdownStructureParser()
+            parser.feed(markdown_text)
+            parser.close()
+        return parser.structure
     
-    def _clean_content(self, content: str) -> str:
-        """
-        清理和格式化内容文本
-        
-        Args:
-            content (str): 原始内容
-            
-        Returns:
-            str: 清理后的内容
-        """
-        if not content:
-            return ""
-            
-        # 移除markdown格式
-        content = re.sub(r'\*\*(.*?)\*\*', r'\1', content)  # 粗体
-        content = re.sub(r'\*(.*?)\*', r'\1', content)      # 斜体
-        content = re.sub(r'`(.*?)`', r'\1', content)        # 代码
-        
-        # 移除多余的空格和换行
-        content = re.sub(r'\s+', ' ', content).strip()
-        
-        # 如果内容太长，适当截取（保留完整句子）
-        if len(content) > 120:
-            # 尝试在句号处截断
-            sentences = content.split('.')
-            if len(sentences) > 1:
-                result = sentences[0] + '.'
-                if len(result) < 80 and len(sentences) > 1:
-                    result += sentences[1] + '.'
-                return result.strip()
-            else:
-                # 如果没有句号，在合适位置截断
-                return content[:100] + '...'
-        
-        return content
+    @staticmethod
+    def _clean_content(content: str) -> str:
+        """清理和格式化内容文本（兼容旧接口）"""
+        return _clean_content(content)
     
     def create_xmind_from_structure(self, structure: Dict[str, Any], original_text: str = "") -> Optional[str]:
         """
         根据结构化数据创建XMind文件
         
+        文件按内容哈希分片保存到文件存储（如 ab/cd/<sha256>.xmind）
+        
         Args:
             structure (Dict): 结构化的分析数据
             original_text (str): 原始文本，用于添加备注
             
         Returns:
-            str: 生成的XMind文件路径
+            str: 生成的XMind文件存储键
         """
         try:
             logger.info(f"Creating XMind file with structure: {structure.get('title', 'No title')}")
             
-            # 生成文件名 - 先创建文件名，XMind需要知道文件名才能创建
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            unique_id = str(uuid.uuid4())[:8]
-            filename = f"analysis_{timestamp}_{unique_id}.xmind"
-            
-            # 确保上传目录存在
-            if not os.path.exists(self.upload_folder):
-                os.makedirs(self.upload_folder)
-                logger.info(f"Created upload folder: {self.upload_folder}")
-            
-            filepath = os.path.join(self.upload_folder, filename)
-            logger.info(f"Creating XMind file at: {filepath}")
-            
-            # 创建workbook和sheet - 使用具体的文件路径
-            workbook = xmind.load(filepath)
-            sheet = workbook.getPrimarySheet()
-            sheet.setTitle("English Article Analysis")
-            logger.info("XMind workbook and sheet created successfully")
-            
-            # 获取根主题
-            root_topic = sheet.getRootTopic()
-            root_topic.setTitle(structure.get('title', 'Article Analysis'))
-            logger.info(f"Set root topic title: {structure.get('title', 'Article Analysis')}")
-            
-            # 添加原文摘要作为备注
-            if original_text:
-                preview = original_text[:200] + "..." if len(original_text) > 200 else original_text
-                root_topic.setPlainNotes(f"Original Text Preview:\n{preview}")
-                logger.info("Added original text preview as notes")
-            
-            # 递归添加子主题
-            children_count = len(structure.get('children', []))
-            logger.info(f"Adding {children_count} child topics")
-            self._add_topics_recursively(root_topic, structure.get('children', []))
-            logger.info("Child topics added successfully")
-            
-            # 保存文件
-            logger.info(f"Saving XMind file to: {filepath}")
-            xmind.save(workbook, filepath)
-            logger.info("XMind file saved successfully")
-            
-            # 验证文件是否创建
-            if os.path.exists(filepath):
-                file_size = os.path.getsize(filepath)
-                logger.info(f"XMind file created successfully: {filepath}, size: {file_size} bytes")
-                return filename
-            else:
-                logger.error("XMind file was not created!")
-                return None
+            # 直接序列化为.xmind，存储层保证原子写入，不会下载到写了一半的文件
+            with XMIND_GENERATE_DURATION.time():
+                data = xmind_bytes(structure, original_text, DEFAULT_SHEET_TITLE)
+                key = shard_key(hashlib.sha256(data).hexdigest(), 'xmind')
+                logger.info(f"Saving XMind file: {key}")
+                
+                get_storage().put(key, data, 'application/vnd.xmind.workbook')
+            track_file(key, len(data))
+            logger.info(f"XMind file created successfully: {key}, size: {len(data)} bytes")
+            return key
             
         except Exception as e:
             logger.error(f"Failed to create XMind file: {str(e)}")
@@ -228,24 +107,6 @@ class XMindService:
             logger.error(f"Full traceback: {traceback.format_exc()}")
             return None
     
-    def _add_topics_recursively(self, parent_topic, children: List[Dict[str, Any]]):
-        """
-        递归添加主题节点
-        
-        Args:
-            parent_topic: 父级主题节点
-            children (List): 子节点列表
-        """
-        for child_data in children:
-            # 创建子主题
-            child_topic = parent_topic.addSubTopic()
-            child_topic.setTitle(child_data.get('title', ''))
-            
-            # 如果有子节点，递归添加
-            child_children = child_data.get('children', [])
-            if child_children:
-                self._add_topics_recursively(child_topic, child_children)
-    
     def generate_xmind(self, markdown_analysis: str, original_text: str = "") -> Dict[str, Any]:
         """
         根据markdown分析结果生成XMind文件
@@ -292,4 +153,208 @@ class XMindService:
             return {
                 'success': False,
                 'error': str(e)
-            } 
\ No newline at end of file
+            }
+
+def _clean_content(content: str) -> str:
+    """
+    清理和格式化内容文本
+
+    Args:
+        content (str): 原始内容
+
+    Returns:
+        str: 清理后的内容
+    """
+    if not content:
+        return ""
+
+    # 移除markdown格式，不含标记时跳过正则
+    if '*' in content:
+        content = _BOLD_RE.sub(r'\1', content)  # 粗体
+        content = _ITALIC_RE.sub(r'\1', content)  # 斜体
+    if '`' in content:
+        content = _CODE_RE.sub(r'\1', content)  # 代码
+
+    # 移除多余的空格和换行
+    content = ' '.join(content.split())
+
+    # 如果内容太长，适当截取（保留完整句子）
+    if len(content) > 120:
+        # 尝试在句号处截断
+        sentences = content.split('.')
+        if len(sentences) > 1:
+            result = sentences[0] + '.'
+            if len(result) < 80 and len(sentences) > 1:
+                result += sentences[1] + '.'
+            return result.strip()
+        else:
+            # 如果没有句号，在合适位置截断
+            return content[:100] + '...'
+
+    return content
+
+
+class MarkdownStructureParser:
+    """
+    增量式markdown思维导图解析器
+    
+    通过feed(chunk)逐块推入模型输出，跨块保留未完成的行；
+    每完成一个 ## 章节或列表项即产生事件，close()后得到与
+    XMindService.parse_markdown_to_structure相同的固定3层结构
+    
+    事件格式:
+        {'type': 'section_start', 'index': 章节序号, 'title': 章节标题}
+        {'type': 'item', 'index': 章节序号, 'item': 二级节点}
+        {'type': 'section_end', 'index': 章节序号, 'section': 章节节点}
+    """
+    
+    def __init__(self):
+        """初始化固定的3层结构和解析状态"""
+        self.structure = {
+            'title': 'Article Analysis',
+            'children': [{'title': title, 'children': []} for title in SECTION_TITLES]
+        }
+        self._sections = self.structure['children']
+        self._current = None  # 当前章节序号
+        self._buffer = ''
+        self._closed = False
+    
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        推入一段markdown文本
+        
+        Args:
+            chunk (str): 新到达的文本片段
+            
+        Returns:
+            List: 本次推入后完成的事件
+        """
+        if self._closed:
+            raise ValueError('parser is closed')
+        
+        events = []
+        data = self._buffer + chunk if self._buffer else chunk
+        start = 0
+        while True:
+            end = data.find('\n', start)
+            if end < 0:
+                break
+            self._process_line(data[start:end], events)
+            start = end + 1
+        self._buffer = data[start:]
+        return events
+    
+    def close(self) -> List[Dict[str, Any]]:
+        """
+        结束输入，处理剩余文本并补全空章节
+        
+        Returns:
+            List: 剩余的事件
+        """
+        if self._closed:
+            return []
+        
+        events = []
+        if self._buffer:
+            self._process_line(self._buffer, events)
+            self._buffer = ''
+        self._end_section(events)
+        self._closed = True
+        
+        # 确保每个一级节点至少有一些内容，如果为空则添加占位内容
+        for section in self._sections:
+            if not section['children']:
+                section['children'].append({
+                    'title': 'Content will be analyzed here - 此处将分析相关内容',
+                    'children': []
+                })
+        return events
+    
+    def _end_section(self, events: List[Dict[str, Any]]):
+        """结束当前章节并产生section_end事件"""
+        if self._current is not None:
+            events.append({
+                'type': 'section_end',
+                'index': self._current,
+                'section': self._sections[self._current]
+            })
+    
+    def _match_section(self, section_title: str) -> Optional[int]:
+        """
+        根据 ## 标题匹配固定的一级节点（结果按标题缓存）
+        
+        Args:
+            section_title (str): 标题文本
+            
+        Returns:
+            int: 一级节点序号，无法匹配时返回None
+        """
+        try:
+            return _section_lookup_cache[section_title]
+        except KeyError:
+            pass
+        
+        # 清理标题中的序号
+        title_lower = _HEADER_NUMBER_RE.sub('', section_title).lower()
+        index = None
+        
+        # 查找匹配的固定节点
+        for i, fixed_lower in enumerate(_SECTION_TITLES_LOWER):
+            if fixed_lower in title_lower or title_lower in fixed_lower:
+                index = i
+                break
+        
+        # 如果没找到匹配的，根据关键词判断
+        if index is None:
+            for keyword, i in _SECTION_KEYWORDS:
+                if keyword in title_lower:
+                    index = i
+                    break
+        
+        if len(_section_lookup_cache) < _SECTION_LOOKUP_CACHE_SIZE:
+            _section_lookup_cache[section_title] = index
+        return index
+    
+    def _process_line(self, line: str, events: List[Dict[str, Any]]):
+        """处理一行完整的markdown文本"""
+        line = line.strip()
+        if not line:
+            return
+        
+        # 一级标题 (# Article Analysis) - 忽略，使用固定标题
+        if line.startswith('# '):
+            return
+        
+        # 二级标题 (## Main Theme, ## Article Structure, etc.)
+        if line.startswith('## '):
+            self._end_section(events)
+            self._current = self._match_section(line[3:].strip())
+            if self._current is not None:
+                events.append({
+                    'type': 'section_start',
+                    'index': self._current,
+                    'title': self._sections[self._current]['title']
+                })
+            return
+        
+        # 三级标题 (### 子标题) - 在固定3层结构中忽略
+        if line.startswith('### ') or self._current is None:
+            return
+        
+        # 列表项 (- 内容 或 * 内容) - 作为二级节点
+        if line.startswith('- ') or line.startswith('* '):
+            content = line[2:].strip()
+        # 数字列表 (1. 内容) - 作为二级节点
+        else:
+            match = _NUMBERED_ITEM_RE.match(line)
+            if not match:
+                return
+            content = line[match.end():].strip()
+        
+        if content:
+            # 清理内容
+            content = _clean_content(content)
+            if content:  # 确保清理后的内容不为空
+                item = {'title': content, 'children': []}
+                self._sections[self._current]['children'].append(item)
+                events.append({'type': 'item', 'index': self._current, 'item': item})
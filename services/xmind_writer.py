@@ -0,0 +1,250 @@
+import itertools
+import json
+import time
+import uuid
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterator, List, Union
+from xml.sax.saxutils import escape
+
+# 默认画布标题
+DEFAULT_SHEET_TITLE = 'English Article Analysis'
+
+_XML_HEADER = '<?xml version="1.0" encoding="utf-8"?>'
+_CONTENT_XMLNS = (
+    'xmlns="urn:xmind:xmap:xmlns:content:2.0" '
+    'xmlns:fo="http://www.w3.org/1999/XSL/Format" '
+    'xmlns:xhtml="http://www.w3.org/1999/xhtml" '
+    'xmlns:xlink="http://www.w3.org/1999/xlink" '
+    'xmlns:svg="http://www.w3.org/2000/svg"'
+)
+_STYLES_XML = (
+    _XML_HEADER + '<xmap-styles xmlns="urn:xmind:xmap:xmlns:style:2.0" '
+    'xmlns:fo="http://www.w3.org/1999/XSL/Format" xmlns:svg="http://www.w3.org/2000/svg" version="2.0"/>'
+)
+_COMMENTS_XML = _XML_HEADER + '<comments xmlns="urn:xmind:xmap:xmlns:comments:2.0" version="2.0"/>'
+_MANIFEST_XML = (
+    _XML_HEADER + '<manifest xmlns="urn:xmind:xmap:xmlns:manifest:1.0">'
+    '<file-entry full-path="content.xml" media-type="text/xml"/>'
+    '<file-entry full-path="styles.xml" media-type="text/xml"/>'
+    '<file-entry full-path="comments.xml" media-type="text/xml"/>'
+    '<file-entry full-path="content.json" media-type="application/json"/>'
+    '<file-entry full-path="metadata.json" media-type="application/json"/>'
+    '<file-entry full-path="manifest.json" media-type="application/json"/>'
+    '<file-entry full-path="META-INF/manifest.xml" media-type="text/xml"/>'
+    '</manifest>'
+)
+_MANIFEST_JSON = json.dumps({
+    'file-entries': {
+        'content.json': {},
+        'metadata.json': {},
+        'content.xml': {},
+        'styles.xml': {},
+        'comments.xml': {}
+    }
+})
+_METADATA_JSON = json.dumps({'creator': {'name': 'English Reading Analysis', 'version': '1.0'}})
+_STATIC_ENTRIES = tuple((name, data.encode('utf-8')) for name, data in (
+    ('styles.xml', _STYLES_XML),
+    ('comments.xml', _COMMENTS_XML),
+    ('metadata.json', _METADATA_JSON),
+    ('manifest.json', _MANIFEST_JSON),
+    ('META-INF/manifest.xml', _MANIFEST_XML),
+))
+
+
+class _IdFactory:
+    """生成文件内唯一的26位主题ID：随机前缀 + 递增序号（比逐个生成uuid快）"""
+
+    def __init__(self):
+        self._prefix = uuid.uuid4().hex[:18]
+        self._count = itertools.count()
+
+    def __call__(self) -> str:
+        return f"{self._prefix}{next(self._count):08x}"
+
+
+def _notes_for(original_text: str) -> str:
+    """根节点备注：原文前200个字符"""
+    if not original_text:
+        return ''
+    preview = original_text[:200] + "..." if len(original_text) > 200 else original_text
+    return f"Original Text Preview:\n{preview}"
+
+
+def _topic_xml(node: Dict[str, Any], new_id: _IdFactory, timestamp: str, parts: List[str], notes: str = ''):
+    """序列化一个主题及其子主题为XMind 8格式（content.xml）"""
+    parts.append(f'<topic id="{new_id()}" timestamp="{timestamp}"><title>')
+    parts.append(escape(node.get('title', '')))
+    parts.append('</title>')
+    if notes:
+        parts.append(f'<notes><plain>{escape(notes)}</plain></notes>')
+    children = node.get('children') or []
+    if children:
+        parts.append('<children><topics type="attached">')
+        for child in children:
+            _topic_xml(child, new_id, timestamp, parts)
+        parts.append('</topics></children>')
+    parts.append('</topic>')
+
+
+def _topic_json(node: Dict[str, Any], new_id: _IdFactory, notes: str = '') -> Dict[str, Any]:
+    """序列化一个主题及其子主题为XMind 2020+格式（content.json）"""
+    topic = {'id': new_id(), 'class': 'topic', 'title': node.get('title', '')}
+    if notes:
+        topic['notes'] = {'plain': {'content': notes}}
+    children = node.get('children') or []
+    if children:
+        topic['children'] = {'attached': [_topic_json(child, new_id) for child in children]}
+    return topic
+
+
+def build_content_xml(structure: Dict[str, Any], original_text: str = "",
+                      sheet_title: str = DEFAULT_SHEET_TITLE) -> str:
+    """
+    生成XMind 8格式的content.xml
+
+    Args:
+        structure (Dict): 思维导图结构数据（title + children）
+        original_text (str): 原文，前200个字符作为根节点备注
+        sheet_title (str): 画布标题
+
+    Returns:
+        str: content.xml内容
+    """
+    new_id = _IdFactory()
+    timestamp = str(int(time.time() * 1000))
+    root = {'title': structure.get('title', 'Article Analysis'), 'children': structure.get('children', [])}
+    parts = [
+        _XML_HEADER,
+        f'<xmap-content {_CONTENT_XMLNS} timestamp="{timestamp}" version="2.0">',
+        f'<sheet id="{new_id()}" timestamp="{timestamp}">'
+    ]
+    _topic_xml(root, new_id, timestamp, parts, _notes_for(original_text))
+    parts.append(f'<title>{escape(sheet_title)}</title></sheet></xmap-content>')
+    return ''.join(parts)
+
+
+def build_content_json(structure: Dict[str, Any], original_text: str = "",
+                       sheet_title: str = DEFAULT_SHEET_TITLE) -> str:
+    """
+    生成XMind 2020+格式的content.json
+
+    Args:
+        structure (Dict): 思维导图结构数据（title + children）
+        original_text (str): 原文，前200个字符作为根节点备注
+        sheet_title (str): 画布标题
+
+    Returns:
+        str: content.json内容
+    """
+    new_id = _IdFactory()
+    root = {'title': structure.get('title', 'Article Analysis'), 'children': structure.get('children', [])}
+    sheet = {
+        'id': new_id(),
+        'class': 'sheet',
+        'title': sheet_title,
+        'rootTopic': _topic_json(root, new_id, _notes_for(original_text))
+    }
+    return json.dumps([sheet], ensure_ascii=False, separators=(',', ':'))
+
+
+class _ChunkSink:
+    """收集zip写出的数据块，供生成器逐块输出（不可seek，zipfile会使用数据描述符）"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _write_entries(archive: zipfile.ZipFile, structure: Dict[str, Any], original_text: str,
+                   sheet_title: str) -> Iterator[None]:
+    """依次写入各个zip条目，每写完一部分yield一次"""
+    # 主题内容压缩（最快级别），固定的小文件直接存储
+    archive.writestr('content.json', build_content_json(structure, original_text, sheet_title).encode('utf-8'),
+                     compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+    yield
+    archive.writestr('content.xml', build_content_xml(structure, original_text, sheet_title).encode('utf-8'),
+                     compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+    yield
+    for name, data in _STATIC_ENTRIES:
+        archive.writestr(name, data)
+    yield
+
+
+def write_xmind(structure: Dict[str, Any], target: Union[str, BinaryIO], original_text: str = "",
+                sheet_title: str = DEFAULT_SHEET_TITLE):
+    """
+    将3层思维导图结构直接写为.xmind文件（不经过xmind库的DOM）
+
+    文件同时包含content.json（XMind 2020+）和content.xml（XMind 8），两者的主题树一致
+
+    Args:
+        structure (Dict): 思维导图结构数据
+        target (str | BinaryIO): 文件路径，或可写的二进制文件对象（如BytesIO）
+        original_text (str): 原文，前200个字符作为根节点备注
+        sheet_title (str): 画布标题
+    """
+    with zipfile.ZipFile(target, 'w') as archive:
+        for _ in _write_entries(archive, structure, original_text, sheet_title):
+            pass
+
+
+def xmind_bytes(structure: Dict[str, Any], original_text: str = "",
+                sheet_title: str = DEFAULT_SHEET_TITLE) -> bytes:
+    """
+    生成.xmind文件内容
+
+    Args:
+        structure (Dict): 思维导图结构数据
+        original_text (str): 原文
+        sheet_title (str): 画布标题
+
+    Returns:
+        bytes: .xmind文件内容
+    """
+    sink = _ChunkSink()
+    write_xmind(structure, sink, original_text, sheet_title)
+    return sink.drain()
+
+
+def iter_xmind(structure: Dict[str, Any], original_text: str = "",
+               sheet_title: str = DEFAULT_SHEET_TITLE) -> Iterator[bytes]:
+    """
+    逐块生成.xmind文件内容，可直接作为HTTP流式响应体
+
+    Args:
+        structure (Dict): 思维导图结构数据
+        original_text (str): 原文
+        sheet_title (str): 画布标题
+
+    Yields:
+        bytes: 文件数据块
+    """
+    sink = _ChunkSink()
+    archive = zipfile.ZipFile(sink, 'w')
+    try:
+        for _ in _write_entries(archive, structure, original_text, sheet_title):
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        archive.close()
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import quote
+from flask import Response, redirect, request, send_file, stream_with_context
+from werkzeug.exceptions import NotFound
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+mimetypes.add_type('application/vnd.xmind.workbook', '.xmind')
+
+# 文件内容哈希缓存：路径 -> (文件大小, 修改时间, 哈希)
+_etag_cache = OrderedDict()
+_etag_cache_lock = threading.Lock()
+_ETAG_CACHE_SIZE = 4096
+
+
+def file_etag(path: str) -> str:
+    """
+    计算文件内容的SHA-256作为强ETag
+
+    结果按 (路径, 大小, 修改时间) 缓存，同一文件只在首次下载时读取一遍
+
+    Args:
+        path (str): 文件路径
+
+    Returns:
+        str: 十六进制哈希
+    """
+    stat = os.stat(path)
+    with _etag_cache_lock:
+        cached = _etag_cache.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            _etag_cache.move_to_end(path)
+            return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()
+
+    with _etag_cache_lock:
+        _etag_cache[path] = (stat.st_size, stat.st_mtime_ns, etag)
+        _etag_cache.move_to_end(path)
+        while len(_etag_cache) > _ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    return etag
+
+
+def _use_accel_redirect() -> bool:
+    """是否交给nginx发送文件：需要配置内部location前缀，且请求经过声明支持X-Accel-Redirect的nginx转发"""
+    return bool(Config.DOWNLOAD_ACCEL_REDIRECT) and \
+        request.headers.get('X-Sendfile-Type', '').lower() == 'x-accel-redirect'
+
+
+def _set_cache_headers(response: Response, etag: str):
+    """生成的文件写入后不再修改（文件名唯一），可长期缓存"""
+    response.set_etag(etag)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = Config.DOWNLOAD_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+
+
+def send_download(storage, key: str, download_name: str = None, mimetype: str = None,
+                  etag: str = None) -> Response:
+    """
+    发送存储中的文件
+
+    - 强ETag（内容哈希），支持 If-None-Match 返回304
+    - Cache-Control: immutable
+    - 本地存储由Flask直接发送时支持Range/If-Range，WSGI服务器提供 file_wrapper 时使用sendfile；
+      X-Accel-Redirect模式下只返回响应头，文件内容和Range请求由nginx处理
+    - 对象存储重定向到预签名地址，由存储服务直接发送（含Range）
+
+    Args:
+        storage: 文件存储（services.storage.StorageBackend）
+        key (str): 存储键
+        download_name (str): 下载文件名，默认为键的最后一段
+        mimetype (str): MIME类型，默认按文件名推断
+        etag (str): 内容哈希，为空时本地文件计算SHA-256，对象存储使用存储的ETag
+
+    Returns:
+        Response: 下载响应
+    """
+    stored = storage.stat(key)
+    if stored is None:
+        raise NotFound()
+
+    download_name = download_name or key.rsplit('/', 1)[-1]
+    mimetype = mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    path = storage.local_path(key)
+    etag = etag or (file_etag(path) if path else stored.etag)
+
+    if path and not _use_accel_redirect():
+        response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name,
+                             etag=etag, conditional=True, max_age=Config.DOWNLOAD_CACHE_MAX_AGE)
+        response.accept_ranges = 'bytes'
+        _set_cache_headers(response, etag)
+        return response
+
+    # 条件请求在这里处理，不必再转给nginx或对象存储
+    if etag and etag in request.if_none_match:
+        response = Response(status=304)
+        _set_cache_headers(response, etag)
+        return response
+
+    if path:
+        response = Response(status=200)
+        response.headers['X-Accel-Redirect'] = Config.DOWNLOAD_ACCEL_REDIRECT.rstrip('/') + '/' + quote(key)
+    else:
+        url = storage.url(key, download_name)
+        if url:
+            # 预签名地址会过期，重定向本身不缓存
+            response = redirect(url, code=302)
+            response.cache_control.no_store = True
+            return response
+        response = Response(stream_with_context(_iter_object(storage, key)), status=200, direct_passthrough=True)
+        response.content_length = stored.size
+
+    response.headers['Content-Type'] = mimetype
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+    if etag:
+        _set_cache_headers(response, etag)
+    return response
+
+
+def _iter_object(storage, key: str, chunk_size: int = 64 * 1024):
+    """逐块读取存储对象"""
+    body = storage.open(key)
+    try:
+        for chunk in iter(lambda: body.read(chunk_size), b''):
+            yield chunk
+    finally:
+        body.close()
+
+
+def clear_etag_cache(path: Optional[str] = None):
+    """清除文件哈希缓存（删除文件后调用）"""
+    with _etag_cache_lock:
+        if path is None:
+            _etag_cache.clear()
+        else:
+            _etag_cache.pop(path, None)
@@ -36,6 +36,18 @@ def generate_file_hash(content: str) -> str:
     """
     return hashlib.md5(content.encode('utf-8')).hexdigest()
 
+def normalize_text(text: str) -> str:
+    """
+    规范化文本，用于内容寻址（去除首尾空白并合并连续空白）
+    
+    Args:
+        text (str): 原始文本
+        
+    Returns:
+        str: 规范化后的文本
+    """
+    return ' '.join(text.split())
+
 def validate_text_content(text: str) -> tuple[bool, Optional[str]]:
     """
     验证文本内容是否适合分析
@@ -68,39 +80,6 @@ def validate_text_content(text: str) -> tuple[bool, Optional[str]]:
     
     return True, None
 
-def clean_upload_folder(upload_folder: str, max_age_hours: int = 24):
-    """
-    清理上传文件夹中的旧文件
-    
-    Args:
-        upload_folder (str): 上传文件夹路径
-        max_age_hours (int): 文件最大保留时间（小时）
-    """
-    try:
-        if not os.path.exists(upload_folder):
-            return
-        
-        current_time = datetime.now()
-        
-        for filename in os.listdir(upload_folder):
-            file_path = os.path.join(upload_folder, filename)
-            
-            if os.path.isfile(file_path):
-                # 获取文件修改时间
-                file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                age_hours = (current_time - file_time).total_seconds() / 3600
-                
-                # 删除超过指定时间的文件
-                if age_hours > max_age_hours:
-                    try:
-                        os.remove(file_path)
-                        print(f"删除旧文件: {filename}")
-                    except OSError:
-                        pass  # 忽略删除失败的情况
-                        
-    except Exception as e:
-        print(f"清理上传文件夹失败: {str(e)}")
-
 def extract_text_preview(text: str, max_length: int = 200) -> str:
     """
     提取文本预览
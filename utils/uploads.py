@@ -0,0 +1,40 @@
+import tempfile
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+from config import Config
+
+
+class FileTooLarge(RequestEntityTooLarge):
+    """单个上传文件超过大小上限"""
+    description = '上传文件过大'
+
+
+class _LimitedSpooledFile(tempfile.SpooledTemporaryFile):
+    """
+    上传文件的接收缓冲：小文件保存在内存中，超过阈值后转存到临时文件；
+    写入的总字节数超过上限时立即中止接收
+    """
+
+    def __init__(self, max_size: int, max_bytes: int):
+        super().__init__(max_size=max_size, mode='w+b')
+        self._max_bytes = max_bytes
+        self._written = 0
+
+    def write(self, data):
+        self._written += len(data)
+        if self._max_bytes and self._written > self._max_bytes:
+            raise FileTooLarge()
+        return super().write(data)
+
+
+class UploadRequest(Request):
+    """
+    流式接收上传文件的请求类
+
+    multipart表单中的文件在解析时按块写入 _LimitedSpooledFile，
+    超过 UPLOAD_SPOOL_THRESHOLD 的部分落盘，超过 UPLOAD_MAX_FILE_SIZE 时中止解析并返回413，
+    不会把整个上传文件读入内存
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return _LimitedSpooledFile(Config.UPLOAD_SPOOL_THRESHOLD, Config.UPLOAD_MAX_FILE_SIZE)
@@ -0,0 +1,13 @@
+"""
+生产环境WSGI入口
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+后台线程（异步任务worker、上传目录清理）不能跨进程fork，这里不启动，
+由gunicorn的post_fork钩子在每个worker进程中启动；使用其他WSGI服务器时，
+需要在处理请求的进程中调用 services.lifecycle.start_background_services(application)
+"""
+from app import create_app
+
+application = create_app(start_background=False)
+app = application